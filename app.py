@@ -1,7 +1,23 @@
-from flask import Flask, request, jsonify, send_from_directory, make_response
+from flask import Flask, request, jsonify, send_from_directory, send_file, make_response
+from werkzeug.security import safe_join
+from backend.metrics import Metrics
+from backend.profiling import RequestProfiler, add_timing, phase
 import sqlite3
 import os
+import posixpath
+import re
+import gzip
+import hashlib
+import mimetypes
 import json
+import base64
+import atexit
+import threading
+import time
+import queue
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
 
 BASE_DIR = os.path.dirname(__file__)
@@ -15,10 +31,147 @@ else:
     FRONTEND_DIR = os.path.abspath(os.path.join(BASE_DIR, '..'))
 # Allow overriding DB path via environment for Cloud Run / container usage
 DB_PATH = os.environ.get('VISITS_DB') or os.path.join(BASE_DIR, 'visits.db')
+# SQLite tuning (override via env): page cache in KiB, mmap window in bytes,
+# how long a writer waits for the lock before failing with 'database is locked'
+DB_CACHE_KB = int(os.environ.get('VISITS_DB_CACHE_KB') or 16384)
+DB_MMAP_BYTES = int(os.environ.get('VISITS_DB_MMAP_BYTES') or 128 * 1024 * 1024)
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('VISITS_DB_BUSY_TIMEOUT_MS') or 10000)
+DB_STATEMENT_CACHE = int(os.environ.get('VISITS_DB_STATEMENT_CACHE') or 256)
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+# Prometheus-style counters for GET /metrics (see backend/metrics.py)
+METRICS = Metrics('visits')
+METRICS.histogram('sqlite_query_seconds', 'SQLite statement execute time, by statement type.')
+METRICS.histogram('sqlite_lock_wait_seconds', 'Time spent in BEGIN IMMEDIATE waiting for the write lock.')
+METRICS.counter('export_bytes_total', 'Bytes streamed by /api/visits/export, by content encoding.')
+METRICS.histogram('visits_group_commit_size', 'Saves committed per group-commit transaction.', buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+
+
+class TimedCursor(sqlite3.Cursor):
+    # execute() time per statement type; BEGIN is where writers queue for the lock
+    def execute(self, sql, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            _record_query(sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            _record_query(sql, time.perf_counter() - t0)
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # the C shortcuts don't go through cursor()
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+
+def _record_query(sql, elapsed):
+    add_timing('db', elapsed)
+    op = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+    if op == 'BEGIN':
+        METRICS.observe('sqlite_lock_wait_seconds', elapsed)
+    else:
+        METRICS.observe('sqlite_query_seconds', elapsed, {'op': op})
+
+
+# Per-thread connections: each gunicorn thread opens the DB once and keeps it,
+# so the pragmas and the prepared-statement cache survive across requests.
+_db_local = threading.local()
+_db_connections = set()
+_db_connections_lock = threading.Lock()
+
+
+def open_db(path=None):
+    """Open a tuned connection: WAL journal, synchronous=NORMAL, sized page cache,
+    mmap and busy timeout. isolation_level=None so transactions are explicit
+    (see db_transaction)."""
+    conn = sqlite3.connect(path or DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000.0, isolation_level=None,
+                           check_same_thread=False, cached_statements=DB_STATEMENT_CACHE, factory=TimedConnection)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{DB_CACHE_KB}')
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_BYTES}')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    # compressed payload BLOBs -> JSON text for the JSON1 queries (see payload_sql)
+    conn.create_function('payload_text', 1, lambda value: unpack_payload(value, path or DB_PATH), deterministic=True)
+    return conn
+
+
+def get_db(path=None):
+    """Return this thread's connection to DB_PATH (or `path`), opening it on first use."""
+    path = path or DB_PATH
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None and _db_local.path == path:
+        return conn
+    if conn is not None:
+        # DB_PATH changed (tests, admin tooling): drop the stale connection
+        _close_db(conn)
+    conn = open_db(path)
+    _db_local.conn = conn
+    _db_local.path = path
+    with _db_connections_lock:
+        _db_connections.add(conn)
+    return conn
+
+
+def _close_db(conn):
+    with _db_connections_lock:
+        _db_connections.discard(conn)
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def close_db_connections():
+    """Close every connection opened by this process (gunicorn worker_exit / atexit)."""
+    with _db_connections_lock:
+        conns = list(_db_connections)
+        _db_connections.clear()
+    for conn in conns:
+        try:
+            conn.close()
+        except Exception:
+            pass
+    _db_local.__dict__.clear()
+
+
+atexit.register(close_db_connections)
+
+
+@contextmanager
+def db_transaction(write=True):
+    """Write transaction on this thread's connection.
+    BEGIN IMMEDIATE takes the write lock up front (waiting up to the busy timeout)
+    instead of upgrading a read lock mid-transaction, which under WAL fails
+    immediately with 'database is locked'. write=False is a plain (deferred)
+    BEGIN: one consistent read snapshot that never blocks writers."""
+    conn = get_db()
+    conn.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        if conn.in_transaction:  # a failed COMMIT leaves the transaction open
+            conn.rollback()
+        raise
+
+
+def _migrate_baseline(cur):
+    """v1: everything init_db used to create with IF NOT EXISTS / ALTER TABLE.
+    Idempotent, because unversioned DBs (user_version 0) can be in any
+    earlier state. Returns the backfills to queue."""
     cur.execute('''
         CREATE TABLE IF NOT EXISTS visits (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -28,27 +181,1073 @@ def init_db():
             payload TEXT
         )
     ''')
-    conn.commit()
-    conn.close()
+    # denormalized filter columns (first visit's school/region/location) so the
+    # list/export filters can run as indexed SQL instead of parsing every payload
+    existing_cols = set(r[1] for r in cur.execute('PRAGMA table_info(visits)').fetchall())
+    needs_backfill = False
+    for col in ('school', 'region', 'location'):
+        if col not in existing_cols:
+            cur.execute(f'ALTER TABLE visits ADD COLUMN {col} TEXT')
+            needs_backfill = True
+    # one row per subject entry across all visits of a record
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS visit_subjects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            record_id INTEGER NOT NULL,
+            subject TEXT,
+            teacher TEXT,
+            publisher TEXT,
+            conversation TEXT,
+            follow_up TEXT
+        )
+    ''')
+    existing_cols = set(r[1] for r in cur.execute('PRAGMA table_info(visit_subjects)').fetchall())
+    for col in ('conversation', 'follow_up'):
+        if col not in existing_cols:
+            cur.execute(f'ALTER TABLE visit_subjects ADD COLUMN {col} TEXT')
+            needs_backfill = True
+    # Full-text search: memo text per subject entry (external content over
+    # visit_subjects, kept in sync by triggers) and a trigram index over the
+    # school names of each record for partial Korean matches.
+    existing_tables = set(r[0] for r in cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall())
+    new_text_fts = 'visit_text_fts' not in existing_tables
+    if new_text_fts or 'visit_school_fts' not in existing_tables:
+        needs_backfill = True
+    cur.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS visit_text_fts USING fts5(
+            conversation, follow_up, teacher, publisher,
+            content='visit_subjects', content_rowid='id', tokenize='unicode61'
+        )
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS visit_subjects_fts_ai AFTER INSERT ON visit_subjects BEGIN
+            INSERT INTO visit_text_fts(rowid, conversation, follow_up, teacher, publisher)
+            VALUES (new.id, new.conversation, new.follow_up, new.teacher, new.publisher);
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS visit_subjects_fts_ad AFTER DELETE ON visit_subjects BEGIN
+            INSERT INTO visit_text_fts(visit_text_fts, rowid, conversation, follow_up, teacher, publisher)
+            VALUES ('delete', old.id, old.conversation, old.follow_up, old.teacher, old.publisher);
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS visit_subjects_fts_au AFTER UPDATE ON visit_subjects BEGIN
+            INSERT INTO visit_text_fts(visit_text_fts, rowid, conversation, follow_up, teacher, publisher)
+            VALUES ('delete', old.id, old.conversation, old.follow_up, old.teacher, old.publisher);
+            INSERT INTO visit_text_fts(rowid, conversation, follow_up, teacher, publisher)
+            VALUES (new.id, new.conversation, new.follow_up, new.teacher, new.publisher);
+        END
+    ''')
+    # rowid = visits.id, schools = every visit's school joined by newlines
+    cur.execute("CREATE VIRTUAL TABLE IF NOT EXISTS visit_school_fts USING fts5(schools, tokenize='trigram')")
+    # upsert keys for save_visits: staff + visit_date + school of every record
+    if 'visit_schools' not in existing_tables:
+        needs_backfill = True
+    _create_visit_schools(cur)
+    # append-only SSE event log shared by all gunicorn workers (see EventTail)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TEXT
+        )
+    ''')
+    # write-time rollups (see apply_rollups); new tables are filled from existing payloads below
+    needs_rollups = 'rollup_visits' not in existing_tables or 'rollup_subjects' not in existing_tables
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_visits (
+            visit_date TEXT NOT NULL,
+            staff TEXT NOT NULL,
+            school TEXT NOT NULL,
+            region TEXT NOT NULL,
+            visits INTEGER NOT NULL,
+            minutes INTEGER NOT NULL,
+            PRIMARY KEY (visit_date, staff, school, region)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_subjects (
+            visit_date TEXT NOT NULL,
+            staff TEXT NOT NULL,
+            school TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            visits INTEGER NOT NULL,
+            PRIMARY KEY (visit_date, staff, school, subject)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_rollup_visits_staff ON rollup_visits(staff, visit_date)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_rollup_subjects_subject ON rollup_subjects(subject, visit_date)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_visits_staff_date ON visits(staff, visit_date)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_visits_visit_date ON visits(visit_date)')
+    # keyset pagination for sort=visit_date (plain and per-staff)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_visits_sort_date ON visits(coalesce(visit_date, ''), id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_visits_staff_sort_date ON visits(staff, coalesce(visit_date, ''), id)")
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_visits_school ON visits(school)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_visits_region ON visits(region)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_visits_location ON visits(location)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_visit_subjects_record ON visit_subjects(record_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_visit_subjects_subject ON visit_subjects(subject, record_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_visit_subjects_teacher ON visit_subjects(teacher, record_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_visit_subjects_publisher ON visit_subjects(publisher, record_id)')
+    if new_text_fts:
+        # index whatever visit_subjects already holds, so the delete triggers
+        # never hit rows the external-content index hasn't seen
+        cur.execute("INSERT INTO visit_text_fts(visit_text_fts) VALUES ('rebuild')")
+    backfills = []
+    if cur.execute('SELECT 1 FROM visits LIMIT 1').fetchone():
+        if needs_backfill:
+            # existing DB without the new columns/indexes: filled from stored payloads
+            backfills.append('visit_index')
+        if needs_rollups:
+            backfills.append('rollups')
+    return backfills
 
-app = Flask(__name__, static_folder=FRONTEND_DIR, static_url_path='')
-app.config['JSON_AS_ASCII'] = False
-init_db()
 
-# Simple SSE broadcaster
-from queue import Queue
-_sse_clients = []
+def _migrate_payload_dicts(cur):
+    """v2: zstd dictionaries for compressed payloads (see pack_payload)."""
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS payload_dicts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dict BLOB NOT NULL,
+            samples INTEGER,
+            created_at TEXT
+        )
+    ''')
+    return []
+
 
-def sse_broadcast(event_name, data):
-    payload = f"event: {event_name}\n"
-    payload += f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
-    # push to client queues (non-blocking)
-    for q in list(_sse_clients):
+def _create_visit_schools(cur):
+    # no UNIQUE key: every record keeps its own keys and upsert_visit takes the newest owner
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS visit_schools (
+            record_id INTEGER NOT NULL,
+            staff TEXT NOT NULL,
+            visit_date TEXT NOT NULL,
+            school TEXT NOT NULL
+        )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_visit_schools_key ON visit_schools(staff, visit_date, school, record_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_visit_schools_record ON visit_schools(record_id)')
+
+
+def _migrate_school_owners(cur):
+    """v3: visit_schools without UNIQUE (staff, visit_date, school). A key used
+    to move to whichever record saved the school last, so when that record later
+    dropped the school the key vanished although older records still listed it.
+    Schema only: a table created with the constraint is replaced by an empty
+    one, and the 'school_keys' backfill refills it in chunks."""
+    sql = cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'visit_schools'").fetchone()
+    if sql and 'UNIQUE' not in sql[0].upper():
+        return []
+    cur.execute('DROP TABLE IF EXISTS visit_schools')
+    _create_visit_schools(cur)
+    return ['school_keys'] if cur.execute('SELECT 1 FROM visits LIMIT 1').fetchone() else []
+
+
+# Versioned migrations, applied in order by migrate() under a cross-process
+# file lock; PRAGMA user_version records the last one applied. Each entry is
+# (version, description, fn(cur) -> [backfill names]); schema changes run in
+# one transaction with the version bump, row backfills run afterwards in
+# small resumable chunks (see run_backfills).
+MIGRATIONS = [
+    (1, 'baseline: filter columns, subjects, FTS, upsert keys, events, rollups', _migrate_baseline),
+    (2, 'payload_dicts for zstd-compressed payloads', _migrate_payload_dicts),
+    (3, 'visit_schools: one key per owning record', _migrate_school_owners),
+]
+# Backfill chunks: rows per write transaction, pause between chunks so
+# save_visits gets the write lock in between
+BACKFILL_CHUNK_ROWS = int(os.environ.get('VISITS_BACKFILL_CHUNK_ROWS') or 500)
+BACKFILL_PAUSE_S = float(os.environ.get('VISITS_BACKFILL_PAUSE_S') or 0.05)
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """Exclusive advisory lock on `path` (fcntl, or msvcrt on Windows).
+    Yields True when held; with blocking=False yields False if another process has it."""
+    f = open(path, 'a+')
+    held = False
+    try:
+        try:
+            import fcntl
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                held = True
+            except BlockingIOError:
+                held = False
+        except ImportError:
+            import msvcrt
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    held = True
+                    break
+                except OSError:
+                    if not blocking:
+                        break
+                    time.sleep(0.1)
+        yield held
+    finally:
+        f.close()  # closing the handle releases the lock
+
+
+def schema_version(cur):
+    return cur.execute('PRAGMA user_version').fetchone()[0]
+
+
+def pending_migrations(cur):
+    current = schema_version(cur)
+    return [m for m in MIGRATIONS if m[0] > current]
+
+
+def _ensure_backfill_table(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS schema_backfills (
+            name TEXT PRIMARY KEY,
+            position INTEGER,
+            done INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        )
+    ''')
+
+
+def migrate(path=None, log=None):
+    """Apply pending MIGRATIONS. Safe to call from every worker at startup:
+    the first one through the lock does the work, the rest find nothing to do.
+    Returns the versions applied."""
+    path = path or DB_PATH
+    applied = []
+    with file_lock(path + '.migrate.lock'):
+        conn = open_db(path)
+        try:
+            cur = conn.cursor()
+            current = schema_version(cur)
+            if current > MIGRATIONS[-1][0] and log:
+                log(f'visits.db is at schema v{current}, newer than this code (v{MIGRATIONS[-1][0]})')
+            for version, description, fn in MIGRATIONS:
+                if version <= current:
+                    continue
+                t0 = time.perf_counter()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    _ensure_backfill_table(cur)
+                    for name in fn(cur) or []:
+                        # restart from scratch even if an older run of this backfill finished
+                        cur.execute('INSERT OR REPLACE INTO schema_backfills (name, position, done, updated_at) VALUES (?, NULL, 0, ?)',
+                                    (name, datetime.utcnow().isoformat()))
+                    cur.execute(f'PRAGMA user_version = {int(version)}')
+                except BaseException:
+                    conn.rollback()
+                    raise
+                conn.commit()
+                applied.append(version)
+                if log:
+                    log(f'migrated to v{version} ({description}) in {time.perf_counter() - t0:.2f}s')
+        finally:
+            conn.close()
+    return applied
+
+
+def init_db():
+    migrate()
+
+
+# Stored payload compression (optional, needs the `zstandard` package).
+# TEXT payloads are plain JSON. BLOB payloads are PAYLOAD_MAGIC + 4-byte dict id
+# + a zstd frame compressed with that payload_dicts row (id 0: no dictionary).
+# New writes are compressed when VISITS_PAYLOAD_COMPRESSION=zstd, with the
+# newest dictionary; scripts/compress_payloads.py trains dictionaries and
+# converts existing rows. Reads accept both formats.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+PAYLOAD_COMPRESSION = (os.environ.get('VISITS_PAYLOAD_COMPRESSION') or '').lower()
+PAYLOAD_ZSTD_LEVEL = int(os.environ.get('VISITS_PAYLOAD_ZSTD_LEVEL') or 3)
+PAYLOAD_MAGIC = b'\x00zd1'  # a NUL first byte is never JSON text
+_payload_dicts = {}
+_payload_dicts_lock = threading.Lock()
+_zstd_local = threading.local()
+
+
+def _payload_codec(path, dict_id):
+    """This thread's (compressor, decompressor) for a dictionary of the DB at path."""
+    codecs = getattr(_zstd_local, 'codecs', None)
+    if codecs is None:
+        codecs = _zstd_local.codecs = {}
+    codec = codecs.get((path, dict_id))
+    if codec is not None:
+        return codec
+    if zstandard is None:
+        raise RuntimeError('the zstandard package is required for compressed payloads')
+    if dict_id:
+        with _payload_dicts_lock:
+            data = _payload_dicts.get((path, dict_id))
+        if data is None:
+            # own connection: this may run inside a SQL function on the shared one
+            conn = sqlite3.connect(path)
+            try:
+                row = conn.execute('SELECT dict FROM payload_dicts WHERE id = ?', (dict_id,)).fetchone()
+            finally:
+                conn.close()
+            if row is None:
+                raise RuntimeError(f'payload dictionary {dict_id} not found')
+            data = zstandard.ZstdCompressionDict(bytes(row[0]))
+            with _payload_dicts_lock:
+                _payload_dicts[(path, dict_id)] = data
+        codec = (zstandard.ZstdCompressor(level=PAYLOAD_ZSTD_LEVEL, dict_data=data),
+                 zstandard.ZstdDecompressor(dict_data=data))
+    else:
+        codec = (zstandard.ZstdCompressor(level=PAYLOAD_ZSTD_LEVEL), zstandard.ZstdDecompressor())
+    codecs[(path, dict_id)] = codec
+    return codec
+
+
+def active_payload_dict(cur):
+    row = cur.execute('SELECT max(id) FROM payload_dicts').fetchone()
+    return row[0] or 0
+
+
+def pack_payload(cur, text, dict_id=None, compress=None):
+    """Stored form of a payload's JSON text: compressed with the newest (or the
+    given) dictionary when compression is on, else the text itself."""
+    if compress is None:
+        compress = PAYLOAD_COMPRESSION == 'zstd' and zstandard is not None
+    if not compress or text is None:
+        return text
+    if dict_id is None:
+        dict_id = active_payload_dict(cur)
+    frame = _payload_codec(DB_PATH, dict_id)[0].compress(text.encode('utf-8'))
+    return PAYLOAD_MAGIC + dict_id.to_bytes(4, 'little') + frame
+
+
+def unpack_payload(value, path=None):
+    """JSON text of a stored payload, whichever format it was stored in."""
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if not value.startswith(PAYLOAD_MAGIC):
+        return value.decode('utf-8', 'replace')
+    dict_id = int.from_bytes(value[len(PAYLOAD_MAGIC):len(PAYLOAD_MAGIC) + 4], 'little')
+    return _payload_codec(path or DB_PATH, dict_id)[1].decompress(value[len(PAYLOAD_MAGIC) + 4:]).decode('utf-8')
+
+
+def payload_sql(column='payload'):
+    """SQL for a payload column as JSON text; TEXT rows skip the Python call."""
+    return f"CASE WHEN typeof({column}) = 'blob' THEN payload_text({column}) ELSE {column} END"
+
+
+def train_payload_dict(sample_rows=5000, dict_bytes=64 * 1024):
+    """Train a zstd dictionary on the newest payloads and store it; it becomes
+    the dictionary new writes and repack_payloads() use. Returns its id."""
+    if zstandard is None:
+        raise RuntimeError('the zstandard package is required for compressed payloads')
+    rows = get_db().execute('SELECT payload FROM visits ORDER BY id DESC LIMIT ?', (sample_rows,)).fetchall()
+    samples = [unpack_payload(r[0]).encode('utf-8') for r in rows if r[0]]
+    data = zstandard.train_dictionary(dict_bytes, samples)
+    with db_transaction() as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT INTO payload_dicts (dict, samples, created_at) VALUES (?, ?, ?)',
+                    (data.as_bytes(), len(samples), datetime.utcnow().isoformat()))
+        return cur.lastrowid
+
+
+def repack_payloads(compress=True, dict_id=None, chunk_rows=None, pause_s=None, log=None):
+    """Rewrite stored payloads in chunks of short write transactions: compressed
+    with dict_id (default: the newest) or, with compress=False, back to text.
+    Rows already in that form are skipped, and text that isn't valid JSON is
+    left as text. Returns the number of rows rewritten."""
+    chunk_rows = chunk_rows or BACKFILL_CHUNK_ROWS
+    pause_s = BACKFILL_PAUSE_S if pause_s is None else pause_s
+    if compress:
+        if dict_id is None:
+            dict_id = active_payload_dict(get_db().cursor())
+        where = "((typeof(payload) = 'text' AND json_valid(payload)) OR (typeof(payload) = 'blob' AND substr(payload, 1, ?) != ?))"
+        where_params = [len(PAYLOAD_MAGIC) + 4, PAYLOAD_MAGIC + dict_id.to_bytes(4, 'little')]
+    else:
+        where, where_params = "typeof(payload) = 'blob'", []
+    position, done = 0, 0
+    while True:
+        with db_transaction() as conn:
+            cur = conn.cursor()
+            rows = cur.execute('SELECT id, payload FROM visits WHERE id > ? AND ' + where + ' ORDER BY id LIMIT ?',
+                               [position] + where_params + [chunk_rows]).fetchall()
+            if not rows:
+                return done
+            cur.executemany('UPDATE visits SET payload = ? WHERE id = ?',
+                            [(pack_payload(cur, unpack_payload(stored), dict_id, compress), rid) for rid, stored in rows])
+        position = rows[-1][0]
+        done += len(rows)
+        if log:
+            log(f'{done} payload(s) rewritten (at id {position})')
+        if pause_s:
+            time.sleep(pause_s)
+
+
+# Snapshots: consistent read-only copies of visits.db, made with the backup API
+# so exports and analysis can read a fixed state instead of the live DB. The
+# copy runs SNAPSHOT_PAGES pages per step with a pause in between; under WAL
+# the source is only read, so saves are never blocked. Every write to the live
+# DB restarts a stepped copy, so after SNAPSHOT_MAX_RESTARTS restarts the copy
+# is done in a single step (one read transaction, still no write lock).
+# Files are written under a temp name and renamed when complete, and the
+# newest SNAPSHOT_KEEP are kept. SNAPSHOT_INTERVAL_S > 0 takes one periodically.
+SNAPSHOT_DIR = os.environ.get('VISITS_SNAPSHOT_DIR')
+SNAPSHOT_INTERVAL_S = float(os.environ.get('VISITS_SNAPSHOT_INTERVAL_S') or 0)
+SNAPSHOT_PAGES = int(os.environ.get('VISITS_SNAPSHOT_PAGES') or 1024)
+SNAPSHOT_STEP_PAUSE_S = float(os.environ.get('VISITS_SNAPSHOT_STEP_PAUSE_S') or 0.005)
+SNAPSHOT_MAX_RESTARTS = 3
+SNAPSHOT_KEEP = int(os.environ.get('VISITS_SNAPSHOT_KEEP') or 2)
+
+
+class _SnapshotRestarted(Exception):
+    pass
+
+
+def snapshot_dir():
+    return SNAPSHOT_DIR or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), 'snapshots')
+
+
+def list_snapshots():
+    """Complete snapshots of DB_PATH, newest first."""
+    prefix = os.path.splitext(os.path.basename(DB_PATH))[0] + '-'
+    try:
+        names = [n for n in os.listdir(snapshot_dir()) if n.startswith(prefix) and n.endswith('.db')]
+    except OSError:
+        return []
+    return [os.path.join(snapshot_dir(), n) for n in sorted(names, reverse=True)]
+
+
+def latest_snapshot():
+    """(path, age in seconds) of the newest snapshot, or (None, None)."""
+    for path in list_snapshots():
+        try:
+            return path, max(0.0, time.time() - os.path.getmtime(path))
+        except OSError:
+            continue
+    return None, None
+
+
+def take_snapshot(pages=None, pause_s=None, log=None):
+    """Copy DB_PATH into a new snapshot file. Returns its path."""
+    pages = pages or SNAPSHOT_PAGES
+    pause_s = SNAPSHOT_STEP_PAUSE_S if pause_s is None else pause_s
+    os.makedirs(snapshot_dir(), exist_ok=True)
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    path = os.path.join(snapshot_dir(), f'{os.path.splitext(os.path.basename(DB_PATH))[0]}-{stamp}.db')
+    tmp = path + '.tmp'
+    t0 = time.perf_counter()
+    src = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000.0)
+    try:
+        restarts = [0, None]
+
+        def progress(status, remaining, total):
+            # remaining going back up means a write restarted the copy
+            if restarts[1] is not None and remaining > restarts[1]:
+                restarts[0] += 1
+                if restarts[0] > SNAPSHOT_MAX_RESTARTS:
+                    raise _SnapshotRestarted()
+            restarts[1] = remaining
+
+        for step_pages in (pages, -1):
+            dst = sqlite3.connect(tmp)
+            try:
+                src.backup(dst, pages=step_pages, progress=progress if step_pages > 0 else None, sleep=pause_s)
+                # a self-contained file: readers open it immutable, without -wal/-shm
+                dst.execute('PRAGMA journal_mode=DELETE')
+                break
+            except _SnapshotRestarted:
+                if log:
+                    log(f'snapshot restarted {restarts[0]} times by writes, copying in one step')
+            finally:
+                dst.close()
+    finally:
+        src.close()
+    os.replace(tmp, path)
+    for old in list_snapshots()[SNAPSHOT_KEEP:]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+    if log:
+        log(f'snapshot {path} ({os.path.getsize(path) / 1e6:.1f} MB) in {time.perf_counter() - t0:.2f}s')
+    return path
+
+
+def open_snapshot(path):
+    """Read-only connection to a snapshot file (immutable: no locking at all)."""
+    conn = sqlite3.connect(f'file:{path}?mode=ro&immutable=1', uri=True, check_same_thread=False,
+                           isolation_level=None, factory=TimedConnection)
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.create_function('payload_text', 1, lambda value: unpack_payload(value, path), deterministic=True)
+    return conn
+
+
+class SnapshotWorker(threading.Thread):
+    """Takes a snapshot every SNAPSHOT_INTERVAL_S. Every gunicorn worker runs
+    one; the file lock and the age of the newest snapshot make sure only one
+    of them copies per interval."""
+
+    def __init__(self, interval_s=None):
+        super().__init__(name='visits-snapshot', daemon=True)
+        self.interval_s = interval_s or SNAPSHOT_INTERVAL_S
+
+    def run(self):
+        while True:
+            try:
+                _, age = latest_snapshot()
+                if age is None or age >= self.interval_s:
+                    with file_lock(DB_PATH + '.snapshot.lock', blocking=False) as held:
+                        _, age = latest_snapshot()
+                        if held and (age is None or age >= self.interval_s):
+                            app.logger.info('snapshot taken: %s', take_snapshot(log=app.logger.info))
+                        _, age = latest_snapshot()
+            except Exception as e:
+                app.logger.warning('snapshot failed: %s', e)
+                age = None
+            time.sleep(max(1.0, self.interval_s - (age or 0)))
+
+
+def _index_text(v):
+    # normalize a payload value for the denormalized columns (None stays NULL)
+    if v is None:
+        return None
+    return v if isinstance(v, str) else str(v)
+
+
+def extract_index_fields(payload):
+    """Extract the filterable fields from a visit payload.
+    Returns (school, region, location, schools, subjects): the first three come
+    from the first visit (same rule the filters always used), schools lists every
+    visit's school and subjects is a list of
+    (subject, teacher, publisher, conversation, follow_up) tuples across all visits.
+    """
+    school = region = location = None
+    schools = []
+    subjects = []
+    visits = payload.get('visits') if isinstance(payload, dict) else None
+    if not isinstance(visits, list):
+        return school, region, location, schools, subjects
+    if visits and isinstance(visits[0], dict):
+        school = _index_text(visits[0].get('school'))
+        region = _index_text(visits[0].get('region'))
+        location = _index_text(visits[0].get('location'))
+    for v in visits:
+        if not isinstance(v, dict):
+            continue
+        if v.get('school'):
+            schools.append(_index_text(v.get('school')))
+        for s in (v.get('subjects') or []):
+            if isinstance(s, dict):
+                subjects.append((_index_text(s.get('subject')), _index_text(s.get('teacher')), _index_text(s.get('publisher')),
+                                 _index_text(s.get('conversation')), _index_text(s.get('followUp'))))
+            else:
+                subjects.append((str(s), None, None, None, None))
+    return school, region, location, schools, subjects
+
+
+def write_visit_index(cur, rid, payload, fields=None, new_record=False):
+    """Refresh the denormalized columns, visit_subjects rows and search indexes
+    for one record. visit_text_fts follows visit_subjects through triggers.
+    new_record: the row was just inserted with its columns already set, so there
+    is nothing to update or clear."""
+    school, region, location, schools, subjects = fields or extract_index_fields(payload)
+    if not new_record:
+        cur.execute('UPDATE visits SET school = ?, region = ?, location = ? WHERE id = ?', (school, region, location, rid))
+        cur.execute('DELETE FROM visit_subjects WHERE record_id = ?', (rid,))
+        cur.execute('DELETE FROM visit_school_fts WHERE rowid = ?', (rid,))
+        cur.execute('DELETE FROM visit_schools WHERE record_id = ?', (rid,))
+    if subjects:
+        cur.executemany('INSERT INTO visit_subjects (record_id, subject, teacher, publisher, conversation, follow_up) VALUES (?,?,?,?,?,?)',
+                        [(rid,) + subj for subj in subjects])
+    if schools:
+        cur.execute('INSERT INTO visit_school_fts (rowid, schools) VALUES (?, ?)', (rid, '\n'.join(schools)))
+    # upsert keys: every record holding a school keeps its own key, and
+    # upsert_visit picks the newest owner, so dropping a school here leaves
+    # older records that still list it matchable
+    keys = school_keys(schools)
+    if keys:
+        cur.executemany(
+            "INSERT INTO visit_schools (record_id, staff, visit_date, school) "
+            "SELECT id, staff, visit_date, ? FROM visits WHERE id = ? AND staff != '' AND visit_date != ''",
+            [(k, rid) for k in keys])
+
+
+def school_keys(schools):
+    """Normalized school names used as the staff/date/school upsert key."""
+    keys = set()
+    for school in schools or []:
         try:
-            q.put(payload, block=False)
+            k = str(school).strip()
         except Exception:
-            try: _sse_clients.remove(q)
-            except Exception: pass
+            continue
+        if k:
+            keys.add(k)
+    return keys
+
+
+# Write-time rollups: per day x staff x school (x region) visit counts and
+# minutes, and per day x staff x school x subject counts. Every write path
+# subtracts a record's old contribution and adds the new one in the same
+# transaction, so the tables always match the stored payloads.
+# (LIMIT -1 keeps SQLite from flattening the subquery, so each payload is
+# decompressed once rather than at every reference.)
+_ROLLUP_VISIT_ROWS = """
+    SELECT coalesce(nullif(json_extract(j.value, '$.visitDate'), ''), nullif(json_extract(v.payload, '$.visitDate'), ''),
+                    v.visit_date, '') AS d,
+           coalesce(v.staff, '') AS staff,
+           coalesce(trim(json_extract(j.value, '$.school')), '') AS school,
+           coalesce(json_extract(j.value, '$.region'), '') AS region,
+           j.value AS visit
+    FROM (SELECT v.id, v.staff, v.visit_date, """ + payload_sql('v.payload') + """ AS payload
+          FROM visits v WHERE {where} LIMIT -1) v, json_each(v.payload, '$.visits') j
+    WHERE json_valid(v.payload) AND json_type(j.value) = 'object'
+"""
+# HH:MM end - start; missing or unparsable times count as 0 minutes
+_ROLLUP_MINUTES = ("max(0, coalesce(CAST(round((julianday('2000-01-01 ' || json_extract(visit, '$.visitEnd')) "
+                   "- julianday('2000-01-01 ' || json_extract(visit, '$.visitStart'))) * 1440) AS INTEGER), 0))")
+
+
+# While the 'rollups' backfill is running, only rows it has already counted
+# (id <= its position) may be adjusted; it picks up the rest as it goes.
+_ROLLUP_WATERMARK = ("v.id <= coalesce((SELECT coalesce(position, 0) FROM schema_backfills "
+                     "WHERE name = 'rollups' AND done = 0), 9223372036854775807)")
+
+
+def apply_rollups(cur, where, params, sign, respect_backfill=True):
+    """Add (sign=1) or subtract (sign=-1) the rollup contribution of the visits
+    rows matching `where` (SQL over alias v)."""
+    if respect_backfill:
+        where = f'({where}) AND {_ROLLUP_WATERMARK}'
+    src = _ROLLUP_VISIT_ROWS.format(where=where)
+    cur.execute(
+        'INSERT INTO rollup_visits (visit_date, staff, school, region, visits, minutes) '
+        'SELECT d, staff, school, region, ? * count(*), ? * sum(' + _ROLLUP_MINUTES + ') '
+        'FROM (' + src + ') WHERE 1 GROUP BY d, staff, school, region '
+        'ON CONFLICT (visit_date, staff, school, region) DO UPDATE '
+        'SET visits = visits + excluded.visits, minutes = minutes + excluded.minutes',
+        [sign, sign] + list(params))
+    cur.execute(
+        'INSERT INTO rollup_subjects (visit_date, staff, school, subject, visits) '
+        "SELECT d, staff, school, coalesce(CASE WHEN s.type = 'object' THEN json_extract(s.value, '$.subject') ELSE s.value END, ''), ? * count(*) "
+        "FROM (" + src + ") r, json_each(r.visit, '$.subjects') s WHERE 1 GROUP BY 1, 2, 3, 4 "
+        'ON CONFLICT (visit_date, staff, school, subject) DO UPDATE SET visits = visits + excluded.visits',
+        [sign] + list(params))
+
+
+def apply_record_rollups(cur, ids, sign):
+    if ids:
+        apply_rollups(cur, 'v.id IN (SELECT value FROM json_each(?))', [json.dumps(list(ids))], sign)
+
+
+def rebuild_rollups(cur):
+    """Recompute both rollup tables from every stored payload."""
+    cur.execute('DELETE FROM rollup_visits')
+    cur.execute('DELETE FROM rollup_subjects')
+    apply_rollups(cur, '1', [], 1, respect_backfill=False)
+    cur.execute("UPDATE schema_backfills SET done = 1, updated_at = ? WHERE name = 'rollups'", (datetime.utcnow().isoformat(),))
+
+
+# Backfills: fn(cur, position, limit) -> (position, finished). position is the
+# resume point stored in schema_backfills (None before the first chunk); each
+# chunk runs in its own short write transaction.
+def backfill_visit_index(cur, position, limit):
+    # newest first, so recent records get their upsert keys back soonest
+    rows = cur.execute('SELECT id, payload FROM visits WHERE id < ? ORDER BY id DESC LIMIT ?',
+                       (9223372036854775807 if position is None else position, limit)).fetchall()
+    for rid, stored in rows:
+        try:
+            payload_text = unpack_payload(stored)
+            payload = json.loads(payload_text) if payload_text else None
+        except Exception:
+            payload = None
+        write_visit_index(cur, rid, payload)
+    if len(rows) < limit:
+        return None, True
+    return rows[-1][0], False
+
+
+def backfill_school_keys(cur, position, limit):
+    # newest first, like visit_index; a record saved meanwhile already has its
+    # keys, so each chunk replaces rather than adds
+    ids = [r[0] for r in cur.execute('SELECT id FROM visits WHERE id < ? ORDER BY id DESC LIMIT ?',
+                                     (9223372036854775807 if position is None else position, limit)).fetchall()]
+    if ids:
+        ids_json = json.dumps(ids)
+        cur.execute('DELETE FROM visit_schools WHERE record_id IN (SELECT value FROM json_each(?))', (ids_json,))
+        cur.execute(
+            "INSERT INTO visit_schools (record_id, staff, visit_date, school) "
+            "SELECT DISTINCT v.id, v.staff, v.visit_date, trim(json_extract(j.value, '$.school'), char(32, 9, 10, 13)) "
+            "FROM (SELECT id, staff, visit_date, " + payload_sql() + " AS p FROM visits "
+            "WHERE id IN (SELECT value FROM json_each(?)) LIMIT -1) v, "
+            "json_each(CASE WHEN json_valid(v.p) THEN v.p ELSE '{}' END, '$.visits') j "
+            "WHERE v.staff != '' AND v.visit_date != '' AND json_type(j.value) = 'object' "
+            "AND trim(json_extract(j.value, '$.school'), char(32, 9, 10, 13)) != ''", (ids_json,))
+    if len(ids) < limit:
+        return None, True
+    return ids[-1], False
+
+
+def backfill_rollups(cur, position, limit):
+    if position is None:
+        cur.execute('DELETE FROM rollup_visits')
+        cur.execute('DELETE FROM rollup_subjects')
+        position = 0
+    last = cur.execute('SELECT max(id) FROM (SELECT id FROM visits WHERE id > ? ORDER BY id LIMIT ?)',
+                       (position, limit)).fetchone()[0]
+    if last is None:
+        return position, True
+    apply_rollups(cur, 'v.id > ? AND v.id <= ?', [position, last], 1, respect_backfill=False)
+    return last, False
+
+
+BACKFILLS = {
+    'visit_index': backfill_visit_index,
+    'rollups': backfill_rollups,
+    'school_keys': backfill_school_keys,
+}
+
+
+def pending_backfills(cur):
+    try:
+        return cur.execute('SELECT name, position FROM schema_backfills WHERE done = 0 ORDER BY name').fetchall()
+    except sqlite3.OperationalError:
+        return []
+
+
+def run_backfills(chunk_rows=None, pause_s=None, log=None, stop=None):
+    """Run every pending backfill to completion, one chunk per write transaction
+    with a pause in between so request handlers get the write lock.
+    Resumable: progress is committed with each chunk. Returns the chunks run."""
+    chunk_rows = chunk_rows or BACKFILL_CHUNK_ROWS
+    pause_s = BACKFILL_PAUSE_S if pause_s is None else pause_s
+    chunks = 0
+    for name, _ in pending_backfills(get_db().cursor()):
+        fn = BACKFILLS.get(name)
+        if fn is None:
+            if log:
+                log(f'unknown backfill {name!r}, skipped')
+            continue
+        finished = False
+        while not finished:
+            if stop is not None and stop.is_set():
+                return chunks
+            with db_transaction() as conn:
+                cur = conn.cursor()
+                row = cur.execute('SELECT position, done FROM schema_backfills WHERE name = ?', (name,)).fetchone()
+                if row is None or row[1]:
+                    break  # finished elsewhere (another worker, rebuild_rollups)
+                position, finished = fn(cur, row[0], chunk_rows)
+                cur.execute('UPDATE schema_backfills SET position = ?, done = ?, updated_at = ? WHERE name = ?',
+                            (position, 1 if finished else 0, datetime.utcnow().isoformat(), name))
+            chunks += 1
+            if log:
+                log(f'{name}: {"done" if finished else f"at id {position}"}')
+            if not finished and pause_s:
+                time.sleep(pause_s)
+    return chunks
+
+
+class BackfillWorker(threading.Thread):
+    """Runs pending backfills in the background of one worker process; the
+    file lock keeps the other gunicorn workers from doing the same chunks."""
+
+    def __init__(self, retry_s=30.0):
+        super().__init__(name='schema-backfill', daemon=True)
+        self.retry_s = retry_s
+        self.halt = threading.Event()
+
+    def run(self):
+        while not self.halt.is_set():
+            try:
+                if not pending_backfills(get_db().cursor()):
+                    return
+                with file_lock(DB_PATH + '.backfill.lock', blocking=False) as held:
+                    if held:
+                        run_backfills(log=app.logger.info, stop=self.halt)
+            except Exception as e:
+                app.logger.warning('backfill failed: %s', e)
+            self.halt.wait(self.retry_s)
+
+
+def _match_clause(column, exact):
+    # substring match; exact=1 (values picked from a dropdown) is an index seek
+    return f'{column} = ?' if exact else f'instr({column}, ?) > 0'
+
+
+def _subject_match_clause(column, exact):
+    return f'id IN (SELECT record_id FROM visit_subjects WHERE {_match_clause(column, exact)})'
+
+
+def build_visit_filters(cur, args):
+    """Translate the staff/school/subject/region/from/to query params into a
+    SQL WHERE clause over the indexed columns. Returns (where_sql, params).
+    Text filters are substring matches unless exact=1."""
+    clauses = []
+    params = []
+    exact = str(args.get('exact') or '').lower() in ('1', 'true')
+    for param, column in (('staff', 'staff'), ('school', 'school'), ('region', 'region')):
+        value = args.get(param)
+        if value:
+            clauses.append(_match_clause(column, exact))
+            params.append(value)
+    for param in ('subject', 'teacher', 'publisher'):
+        value = args.get(param)
+        if value:
+            clauses.append(_subject_match_clause(param, exact))
+            params.append(value)
+    # records without a visit_date are not excluded by the date range (legacy behaviour)
+    date_from = args.get('from')
+    date_to = args.get('to')
+    if date_from:
+        clauses.append("(visit_date >= ? OR visit_date IS NULL OR visit_date = '')")
+        params.append(date_from)
+    if date_to:
+        clauses.append("(visit_date <= ? OR visit_date IS NULL OR visit_date = '')")
+        params.append(date_to)
+    return clauses, params
+
+
+def build_visit_search(q):
+    """Full-text search for the `q=` param.
+    Returns (cte_sql, params) defining `search_hits(record_id, school_hit, score)`
+    or None when q has no terms. A record matches when all terms appear in one
+    subject entry's conversation/followUp/teacher/publisher (prefix match, ranked
+    by bm25) or when all terms appear in its school names (trigram substring).
+    School-name hits rank first, then the best memo score.
+    """
+    terms = [t for t in (q or '').split() if t]
+    if not terms:
+        return None
+    match_expr = ' '.join('"' + t.replace('"', '""') + '"*' for t in terms)
+    # trigram only indexes runs of 3+ characters; shorter terms (most Korean
+    # place names, e.g. 과천) fall back to a scan of the small school table
+    school_sql = ' AND '.join('schools LIKE ?' if len(t) >= 3 else 'instr(schools, ?) > 0' for t in terms)
+    cte = (
+        'WITH search_raw(record_id, school_hit, score) AS ('
+        ' SELECT vs.record_id, 0, min(m.score) FROM'
+        ' (SELECT rowid AS subject_id, rank AS score FROM visit_text_fts WHERE visit_text_fts MATCH ?) m'
+        ' JOIN visit_subjects vs ON vs.id = m.subject_id GROUP BY vs.record_id'
+        ' UNION ALL'
+        ' SELECT rowid, 1, 0 FROM visit_school_fts WHERE ' + school_sql +
+        '), search_hits(record_id, school_hit, score) AS ('
+        ' SELECT record_id, max(school_hit), min(score) FROM search_raw GROUP BY record_id) '
+    )
+    params = [match_expr] + [('%' + t + '%') if len(t) >= 3 else t for t in terms]
+    return cte, params
+
+
+def where_sql(clauses):
+    return (' WHERE ' + ' AND '.join(clauses)) if clauses else ''
+
+
+def visits_query(columns, clauses, params, order, search=None):
+    """Assemble the SELECT over visits (optionally restricted to search hits).
+    Returns (sql, params)."""
+    sql = 'SELECT ' + columns + ' FROM visits'
+    if search:
+        sql = search[0] + sql + ' JOIN search_hits ON search_hits.record_id = visits.id'
+        params = list(search[1]) + list(params)
+    return sql + where_sql(clauses) + ' ORDER BY ' + order, params
+
+
+# Sort orders supported by GET /api/visits (name -> ORDER BY).
+# id/visit_date have a matching index so a cursor seek is a single index range
+# scan; rank (default when q= is given) orders by search relevance.
+VISIT_SORTS = {
+    'id': 'id DESC',
+    'visit_date': "coalesce(visit_date, '') DESC, id DESC",
+    'rank': 'search_hits.school_hit DESC, search_hits.score, id DESC',
+}
+
+
+def encode_cursor(sort, row_id, visit_date=None, offset=0):
+    """Opaque cursor: base64url JSON of the last row's sort key. Ranked search
+    results have no stable key, so their cursor carries the next offset."""
+    key = {'s': sort, 'id': row_id}
+    if sort == 'visit_date':
+        key['d'] = visit_date or ''
+    elif sort == 'rank':
+        key['o'] = offset
+    raw = json.dumps(key, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """Turn a cursor back into (seek clause, params, offset); raises ValueError
+    if it is malformed or was issued for a different sort order."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key = json.loads(raw.decode('utf-8'))
+        row_id = int(key['id'])
+    except Exception:
+        raise ValueError('malformed cursor')
+    if key.get('s') != sort:
+        raise ValueError('cursor was issued for sort=%s' % key.get('s'))
+    if sort == 'rank':
+        return None, [], max(int(key.get('o') or 0), 0)
+    if sort == 'visit_date':
+        d = str(key.get('d') or '')
+        # the <= term bounds the index range; the OR breaks ties on id
+        return "coalesce(visit_date, '') <= ? AND (coalesce(visit_date, '') < ? OR id < ?)", [d, d, row_id], 0
+    return 'id < ?', [row_id], 0
+
+
+# frontend files go through static_files (hashed names, ETags, compression) rather than Flask's static view
+app = Flask(__name__, static_folder=None)
+app.config['JSON_AS_ASCII'] = False
+METRICS.init_app(app)
+# Server-Timing on every response; opt-in stack sampling (PROFILE_* env, see backend/profiling.py)
+PROFILER = RequestProfiler('visits').init_app(app)
+# VISITS_MIGRATE=0 / VISITS_BACKFILL=0: leave both to scripts/migrate.py
+if os.environ.get('VISITS_MIGRATE', '1') != '0':
+    init_db()
+if os.environ.get('VISITS_BACKFILL', '1') != '0':
+    BackfillWorker().start()
+if SNAPSHOT_INTERVAL_S > 0:
+    SnapshotWorker().start()
+
+# SSE broadcaster: sse_broadcast appends to the `events` table, and a tailer
+# thread in every worker process copies new rows into that process's ring
+# buffer, so a save handled by any worker reaches every connected client.
+SSE_BUFFER_EVENTS = int(os.environ.get('SSE_BUFFER_EVENTS', '1000'))
+SSE_KEEPALIVE_S = float(os.environ.get('SSE_KEEPALIVE_S', '25'))
+EVENTS_POLL_S = float(os.environ.get('EVENTS_POLL_S', '0.25'))
+EVENTS_KEEP_ROWS = int(os.environ.get('EVENTS_KEEP_ROWS', '10000'))
+
+
+class EventRing:
+    """Bounded buffer of serialized SSE frames keyed by the event sequence id.
+    Memory is capped by `size` no matter how many clients are attached; a client
+    whose position falls out of the buffer gets a `reset` event and is dropped."""
+
+    def __init__(self, size):
+        self.frames = deque(maxlen=size)
+        self.seq = 0
+        self.evicted = 0      # highest seq no longer in the buffer
+        self.cond = threading.Condition()
+
+    def publish(self, seq, event_name, data_text):
+        with self.cond:
+            if len(self.frames) == self.frames.maxlen:
+                self.evicted = self.frames[0][0]
+            frame = f"id: {seq}\nevent: {event_name}\ndata: {data_text}\n\n".encode('utf-8')
+            self.frames.append((seq, frame))
+            self.seq = seq
+            self.cond.notify_all()
+
+    def reset(self, seq=0):
+        with self.cond:
+            self.frames.clear()
+            self.seq = self.evicted = seq
+            self.cond.notify_all()
+
+    def read_after(self, last_seq, timeout=None):
+        """Frames with seq > last_seq (waiting up to timeout for new ones).
+        Returns (frames, new_last_seq); frames is None when last_seq has
+        already been evicted from the buffer."""
+        with self.cond:
+            if last_seq >= self.seq and timeout:
+                self.cond.wait_for(lambda: self.seq > last_seq, timeout)
+            if last_seq >= self.seq:
+                return [], last_seq
+            if last_seq < self.evicted:
+                return None, self.seq
+            out = []
+            for seq, frame in reversed(self.frames):
+                if seq <= last_seq:
+                    break
+                out.append(frame)
+            out.reverse()
+            return out, self.seq
+
+
+class EventTail:
+    """Copies rows appended to `events` (by any process) into the local ring.
+    PRAGMA data_version makes an idle poll a single cheap statement."""
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.path = None
+        self.data_version = None
+        self.wake = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.polls = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='events-tail', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                app.logger.warning('events tail failed: %s', e)
+            self.wake.wait(EVENTS_POLL_S)
+            self.wake.clear()
+
+    def poll(self):
+        with self.lock:
+            # read DB_PATH once: the check below and the connection must agree
+            path = DB_PATH
+            cur = get_db(path).cursor()
+            if self.path != path:
+                # first poll (or DB switched): preload the recent tail for Last-Event-ID replay
+                self.path = path
+                self.data_version = None
+                cur.execute('SELECT coalesce(max(seq), 0) FROM events')
+                top = cur.fetchone()[0]
+                self.ring.reset(max(top - SSE_BUFFER_EVENTS, 0))
+            # data_version is per connection, so remember which one it came from
+            version = (cur.connection, cur.execute('PRAGMA data_version').fetchone()[0])
+            if version == self.data_version:
+                return 0
+            self.data_version = version
+            cur.execute('SELECT seq, name, data FROM events WHERE seq > ? ORDER BY seq', (self.ring.seq,))
+            rows = cur.fetchall()
+            for seq, name, data in rows:
+                self.ring.publish(seq, name, data)
+            self.polls += 1
+            if rows and self.polls % 100 == 0:
+                cur.execute('DELETE FROM events WHERE seq <= ?', (self.ring.seq - EVENTS_KEEP_ROWS,))
+            return len(rows)
+
+
+_sse_ring = EventRing(SSE_BUFFER_EVENTS)
+_event_tail = EventTail(_sse_ring)
+# connected /api/events clients -> last seq sent (for the lag gauges)
+_sse_positions = {}
+
+
+def _sse_gauges():
+    head = _sse_ring.seq
+    lags = [max(head - pos, 0) for pos in list(_sse_positions.values())]
+    return {
+        'sse_clients': len(lags),
+        'sse_ring_events': len(_sse_ring.frames),
+        'sse_client_lag_max': max(lags, default=0),
+    }
+
+
+for _name, _help in (('sse_clients', 'Connected /api/events clients.'),
+                     ('sse_ring_events', 'Events held in the SSE ring buffer.'),
+                     ('sse_client_lag_max', 'Largest number of buffered events a client has not been sent yet.')):
+    METRICS.gauge(_name, _help, lambda _name=_name: {None: _sse_gauges()[_name]})
+METRICS.counter('sse_resets_total', 'Clients dropped with a reset event after falling out of the buffer.')
+
+
+def sse_broadcast(event_name, data):
+    cur = get_db().cursor()
+    cur.execute('INSERT INTO events (name, data, created_at) VALUES (?, ?, ?)',
+                (event_name, json.dumps(data, ensure_ascii=False), datetime.utcnow().isoformat()))
+    # same-process clients don't have to wait for the next poll
+    _event_tail.wake.set()
+    return cur.lastrowid
 
 
 def add_cors_headers(resp):
@@ -61,16 +1260,23 @@ def add_cors_headers(resp):
         pass
     return resp
 
-@app.route('/api/visits', methods=['POST'])
-def save_visits():
-    try:
-        data = request.get_json(force=True)
-    except Exception as e:
-        return jsonify({'ok': False, 'error': 'invalid_json', 'msg': str(e)}), 400
-    if not data:
-        return jsonify({'ok': False, 'error': 'empty_payload'}), 400
+def visit_payload_key(data):
+    """(staff, visit_date) of a day payload; visit_date comes from the first visit."""
     staff = data.get('staff') or ''
     visits = data.get('visits') or []
+    visit_date = None
+    if isinstance(visits, list) and visits:
+        visit_date = visits[0].get('visitDate') or None
+    return staff, visit_date
+
+
+def validate_visit_payload(data):
+    """Return the 400 error body for an unacceptable day payload, or None."""
+    if not data:
+        return {'ok': False, 'error': 'empty_payload'}
+    if not isinstance(data, dict):
+        return {'ok': False, 'error': 'invalid_payload', 'msg': 'payload must be a JSON object'}
+    visits = data.get('visits') or []
 
     # Validation: require visitStart and visitEnd for each visit entry
     missing = []
@@ -86,386 +1292,938 @@ def save_visits():
                 missing.append({'index': idx, 'visitDate': (v.get('visitDate') if isinstance(v, dict) else None), 'school': (v.get('school') if isinstance(v, dict) else None)})
 
     if missing:
-        return jsonify({'ok': False, 'error': 'missing_visit_times', 'missing': missing, 'msg': 'Each visit must include visitStart and visitEnd'}), 400
-    visit_date = None
-    if isinstance(visits, list) and visits:
-        visit_date = visits[0].get('visitDate') or None
-    # store payload as JSON text
+        return {'ok': False, 'error': 'missing_visit_times', 'missing': missing, 'msg': 'Each visit must include visitStart and visitEnd'}
+    return None
+
+
+def upsert_visit(cur, data):
+    """Store one validated day payload inside the caller's write transaction.
+    Returns (record_id, updated)."""
+    staff, visit_date = visit_payload_key(data)
+    visits = data.get('visits') or []
+    rowid = None
+    # An existing record for the same staff + visit_date that already contains
+    # any of the incoming schools is updated instead of inserting a duplicate.
+    # visit_schools holds those keys, so this is one indexed lookup.
+    incoming = set()
+    if isinstance(visits, list):
+        incoming = school_keys(vv.get('school') for vv in visits if isinstance(vv, dict) and vv.get('school'))
+    if staff and visit_date and incoming:
+        marks = ','.join('?' * len(incoming))
+        cur.execute('SELECT record_id FROM visit_schools WHERE staff = ? AND visit_date = ? AND school IN (' + marks + ') '
+                    'ORDER BY record_id DESC LIMIT 1', [staff, visit_date] + sorted(incoming))
+        hit = cur.fetchone()
+        if hit:
+            rowid = hit[0]
+
+    # store payload as JSON text (or its compressed form, see pack_payload)
+    fields = extract_index_fields(data)
+    stored = pack_payload(cur, json.dumps(data, ensure_ascii=False))
+    if rowid is not None:
+        apply_record_rollups(cur, [rowid], -1)
+        cur.execute('UPDATE visits SET payload = ?, created_at = ? WHERE id = ?', (
+            stored, datetime.utcnow().isoformat(), rowid
+        ))
+        write_visit_index(cur, rowid, data, fields)
+        apply_record_rollups(cur, [rowid], 1)
+        return rowid, True
+    cur.execute('INSERT INTO visits (created_at, staff, visit_date, payload, school, region, location) VALUES (?,?,?,?,?,?,?)', (
+        datetime.utcnow().isoformat(), staff, visit_date, stored, fields[0], fields[1], fields[2]
+    ))
+    rowid = cur.lastrowid
+    write_visit_index(cur, rowid, data, fields, new_record=True)
+    apply_record_rollups(cur, [rowid], 1)
+    return rowid, False
+
+
+def save_visit(cur, data):
+    """One POST /api/visits save: the upsert and its SSE event."""
+    rowid, updated = upsert_visit(cur, data)
+    staff, visit_date = visit_payload_key(data)
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
+        sse_broadcast('updated_visit' if updated else 'new_visit', {'id': rowid, 'staff': staff, 'visit_date': visit_date, 'payload': data})
+    except Exception:
+        pass
+    return rowid, updated
+
+
+# Group commit: concurrent saves are handed to one writer thread per process,
+# which runs everything queued (up to WRITE_BATCH_MAX) in a single transaction
+# with one commit, instead of every request queueing for the write lock on its
+# own. Each save runs in its own SAVEPOINT, so a failing save only rolls back
+# itself, and each caller's future gets its own result or exception once the
+# batch has committed. VISITS_GROUP_COMMIT=0 goes back to one transaction per request.
+GROUP_COMMIT = os.environ.get('VISITS_GROUP_COMMIT', '1') != '0'
+WRITE_BATCH_MAX = int(os.environ.get('VISITS_WRITE_BATCH_MAX') or 200)
+# optional linger after the first queued save, to collect a bigger batch
+WRITE_BATCH_WAIT_S = float(os.environ.get('VISITS_WRITE_BATCH_WAIT_MS') or 0) / 1000.0
+# how long save_visits waits for its batch: the writer itself waits up to the busy timeout for the lock
+WRITE_RESULT_TIMEOUT_S = float(os.environ.get('VISITS_WRITE_RESULT_TIMEOUT_S') or 3 * DB_BUSY_TIMEOUT_MS / 1000.0)
+
+
+class GroupCommitWriter:
+    def __init__(self, batch_max=WRITE_BATCH_MAX, wait_s=WRITE_BATCH_WAIT_S):
+        self.batch_max = batch_max
+        self.wait_s = wait_s
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
 
-        # Determine incoming visit_date and first visit's school (if any)
-        incoming_school = None
-        if isinstance(visits, list) and visits:
+    def submit(self, fn, *args):
+        """Queue fn(cur, *args) for the next batch; returns a Future."""
+        fut = Future()
+        self.queue.put((fut, fn, args))
+        with self.lock:
+            # started lazily, so it runs in the gunicorn worker rather than the master
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='visits-writer', daemon=True)
+                self.thread.start()
+        return fut
+
+    def run(self):
+        while True:
+            batch = []
             try:
-                incoming_school = (visits[0].get('school') if isinstance(visits[0], dict) else None)
-            except Exception:
-                incoming_school = None
-
-        rowid = None
-        # Look for existing records with same staff + visit_date.
-        # If any existing record contains a visit with the same school as any incoming visit,
-        # prefer updating that record (avoid creating duplicates for same school/day/staff).
-        updated = False
-        if staff and visit_date:
-            cur.execute('SELECT id, payload FROM visits WHERE staff = ? AND visit_date = ? ORDER BY id DESC', (staff, visit_date))
-            candidates = cur.fetchall() or []
+                batch.append(self.queue.get())
+                deadline = time.monotonic() + self.wait_s
+                while len(batch) < self.batch_max:
+                    try:
+                        batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())) if self.wait_s
+                                     else self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self.commit(batch)
+            except BaseException as e:
+                # whatever failed, no caller is left waiting on an unresolved future
+                for fut, fn, args in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                if not isinstance(e, Exception):
+                    raise
+
+    def commit(self, batch):
+        batch = [item for item in batch if item[0].set_running_or_notify_cancel()]
+        done = []
+        try:
+            with db_transaction() as conn:
+                cur = conn.cursor()
+                for fut, fn, args in batch:
+                    cur.execute('SAVEPOINT group_item')
+                    try:
+                        result = fn(cur, *args)
+                    except Exception as e:
+                        cur.execute('ROLLBACK TO group_item')
+                        cur.execute('RELEASE group_item')
+                        done.append((fut, None, e))
+                        continue
+                    cur.execute('RELEASE group_item')
+                    done.append((fut, result, None))
+        except BaseException as e:
+            # BEGIN or COMMIT failed: nothing in the batch was stored
+            for fut, fn, args in batch:
+                fut.set_exception(e)
+            return
+        for fut, result, error in done:
+            if error is not None:
+                fut.set_exception(error)
+            else:
+                fut.set_result(result)
+        _event_tail.wake.set()  # events written in the batch are visible now
+        METRICS.observe('visits_group_commit_size', len(batch))
+
+
+_writer = GroupCommitWriter()
+
+
+@app.route('/api/visits', methods=['POST'])
+def save_visits():
+    try:
+        data = request.get_json(force=True)
+    except Exception as e:
+        return jsonify({'ok': False, 'error': 'invalid_json', 'msg': str(e)}), 400
+    error = validate_visit_payload(data)
+    if error:
+        return jsonify(error), 400
+    try:
+        if GROUP_COMMIT:
+            # the statements run on the writer thread; the wait is this request's db time
+            fut = _writer.submit(save_visit, data)
+            with phase('db'):
+                try:
+                    rowid, updated = fut.result(WRITE_RESULT_TIMEOUT_S)
+                except TimeoutError:
+                    # still queued: drop it; already running: it may yet commit
+                    stored = 'not stored' if fut.cancel() else 'may still be stored'
+                    return jsonify({'ok': False, 'error': 'write_timeout',
+                                    'msg': f'save not committed within {WRITE_RESULT_TIMEOUT_S:g}s ({stored})'}), 503
         else:
-            candidates = []
+            with db_transaction() as conn:
+                rowid, updated = save_visit(conn.cursor(), data)
 
-        if candidates:
-            # build set of incoming schools for quick lookup
-            incoming_schools = set()
+        if updated:
+            return jsonify({'ok': True, 'id': rowid, 'updated': True}), 200
+        return jsonify({'ok': True, 'id': rowid}), 201
+    except Exception as e:
+        return jsonify({'ok': False, 'error': 'db_error', 'msg': str(e)}), 500
+
+
+# Bulk ingest: items stored per write transaction
+BULK_CHUNK_ITEMS = 500
+
+
+def split_payload_by_date(data):
+    """Split an aggregated payload (e.g. kakao_to_visits.py --out-json, which
+    holds a whole chat history) into one payload per visitDate."""
+    visits = data.get('visits') if isinstance(data, dict) else None
+    if not isinstance(visits, list) or not visits:
+        return [data]
+    groups = {}
+    for v in visits:
+        key = v.get('visitDate') if isinstance(v, dict) else None
+        groups.setdefault(key, []).append(v)
+    if len(groups) == 1:
+        return [data]
+    out = []
+    for group in groups.values():
+        item = dict(data)
+        item['visits'] = group
+        out.append(item)
+    return out
+
+
+def _iter_stream_lines(stream, chunk_size=64 * 1024):
+    # the WSGI input stream's readline() goes byte by byte; read in blocks instead
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+def iter_bulk_items(req):
+    """Yield (index, payload-or-None, parse_error) from a JSON array body or a
+    streamed NDJSON body (one payload per line, read line by line)."""
+    ctype = (req.mimetype or '').lower()
+    if ctype in ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/x-jsonlines'):
+        idx = 0
+        for raw in _iter_stream_lines(req.stream):
+            line = raw.strip()
+            if not line:
+                continue
             try:
-                for vv in visits:
-                    if isinstance(vv, dict) and vv.get('school'):
-                        incoming_schools.add(str(vv.get('school')).strip())
-            except Exception:
-                incoming_schools = set()
+                yield idx, json.loads(line), None
+            except Exception as e:
+                yield idx, None, str(e)
+            idx += 1
+        return
+    try:
+        items = req.get_json(force=True)
+    except Exception as e:
+        raise ValueError(getattr(e, 'description', None) or str(e))
+    if isinstance(items, dict):
+        items = items.get('items') if isinstance(items.get('items'), list) else [items]
+    if not isinstance(items, list):
+        raise ValueError('body must be a JSON array, an object with items, or NDJSON')
+    for idx, item in enumerate(items):
+        yield idx, item, None
 
-            for cand in candidates:
-                try:
-                    rid = cand[0]
-                    payload_text = cand[1]
-                    payload_obj = json.loads(payload_text) if payload_text else {}
-                    ev = (payload_obj.get('visits') if isinstance(payload_obj, dict) else None)
-                    existing_schools = set()
-                    if ev and isinstance(ev, list):
-                        for evis in ev:
-                            try:
-                                if isinstance(evis, dict) and evis.get('school'):
-                                    existing_schools.add(str(evis.get('school')).strip())
-                            except Exception:
-                                continue
-                    # If intersection exists, update this candidate row
-                    if incoming_schools and existing_schools and (incoming_schools & existing_schools):
-                        cur.execute('UPDATE visits SET payload = ?, created_at = ? WHERE id = ?', (
-                            json.dumps(data, ensure_ascii=False), datetime.utcnow().isoformat(), rid
-                        ))
-                        conn.commit()
-                        rowid = rid
-                        try:
-                            sse_broadcast('updated_visit', {'id': rowid, 'staff': staff, 'visit_date': visit_date, 'payload': data})
-                        except Exception:
-                            pass
-                        conn.close()
-                        return jsonify({'ok': True, 'id': rowid, 'updated': True}), 200
-                except Exception:
-                    # ignore candidate parsing errors and try next
-                    continue
 
-        # Otherwise insert as a new record
-        cur.execute('INSERT INTO visits (created_at, staff, visit_date, payload) VALUES (?,?,?,?)', (
-            datetime.utcnow().isoformat(), staff, visit_date, json.dumps(data, ensure_ascii=False)
-        ))
-        conn.commit()
-        rowid = cur.lastrowid
-        conn.close()
+@app.route('/api/visits/bulk', methods=['POST'])
+def bulk_save_visits():
+    """Bulk ingest for migrations.
+    Body: JSON array of POST /api/visits payloads, or NDJSON (Content-Type:
+    application/x-ndjson) streamed one payload per line. `split_by_date=1`
+    splits aggregated payloads into one record per visitDate first.
+    Each item gets the same validation and staff/date/school upsert as a single
+    save; items are written BULK_CHUNK_ITEMS per transaction and a failing item
+    only rolls back itself. Returns per-item results plus totals.
+    """
+    split = (request.args.get('split_by_date') or '').lower() in ('1', 'true', 'yes')
+    results = []
+    totals = {'inserted': 0, 'updated': 0, 'failed': 0}
+    pending = []
 
-        # broadcast to SSE clients
+    def store(chunk):
+        # per-item results count only once the chunk is committed; if the
+        # transaction fails every item in it is reported failed
+        stored = []
         try:
-            sse_broadcast('new_visit', {'id': rowid, 'staff': staff, 'visit_date': visit_date, 'payload': data})
-        except Exception:
-            pass
+            with db_transaction() as conn:
+                cur = conn.cursor()
+                for idx, data in chunk:
+                    cur.execute('SAVEPOINT bulk_item')
+                    try:
+                        rowid, updated = upsert_visit(cur, data)
+                    except Exception as e:
+                        cur.execute('ROLLBACK TO bulk_item')
+                        cur.execute('RELEASE bulk_item')
+                        stored.append({'index': idx, 'ok': False, 'error': 'db_error', 'msg': str(e)})
+                        continue
+                    cur.execute('RELEASE bulk_item')
+                    stored.append({'index': idx, 'ok': True, 'id': rowid, 'updated': updated})
+        except Exception as e:
+            totals['failed'] += len(chunk)
+            results.extend({'index': idx, 'ok': False, 'error': 'db_error', 'msg': str(e)} for idx, _ in chunk)
+            raise
+        for r in stored:
+            totals['failed' if not r['ok'] else 'updated' if r['updated'] else 'inserted'] += 1
+        results.extend(stored)
 
-        return jsonify({'ok': True, 'id': rowid}), 201
+    try:
+        for idx, data, parse_error in iter_bulk_items(request):
+            if parse_error:
+                totals['failed'] += 1
+                results.append({'index': idx, 'ok': False, 'error': 'invalid_json', 'msg': parse_error})
+                continue
+            for item in (split_payload_by_date(data) if split else [data]):
+                error = validate_visit_payload(item)
+                if error:
+                    totals['failed'] += 1
+                    error = dict(error, index=idx)
+                    error.pop('ok', None)
+                    results.append(dict(error, ok=False))
+                    continue
+                pending.append((idx, item))
+                if len(pending) >= BULK_CHUNK_ITEMS:
+                    store(pending)
+                    pending = []
+        if pending:
+            store(pending)
+    except ValueError as e:
+        return add_cors_headers(make_response(jsonify({'ok': False, 'error': 'invalid_json', 'msg': str(e)}), 400))
     except Exception as e:
-        return jsonify({'ok': False, 'error': 'db_error', 'msg': str(e)}), 500
+        body = {'ok': False, 'error': 'db_error', 'msg': str(e), 'results': sorted(results, key=lambda r: r['index'])}
+        body.update(totals)
+        return add_cors_headers(make_response(jsonify(body), 500))
+
+    # one summary event instead of a flood of per-item events
+    try:
+        if totals['inserted'] or totals['updated']:
+            sse_broadcast('bulk_import', {'inserted': totals['inserted'], 'updated': totals['updated']})
+    except Exception:
+        pass
+    # validation failures are reported as they are read, stored items once
+    # their chunk commits: back into input order for clients matching by position
+    results.sort(key=lambda r: r['index'])
+    body = {'ok': totals['failed'] == 0, 'total': len(results), 'results': results}
+    body.update(totals)
+    return add_cors_headers(make_response(jsonify(body), 200))
+
+
+# JSON responses that embed stored payloads: the payload TEXT is already JSON,
+# so it is spliced into the output as-is instead of json.loads + re-serialize.
+try:
+    import orjson
+except ImportError:  # optional: stdlib json fallback
+    orjson = None
+
+
+def dumps_bytes(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def visit_rows_json(rows, extra):
+    """Body for {**extra, "rows": [...]} where rows are (id, created_at, staff,
+    visit_date, payload_json_text_or_None)."""
+    with phase('serialize'):
+        return _visit_rows_json(rows, extra)
+
+
+def _visit_rows_json(rows, extra):
+    parts = [dumps_bytes(extra)[:-1], b',"rows":[' if extra else b'"rows":[']
+    for i, (rid, created_at, staff, visit_date, payload) in enumerate(rows):
+        head = dumps_bytes({'id': rid, 'created_at': created_at, 'staff': staff, 'visit_date': visit_date})
+        parts.append((b',' if i else b'') + head[:-1] + b',"payload":')
+        parts.append(payload.encode('utf-8') if payload else b'null')
+        parts.append(b'}')
+    parts.append(b']}')
+    return b''.join(parts)
 
 
 @app.route('/api/visits', methods=['GET'])
 def list_visits():
-    # returns stored visit records, supports pagination and simple filters
+    # returns stored visit records, supports pagination and simple filters.
+    # Pagination: pass back `next_cursor` as `cursor` to seek past the last row
+    # (constant cost at any depth); `offset` is still honoured when no cursor is given.
     try:
         limit = int(request.args.get('limit') or 100)
         offset = int(request.args.get('offset') or 0)
     except Exception:
         limit = 100
         offset = 0
-
-    # simple filter params
-    staff_q = request.args.get('staff')
-    school_q = request.args.get('school')
-    subject_q = request.args.get('subject')
-    region_q = request.args.get('region')
-    date_from = request.args.get('from')
-    date_to = request.args.get('to')
+    search = build_visit_search(request.args.get('q'))
+    sort = request.args.get('sort') or ('rank' if search else 'id')
+    if sort not in VISIT_SORTS or (sort == 'rank' and not search):
+        resp = make_response(jsonify({'ok': False, 'error': 'invalid_sort', 'msg': 'sort must be one of: id, visit_date (rank requires q)'}), 400)
+        return add_cors_headers(resp)
+    cursor = request.args.get('cursor')
 
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        cur.execute('SELECT id, created_at, staff, visit_date, payload FROM visits ORDER BY id DESC LIMIT ? OFFSET ?', (limit, offset))
-        rows = cur.fetchall()
-        conn.close()
-
-        out = []
-        for r in rows:
+        cur = get_db().cursor()
+        # filters run in SQL against the denormalized columns, so every page is full
+        clauses, params = build_visit_filters(cur, request.args)
+        if cursor:
             try:
-                payload = json.loads(r[4]) if r[4] else None
-            except Exception:
-                payload = None
-            rec = { 'id': r[0], 'created_at': r[1], 'staff': r[2], 'visit_date': r[3], 'payload': payload }
+                seek_sql, seek_params, offset = decode_cursor(cursor, sort)
+            except ValueError as e:
+                resp = make_response(jsonify({'ok': False, 'error': 'invalid_cursor', 'msg': str(e)}), 400)
+                return add_cors_headers(resp)
+            if seek_sql:
+                clauses.append(seek_sql)
+                params += seek_params
+        # invalid stored JSON comes back as NULL (same as the old json.loads fallback);
+        # compressed payloads were valid JSON when written
+        sql, params = visits_query("id, created_at, staff, visit_date, CASE WHEN typeof(payload) = 'blob' THEN payload_text(payload) "
+                                   "WHEN json_valid(payload) THEN payload END",
+                                   clauses, params, VISIT_SORTS[sort], search)
+        cur.execute(sql + ' LIMIT ? OFFSET ?', params + [limit, offset])
+        rows = cur.fetchall()
 
-            # apply simple post-fetch filters (payload-inspected)
-            def matches():
-                try:
-                    if staff_q and (not rec['staff'] or staff_q not in rec['staff']):
-                        return False
-                    if not payload:
-                        return True
-                    # school filter
-                    if school_q:
-                        v = ''
-                        if isinstance(payload, dict):
-                            visits = payload.get('visits') or []
-                            if visits and isinstance(visits, list): v = (visits[0].get('school') or '')
-                        if school_q not in (v or ''): return False
-                    # subject filter
-                    if subject_q:
-                        found = False
-                        if isinstance(payload, dict):
-                            for vv in payload.get('visits') or []:
-                                subs = vv.get('subjects') or []
-                                for s in subs:
-                                    subname = s.get('subject') if isinstance(s, dict) else str(s)
-                                    if subject_q in (subname or ''): found = True
-                        if not found: return False
-                    # region filter
-                    if region_q:
-                        v = ''
-                        if isinstance(payload, dict):
-                            visits = payload.get('visits') or []
-                            if visits and isinstance(visits, list): v = (visits[0].get('region') or '')
-                        if region_q not in (v or ''): return False
-                    # date range
-                    if date_from or date_to:
-                        dt = rec.get('visit_date') or ''
-                        if date_from and dt and dt < date_from: return False
-                        if date_to and dt and dt > date_to: return False
-                except Exception:
-                    return False
-                return True
-
-            if matches():
-                out.append(rec)
-        resp = make_response(jsonify({'ok': True, 'rows': out}), 200)
+        next_cursor = encode_cursor(sort, rows[-1][0], rows[-1][3], offset + len(rows)) if rows and len(rows) >= limit else None
+        resp = make_response(visit_rows_json(rows, {'ok': True, 'next_cursor': next_cursor}), 200)
+        resp.mimetype = 'application/json'
         return add_cors_headers(resp)
     except Exception as e:
         resp = make_response(jsonify({'ok': False, 'error': 'db_error', 'msg': str(e)}), 500)
         return add_cors_headers(resp)
 
 
+# CSV export streaming: rows fetched per cursor batch / bytes buffered per write
+EXPORT_BATCH_ROWS = 500
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
 @app.route('/api/visits/export', methods=['GET'])
 def export_visits_csv():
-    # export flattened CSV of stored visits -> one subject per row
+    # export flattened CSV of stored visits -> one subject per row.
+    # Rows are streamed straight off the SQLite cursor in batches (flat memory),
+    # each payload is parsed once, and output is flushed in ~64KB chunks,
+    # gzip-compressed on the fly when the client accepts it.
     import csv
-    # support optional filters in query params (delegates to list_visits logic)
+    import io
+    import zlib
+    # filters (and q= search, ranked) are the same SQL clauses list_visits uses
+    # snapshot=1: read the newest snapshot instead of the live DB (if there is one)
+    snapshot, snapshot_age = latest_snapshot() if request.args.get('snapshot') in ('1', 'true', 'yes') else (None, None)
+    conn = open_snapshot(snapshot) if snapshot else get_db()
     try:
-        # reuse list_visits logic by invoking it through a local request-like pattern
-        conn = sqlite3.connect(DB_PATH)
         cur = conn.cursor()
-        cur.execute('SELECT id, created_at, staff, visit_date, payload FROM visits ORDER BY id DESC')
-        rows = cur.fetchall()
-        conn.close()
+        clauses, params = build_visit_filters(cur, request.args)
+        search = build_visit_search(request.args.get('q'))
+        sql, params = visits_query('id, created_at, staff, visit_date, payload', clauses, params,
+                                   VISIT_SORTS['rank'] if search else 'id DESC', search)
+        cur.execute(sql, params)
     except Exception as e:
+        if snapshot:
+            conn.close()
         return jsonify({'ok': False, 'error': 'db_error', 'msg': str(e)}), 500
 
-    # support filter params
-    staff_q = request.args.get('staff')
-    school_q = request.args.get('school')
-    subject_q = request.args.get('subject')
-    region_q = request.args.get('region')
-    date_from = request.args.get('from')
-    date_to = request.args.get('to')
+    use_gzip = request.accept_encodings['gzip'] > 0
 
-    def row_matches(payload_text, staff_val, visit_date_val):
+    def csv_rows(r):
+        rid, created_at, staff, visit_date, stored = r
         try:
+            payload_text = unpack_payload(stored)
             payload = json.loads(payload_text) if payload_text else {}
         except Exception:
             payload = {}
-        if staff_q and staff_q not in (staff_val or ''): return False
-        if school_q:
-            v = ''
-            visits = payload.get('visits') if isinstance(payload, dict) else None
-            if visits and isinstance(visits, list) and len(visits): v = visits[0].get('school') or ''
-            if school_q not in (v or ''): return False
-        if subject_q:
-            found=False
-            visits = payload.get('visits') if isinstance(payload, dict) else None
-            for vv in (visits or []):
-                for s in (vv.get('subjects') or []):
-                    subname = s.get('subject') if isinstance(s, dict) else str(s)
-                    if subject_q in (subname or ''): found=True
-            if not found: return False
-        if region_q:
-            v = ''
-            visits = payload.get('visits') if isinstance(payload, dict) else None
-            if visits and isinstance(visits, list) and len(visits): v = visits[0].get('region') or ''
-            if region_q not in (v or ''): return False
-        if date_from and visit_date_val and visit_date_val < date_from: return False
-        if date_to and visit_date_val and visit_date_val > date_to: return False
-        return True
+        visits = payload.get('visits') if isinstance(payload, dict) else None
+        if not visits:
+            # output empty row (include location column)
+            return [[rid, created_at, staff, visit_date, '', '', '', '', '', '', '', '', '', '', '', '']]
+        out = []
+        for v in visits:
+            school = v.get('school')
+            region = v.get('region')
+            location = v.get('location')
+            visitStart = v.get('visitStart')
+            visitEnd = v.get('visitEnd')
+            subjects = v.get('subjects') or []
+            if not subjects:
+                out.append([rid, created_at, staff, visit_date, school, region, location, visitStart, visitEnd, '', '', '', '', '', '', ''])
+            else:
+                for s in subjects:
+                    meetings = ','.join(s.get('meetings') or [])
+                    out.append([rid, created_at, staff, visit_date, school, region, location, visitStart, visitEnd,
+                                s.get('subject'), s.get('teacher'), s.get('publisher'), s.get('contact'),
+                                s.get('followUp'), s.get('conversation'), meetings])
+        return out
 
     def generate():
-        import io
         buf = io.StringIO()
         w = csv.writer(buf)
-        # header (added 'location' column)
-        w.writerow(['record_id','created_at','staff','visit_date','school','region','location','visitStart','visitEnd','subject','teacher','publisher','contact','followUp','conversation','meetings'])
-        yield buf.getvalue()
-        buf.seek(0); buf.truncate(0)
-
-        for r in rows:
-            rid, created_at, staff, visit_date, payload_text = r
-            if not row_matches(payload_text, staff, visit_date):
-                continue
-            try:
-                payload = json.loads(payload_text) if payload_text else {}
-            except Exception:
-                payload = {}
-            visits = payload.get('visits') if isinstance(payload, dict) else None
-            if not visits:
-                # output empty row (include location column)
-                w.writerow([rid, created_at, staff, visit_date, '', '', '', '', '', '', '', '', '', '', '', ''])
-                yield buf.getvalue(); buf.seek(0); buf.truncate(0)
-            else:
-                for v in visits:
-                    school = v.get('school')
-                    region = v.get('region')
-                    location = v.get('location')
-                    visitStart = v.get('visitStart')
-                    visitEnd = v.get('visitEnd')
-                    subjects = v.get('subjects') or []
-                    if not subjects:
-                        w.writerow([rid, created_at, staff, visit_date, school, region, location, visitStart, visitEnd, '', '', '', '', '', '', ''])
-                        yield buf.getvalue(); buf.seek(0); buf.truncate(0)
-                    else:
-                        for s in subjects:
-                            subj = s.get('subject')
-                            teacher = s.get('teacher')
-                            publisher = s.get('publisher')
-                            contact = s.get('contact')
-                            follow = s.get('followUp')
-                            conv = s.get('conversation')
-                            meetings = ','.join(s.get('meetings') or [])
-                            w.writerow([rid, created_at, staff, visit_date, school, region, location, visitStart, visitEnd, subj, teacher, publisher, contact, follow, conv, meetings])
-                            yield buf.getvalue(); buf.seek(0); buf.truncate(0)
+        gz = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+
+        encoding = 'gzip' if gz else 'identity'
+
+        def flush():
+            data = buf.getvalue().encode('utf-8')
+            buf.seek(0); buf.truncate(0)
+            data = gz.compress(data) if gz else data
+            METRICS.inc('export_bytes_total', {'encoding': encoding}, len(data))
+            return data
+
+        try:
+            # header (added 'location' column)
+            w.writerow(['record_id','created_at','staff','visit_date','school','region','location','visitStart','visitEnd','subject','teacher','publisher','contact','followUp','conversation','meetings'])
+            while True:
+                batch = cur.fetchmany(EXPORT_BATCH_ROWS)
+                if not batch:
+                    break
+                for r in batch:
+                    w.writerows(csv_rows(r))
+                if buf.tell() >= EXPORT_CHUNK_BYTES:
+                    chunk = flush()
+                    if chunk:
+                        yield chunk
+            tail = flush()
+            if gz:
+                rest = gz.flush()
+                METRICS.inc('export_bytes_total', {'encoding': encoding}, len(rest))
+                tail += rest
+            if tail:
+                yield tail
+        finally:
+            cur.close()
+            if snapshot:
+                conn.close()
 
     # streaming response
-    resp = app.response_class(generate(), mimetype='text/csv', headers={'Content-Disposition':'attachment; filename=visits_export.csv'})
+    headers = {'Content-Disposition': 'attachment; filename=visits_export.csv', 'Vary': 'Accept-Encoding'}
+    if snapshot:
+        headers['X-Snapshot-Age'] = str(int(snapshot_age))
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+    resp = app.response_class(generate(), mimetype='text/csv', headers=headers)
     return add_cors_headers(resp)
 
 
+# GET /api/visits/rollups: group_by columns allowed per rollup table
+ROLLUP_VISIT_KEYS = ('visit_date', 'staff', 'school', 'region')
+ROLLUP_SUBJECT_KEYS = ('visit_date', 'staff', 'school', 'subject')
+
+
+@app.route('/api/visits/rollups', methods=['GET'])
+def visit_rollups():
+    """Summary counts from the rollup tables (no payload scan).
+    Query: group_by=visit_date,staff (default; any of visit_date, staff, school,
+    region, subject), from, to, staff, school, region, subject (exact match).
+    Grouping or filtering by subject reads rollup_subjects (visits per subject,
+    no minutes); otherwise rollup_visits (visits and minutes)."""
+    group_by = [g.strip() for g in (request.args.get('group_by') or 'visit_date,staff').split(',') if g.strip()]
+    use_subjects = 'subject' in group_by or bool(request.args.get('subject'))
+    table, keys = ('rollup_subjects', ROLLUP_SUBJECT_KEYS) if use_subjects else ('rollup_visits', ROLLUP_VISIT_KEYS)
+    bad = [g for g in group_by if g not in keys]
+    if bad or (use_subjects and request.args.get('region')):
+        resp = make_response(jsonify({'ok': False, 'error': 'invalid_group_by',
+                                      'msg': 'subject rollups have no region; group_by must be from: ' + ', '.join(keys)}), 400)
+        return add_cors_headers(resp)
+
+    clauses, params = ['visits != 0'], []
+    for key in ('staff', 'school', 'region', 'subject'):
+        value = request.args.get(key)
+        if value and key in keys:
+            clauses.append(key + ' = ?')
+            params.append(value)
+    if request.args.get('from'):
+        clauses.append('visit_date >= ?')
+        params.append(request.args.get('from'))
+    if request.args.get('to'):
+        clauses.append('visit_date <= ?')
+        params.append(request.args.get('to'))
+    metrics = 'sum(visits)' + (', sum(minutes)' if table == 'rollup_visits' else '')
+    cols = ', '.join(group_by)
+    sql = f'SELECT {cols + ", " if cols else ""}{metrics} FROM {table}{where_sql(clauses)}'
+    if cols:
+        sql += f' GROUP BY {cols} ORDER BY {cols}'
+    try:
+        cur = get_db().cursor()
+        cur.execute(sql, params)
+        names = group_by + (['visits', 'minutes'] if table == 'rollup_visits' else ['visits'])
+        rows = [dict(zip(names, r)) for r in cur.fetchall()]
+        return add_cors_headers(make_response(jsonify({'ok': True, 'group_by': group_by, 'rows': rows}), 200))
+    except Exception as e:
+        return add_cors_headers(make_response(jsonify({'ok': False, 'error': 'db_error', 'msg': str(e)}), 500))
+
+
+# School renames: candidate records processed per write transaction
+RENAME_CHUNK_ROWS = 500
+
+
+def parse_rename_mapping(obj):
+    """Normalize rename input into a list of {old_school, new_school, staff, visit_date}.
+    Accepts a single rename object, {"renames": [...]}, {"mapping": {old: new}},
+    a plain {old: new} dict or a list of rename objects."""
+    if isinstance(obj, dict) and isinstance(obj.get('renames'), list):
+        obj = obj['renames']
+    elif isinstance(obj, dict) and isinstance(obj.get('mapping'), dict):
+        obj = obj['mapping']
+    elif isinstance(obj, dict) and 'old_school' in obj:
+        obj = [obj]
+    if isinstance(obj, dict):
+        obj = [{'old_school': k, 'new_school': v} for k, v in obj.items()]
+    if not isinstance(obj, list):
+        raise ValueError('expected a rename object, a list of renames or an {old: new} mapping')
+    out = []
+    for item in obj:
+        if not isinstance(item, dict):
+            raise ValueError('each rename must be an object')
+        old = str(item.get('old_school') or '').strip()
+        new = str(item.get('new_school') or '').strip()
+        if not old or not new:
+            raise ValueError('old_school and new_school are required')
+        out.append({'old_school': old, 'new_school': new, 'staff': item.get('staff') or None, 'visit_date': item.get('visit_date') or None})
+    return out
+
+
+def _rename_candidates(cur, old, staff=None):
+    # trigram index over every visit's school name (short names fall back to instr)
+    sql = 'SELECT f.rowid FROM visit_school_fts f'
+    params = []
+    if staff:
+        sql += ' JOIN visits v ON v.id = f.rowid AND v.staff = ?'
+        params.append(staff)
+    if len(old) >= 3:
+        sql += ' WHERE f.schools LIKE ?'
+        params.append('%' + old + '%')
+    else:
+        sql += ' WHERE instr(f.schools, ?) > 0'
+        params.append(old)
+    cur.execute(sql + ' ORDER BY f.rowid', params)
+    return [r[0] for r in cur.fetchall()]
+
+
+def refresh_school_index(cur, ids_json):
+    """Set-based refresh of the school-derived index rows (filter column,
+    visit_schools upsert keys, trigram search) for the records in ids_json."""
+    ids = 'SELECT value FROM json_each(?)'
+    cur.execute("UPDATE visits SET school = json_extract(" + payload_sql() + ", '$.visits[0].school') WHERE id IN (" + ids + ")", (ids_json,))
+    cur.execute('DELETE FROM visit_schools WHERE record_id IN (' + ids + ')', (ids_json,))
+    cur.execute(
+        "INSERT INTO visit_schools (record_id, staff, visit_date, school) "
+        "SELECT DISTINCT v.id, v.staff, v.visit_date, trim(json_extract(j.value, '$.school'), char(32, 9, 10, 13)) "
+        "FROM visits v, json_each(" + payload_sql('v.payload') + ", '$.visits') j "
+        "WHERE v.id IN (" + ids + ") AND v.staff != '' AND v.visit_date != '' AND json_type(j.value) = 'object' "
+        "AND trim(json_extract(j.value, '$.school'), char(32, 9, 10, 13)) != '' ORDER BY v.id", (ids_json,))
+    cur.execute('DELETE FROM visit_school_fts WHERE rowid IN (' + ids + ')', (ids_json,))
+    cur.execute(
+        "INSERT INTO visit_school_fts (rowid, schools) "
+        "SELECT v.id, group_concat(json_extract(j.value, '$.school'), char(10)) "
+        "FROM visits v, json_each(" + payload_sql('v.payload') + ", '$.visits') j "
+        "WHERE v.id IN (" + ids + ") AND json_type(j.value) = 'object' AND json_extract(j.value, '$.school') != '' "
+        "GROUP BY v.id", (ids_json,))
+
+
+def rename_school(old, new, staff=None, visit_date=None, dry_run=False, chunk_rows=None):
+    """Replace `old` with `new` inside every matching visits[].school, as
+    set-based SQL (json_set over each array position) on the candidate records
+    found through the school index. Runs in chunks of RENAME_CHUNK_ROWS records,
+    one short write transaction each. dry_run only counts, in read transactions
+    that leave the write lock to save_visits.
+    Returns the sorted ids of records that changed (or would change)."""
+    chunk_rows = chunk_rows or RENAME_CHUNK_ROWS
+    cur = get_db().cursor()
+    candidates = _rename_candidates(cur, old, staff)
+    changed = set()
+    payload = payload_sql()
+    for start in range(0, len(candidates), chunk_rows):
+        ids_json = json.dumps(candidates[start:start + chunk_rows])
+        with db_transaction(write=not dry_run) as conn:
+            cur = conn.cursor()
+            packed = []
+            if not dry_run:
+                # compressed rows are rewritten as text, renamed, and packed again below
+                cur.execute("UPDATE visits SET payload = payload_text(payload) "
+                            "WHERE id IN (SELECT value FROM json_each(?)) AND typeof(payload) = 'blob' RETURNING id", (ids_json,))
+                packed = [r[0] for r in cur.fetchall()]
+            cur.execute("SELECT max(json_array_length(" + payload + ", '$.visits')) FROM visits "
+                        "WHERE id IN (SELECT value FROM json_each(?)) AND json_valid(" + payload + ")", (ids_json,))
+            width = cur.fetchone()[0] or 0
+            if not dry_run:
+                # rollups: take the chunk out before rewriting, add it back after
+                apply_rollups(cur, 'v.id IN (SELECT value FROM json_each(?))', [ids_json], -1)
+            for k in range(width):
+                school_path = '$.visits[%d].school' % k
+                cond = ("id IN (SELECT value FROM json_each(:ids)) AND json_valid(" + payload + ") "
+                        "AND json_type(" + payload + ", :sp) = 'text' AND instr(json_extract(" + payload + ", :sp), :old) > 0")
+                params = {'ids': ids_json, 'sp': school_path, 'old': old, 'new': new}
+                if visit_date:
+                    # same rule as before: the visit's own date, else the payload's top-level visitDate
+                    cond += (" AND coalesce(nullif(json_extract(" + payload + ", :dp), ''), "
+                             "nullif(json_extract(" + payload + ", '$.visitDate'), ''), '') = :date")
+                    params['dp'] = '$.visits[%d].visitDate' % k
+                    params['date'] = visit_date
+                if dry_run:
+                    cur.execute('SELECT id FROM visits WHERE ' + cond, params)
+                else:
+                    cur.execute('UPDATE visits SET payload = json_set(payload, :sp, replace(json_extract(payload, :sp), :old, :new)) '
+                                'WHERE ' + cond + ' RETURNING id', params)
+                changed.update(r[0] for r in cur.fetchall())
+            if not dry_run:
+                apply_rollups(cur, 'v.id IN (SELECT value FROM json_each(?))', [ids_json], 1)
+                if changed:
+                    refresh_school_index(cur, ids_json)
+                if packed:
+                    rows = cur.execute('SELECT id, payload FROM visits WHERE id IN (SELECT value FROM json_each(?))',
+                                       (json.dumps(packed),)).fetchall()
+                    cur.executemany('UPDATE visits SET payload = ? WHERE id = ?',
+                                    [(pack_payload(cur, text, compress=True), rid) for rid, text in rows])
+    return sorted(changed)
+
+
 @app.route('/api/visits/patch_school', methods=['POST'])
 def patch_school():
     """Admin helper: change school name inside stored visit payloads.
     Expects JSON: { staff: str (optional), visit_date: str (optional), old_school: str, new_school: str }
-    Returns rows updated and details.
+    or a batch: { renames: [ {...}, ... ] } / { mapping: { old: new } }, plus optional dry_run: true.
+    Returns rows updated (or that would be updated, for dry_run) and details.
     NOTE: This updates the JSON text stored in the `payload` column.
     """
     try:
         data = request.get_json(force=True)
     except Exception as e:
         return jsonify({'ok': False, 'error': 'invalid_json', 'msg': str(e)}), 400
-    old = (data.get('old_school') or '').strip()
-    new = (data.get('new_school') or '').strip()
-    if not old or not new:
-        return jsonify({'ok': False, 'error': 'missing_params', 'msg': 'old_school and new_school are required'}), 400
-    staff_q = data.get('staff')
-    date_q = data.get('visit_date')
+    try:
+        renames = parse_rename_mapping(data)
+    except ValueError as e:
+        return jsonify({'ok': False, 'error': 'missing_params', 'msg': str(e)}), 400
+    dry_run = bool(isinstance(data, dict) and (data.get('dry_run') or data.get('dryRun')))
 
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        # fetch candidate rows where payload contains the old school text
-        q = 'SELECT id, payload FROM visits WHERE payload LIKE ?'
-        params = ['%' + old + '%']
-        if staff_q:
-            q = q.replace('WHERE', 'WHERE staff = ? AND')
-            params.insert(0, staff_q)
-        cur.execute(q, params)
-        rows = cur.fetchall()
-        updated = []
-        for rid, payload_text in rows:
-            try:
-                payload = json.loads(payload_text) if payload_text else {}
-            except Exception:
-                payload = None
-            if not isinstance(payload, dict):
-                continue
-            changed = False
-            visits = payload.get('visits') or []
-            for v in visits:
-                # optional visit_date filter
-                if date_q and (v.get('visitDate') or payload.get('visitDate') or '') != date_q:
-                    continue
-                s = v.get('school') or ''
-                if isinstance(s, str) and old in s:
-                    v['school'] = s.replace(old, new)
-                    changed = True
-            if changed:
-                # write back updated payload
-                cur.execute('UPDATE visits SET payload = ? WHERE id = ?', (json.dumps(payload, ensure_ascii=False), rid))
-                updated.append(rid)
-        conn.commit()
-        conn.close()
-        return add_cors_headers(make_response(jsonify({'ok': True, 'updated_ids': updated, 'count': len(updated)}), 200))
+        updated = set()
+        details = []
+        for r in renames:
+            ids = rename_school(r['old_school'], r['new_school'], r['staff'], r['visit_date'], dry_run=dry_run)
+            updated.update(ids)
+            details.append(dict(r, count=len(ids)))
+        body = {'ok': True, 'updated_ids': sorted(updated), 'count': len(updated), 'dry_run': dry_run}
+        if len(renames) > 1:
+            body['renames'] = details
+        return add_cors_headers(make_response(jsonify(body), 200))
     except Exception as e:
         return add_cors_headers(make_response(jsonify({'ok': False, 'error': 'db_error', 'msg': str(e)}), 500))
 
 
 @app.route('/api/events')
 def sse_events():
-    def gen(q):
+    # Last-Event-ID is sent by EventSource on reconnect; ?last_event_id= for clients that can't set headers
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    _event_tail.start()
+    if _event_tail.path is None:
+        _event_tail.poll()
+    try:
+        last_seq = int(last_id) if last_id else _sse_ring.seq
+    except ValueError:
+        last_seq = _sse_ring.seq
+    if last_seq > _sse_ring.seq:
+        # either this worker's tail is a poll behind, or the id is from another DB
+        cur = get_db().cursor()
+        cur.execute('SELECT coalesce(max(seq), 0) FROM events')
+        if last_seq > cur.fetchone()[0]:
+            last_seq = -1
+
+    def gen(last_seq):
+        token = object()
+        _sse_positions[token] = last_seq
         try:
-            # send a ping comment to keep connection alive
-            q.put(':ok\n\n')
+            yield b'retry: 3000\n:ok\n\n'
             while True:
-                try:
-                    data = q.get(timeout=25)
-                    yield data
-                except Exception:
-                    # send a keep-alive comment
-                    yield ':keep-alive\n\n'
+                frames, last_seq = _sse_ring.read_after(last_seq, SSE_KEEPALIVE_S)
+                if frames is None:
+                    # fell behind the ring buffer: tell the client to reload and drop it
+                    METRICS.inc('sse_resets_total')
+                    yield f"id: {last_seq}\nevent: reset\ndata: {{}}\n\n".encode('utf-8')
+                    return
+                _sse_positions[token] = last_seq
+                if frames:
+                    yield b''.join(frames)
+                else:
+                    yield b':keep-alive\n\n'
         finally:
-            try:
-                _sse_clients.remove(q)
-            except Exception:
-                pass
+            _sse_positions.pop(token, None)
 
-    q = Queue()
-    _sse_clients.append(q)
-    resp = app.response_class(gen(q), mimetype='text/event-stream')
+    resp = app.response_class(gen(last_seq), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
     return add_cors_headers(resp)
 
-@app.route('/')
-def index():
-    # serve the frontend input.html as root
-    resp = make_response(send_from_directory(FRONTEND_DIR, 'input.html'))
-    # force no-cache for HTML to ensure clients fetch latest after deploy
-    resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-    resp.headers['Pragma'] = 'no-cache'
-    # debugging header so browser can show which folder served the HTML
+# Static assets: strong ETags on everything, content-hashed URLs (name.<hash>.ext)
+# with a one-year max-age, and gzip/brotli variants written once to ASSET_CACHE_DIR.
+# HTML shells are rewritten to point at the hashed URLs and only revalidate.
+ASSET_CACHE_DIR = os.environ.get('ASSET_CACHE_DIR') or os.path.join(BASE_DIR, '.asset_cache')
+ASSET_HASH_LEN = 10
+ASSET_MAX_AGE = 365 * 24 * 3600
+ASSET_MIN_COMPRESS_BYTES = 1024
+ASSET_COMPRESSIBLE = ('.html', '.js', '.css', '.json', '.svg', '.csv', '.txt', '.map', '.webmanifest')
+# must keep a stable URL (service worker scope, installed PWA/TWA manifest)
+ASSET_STABLE_NAMES = {'manifest.json', 'sw.js', 'service-worker.js'}
+_HASHED_NAME = re.compile(r'^(.+)\.([0-9a-f]{%d})(\.[A-Za-z0-9]+)$' % ASSET_HASH_LEN)
+_ASSET_REF = re.compile(r"""((?:src|href)=)(["'])(/?)([^"'?#:]+?\.(?:js|css|json|svg|png|ico|webp))\2""")
+_asset_hashes = {}   # path -> ((mtime_ns, size), sha256 hex)
+_asset_lock = threading.Lock()
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+
+def asset_hash(path):
+    """sha256 of a file, cached until its mtime/size changes."""
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    hit = _asset_hashes.get(path)
+    if hit and hit[0] == key:
+        return hit[1]
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    digest = h.hexdigest()
+    with _asset_lock:
+        _asset_hashes[path] = (key, digest)
+    return digest
+
+
+def hashed_asset_name(filename):
+    """'js/app.js' -> 'js/app.<hash>.js' for an existing frontend file, else None."""
+    if os.path.basename(filename) in ASSET_STABLE_NAMES:
+        return None
+    path = safe_join(FRONTEND_DIR, filename)
+    if not path or not os.path.isfile(path):
+        return None
+    root, ext = os.path.splitext(filename)
+    return f'{root}.{asset_hash(path)[:ASSET_HASH_LEN]}{ext}'
+
+
+def rewrite_asset_refs(html, filename=''):
+    """Point src/href refs in the frontend page `filename` at hashed names.
+    Root-relative refs are looked up from FRONTEND_DIR, relative ones from the
+    page's own directory; either way only the file name part is rewritten."""
+    base = posixpath.dirname(filename)
+
+    def sub(m):
+        ref = m.group(4)
+        target = ref if m.group(3) else posixpath.normpath(posixpath.join(base, ref))
+        if target.startswith('../'):
+            return m.group(0)
+        hashed = hashed_asset_name(target)
+        if not hashed:
+            return m.group(0)
+        ref = ref[:len(ref) - len(posixpath.basename(ref))] + posixpath.basename(hashed)
+        return f'{m.group(1)}{m.group(2)}{m.group(3)}{ref}{m.group(2)}'
+    return _ASSET_REF.sub(sub, html)
+
+
+def compressed_variant(digest, source, encoding):
+    """Path of the gzip/br variant for content `digest` (source is bytes or a
+    file path), built on first use. Written to a temp name and renamed so
+    concurrent workers never see a partial file."""
+    target = os.path.join(ASSET_CACHE_DIR, f'{digest}.{encoding}')
+    if os.path.exists(target):
+        return target
+    if isinstance(source, bytes):
+        data = source
+    else:
+        with open(source, 'rb') as f:
+            data = f.read()
+    if encoding == 'br':
+        out = brotli.compress(data, quality=11)
+    else:
+        out = gzip.compress(data, compresslevel=9, mtime=0)
+    os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+    tmp = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(out)
+    os.replace(tmp, target)
+    return target
+
+
+def pick_encoding(filename, size):
+    if not filename.lower().endswith(ASSET_COMPRESSIBLE) or size < ASSET_MIN_COMPRESS_BYTES:
+        return None
+    if brotli is not None and request.accept_encodings['br'] > 0:
+        return 'br'
+    if request.accept_encodings['gzip'] > 0:
+        return 'gzip'
+    return None
+
+
+def serve_asset(filename, immutable=False, html=None):
+    """Serve a frontend file (or rewritten HTML bytes) with a strong ETag,
+    304 on If-None-Match, and a precompressed variant when the client accepts one."""
+    path = safe_join(FRONTEND_DIR, filename)
+    if not path or not os.path.isfile(path):
+        return send_from_directory(FRONTEND_DIR, filename)  # 404 as before
+    if html is not None:
+        digest = hashlib.sha256(html).hexdigest()
+        size = len(html)
+    else:
+        digest = asset_hash(path)
+        size = os.path.getsize(path)
+    encoding = pick_encoding(filename, size)
+    # strong ETags must differ per representation
+    etag = digest[:32] + ('-' + encoding if encoding else '')
+    if request.if_none_match.contains(etag):
+        resp = make_response('', 304)
+    elif encoding:
+        variant = compressed_variant(digest, html if html is not None else path, 'br' if encoding == 'br' else 'gz')
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        resp = make_response(send_file(variant, mimetype=mimetype, conditional=False, etag=False))
+        resp.headers['Content-Encoding'] = encoding
+    elif html is not None:
+        resp = make_response(html)
+        resp.mimetype = 'text/html'
+    else:
+        resp = make_response(send_file(path, conditional=False, etag=False))
+    resp.set_etag(etag)
+    if immutable:
+        resp.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    else:
+        resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['Vary'] = 'Accept-Encoding'
     try:
         resp.headers['X-Served-From'] = FRONTEND_DIR
     except Exception:
         pass
     return resp
 
+
+def serve_html_shell(filename):
+    path = safe_join(FRONTEND_DIR, filename)
+    if not path or not os.path.isfile(path):
+        return send_from_directory(FRONTEND_DIR, filename)
+    with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+        html = rewrite_asset_refs(f.read(), filename)
+    return serve_asset(filename, html=html.encode('utf-8', errors='surrogateescape'))
+
+
+@app.route('/')
+def index():
+    # serve the frontend input.html as root; the shell always revalidates (ETag -> 304)
+    return serve_html_shell('input.html')
+
 @app.route('/<path:filename>')
 def static_files(filename):
     # serve other frontend files (CSV, manifest, sw.js, etc.) from frontend dir
-    resp = make_response(send_from_directory(FRONTEND_DIR, filename))
-    # For critical assets ensure browsers don't use stale cached copies
-    if filename.endswith('.html') or filename.endswith('.js') or filename.endswith('.css') or filename == 'sw.js' or filename.endswith('.json'):
-        resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-        resp.headers['Pragma'] = 'no-cache'
-    try:
-        resp.headers['X-Served-From'] = FRONTEND_DIR
-    except Exception:
-        pass
-    return resp
+    if filename.endswith('.html'):
+        return serve_html_shell(filename)
+    m = _HASHED_NAME.match(filename)
+    if m and not os.path.isfile(safe_join(FRONTEND_DIR, filename) or ''):
+        original = m.group(1) + m.group(3)
+        current = hashed_asset_name(original)
+        if current:
+            # an outdated hash (old HTML cached somewhere) gets current content, not cached long
+            return serve_asset(original, immutable=(current == filename))
+    return serve_asset(filename)
 
 
 @app.route('/_health')
@@ -473,7 +2231,10 @@ def health():
     # simple health check for load balancers / Cloud Run
     try:
         ok = os.path.exists(DB_PATH)
-        return add_cors_headers(make_response(jsonify({'ok': True, 'db_exists': ok}), 200))
+        snapshot, age = latest_snapshot()
+        body = {'ok': True, 'db_exists': ok,
+                'snapshot': {'file': os.path.basename(snapshot), 'age_s': round(age, 1)} if snapshot else None}
+        return add_cors_headers(make_response(jsonify(body), 200))
     except Exception as e:
         return add_cors_headers(make_response(jsonify({'ok': False, 'error': str(e)}), 500))
 
@@ -0,0 +1,255 @@
+"""Single-pass aggregation over sales_logs for the backend stats endpoints.
+
+Each stored row is parsed once into a SalesRecord (date, manager, region and
+the contact / chat-invite counts the KPIs use). aggregate() then applies the
+filters and computes any set of group-bys and metrics in one pass over those
+records. RecordCache keeps the parsed lists for a few seconds, so the several
+endpoints one dashboard load calls share a single scan of the collection; a
+cached load whose query covers a narrower one (see covers()) serves it too.
+The daily_stats rollup helpers at the end let Firestore deployments read one
+document per day instead of every log.
+"""
+import threading
+import time
+from datetime import datetime
+
+from dateutil import parser as date_parser
+
+METRICS = ('visits', 'contacts', 'chat_invites')
+DIMENSIONS = ('date', 'manager', 'region')
+
+
+class SalesRecord:
+    __slots__ = ('id', 'created_at', 'payload', 'date', 'date_key', 'staff', 'manager', 'region', 'contacts',
+                 'chat_invites')
+
+    def __init__(self, **fields):
+        for k in self.__slots__:
+            setattr(self, k, fields.get(k))
+
+    @property
+    def visits(self):
+        return 1
+
+
+def parse_datetime(s):
+    """isoparse, falling back to the leading YYYY-MM-DD; None when neither parses."""
+    if not s:
+        return None
+    try:
+        return date_parser.isoparse(s)
+    except Exception:
+        try:
+            return date_parser.isoparse(s[:10])
+        except Exception:
+            return None
+
+
+def parse_query_date(s):
+    """from/to query values compare as dates (avoids tz-aware vs naive issues)."""
+    if not s:
+        return None
+    try:
+        return date_parser.isoparse(s).date()
+    except Exception:
+        return None
+
+
+def manager_of(payload):
+    """Manager a payload is counted under; stored as manager_key so Firestore can filter on it."""
+    return payload.get('manager') or payload.get('user') or 'Unknown'
+
+
+def parse_row(row):
+    """One stored sales_logs row (dict with payload / rep_date / created_at / id) -> SalesRecord.
+    Dated by rep_date (the day the log is for), which is also what Firestore
+    range queries filter on; older rows without one fall back to created_at."""
+    row = row if isinstance(row, dict) else {}
+    payload = row.get('payload') if isinstance(row.get('payload'), dict) else {}
+    date_s = row.get('rep_date') or row.get('created_at') or payload.get('visitDate')
+    date_dt = parse_datetime(date_s)
+    if date_dt is not None:
+        date_key = date_dt.isoformat()[:10]
+    elif date_s:
+        date_key = str(date_s)[:10]
+    else:
+        date_key = None  # counted under today's date, like before
+    contacts = chat_invites = 0
+    subjects = payload.get('subjects')
+    for s in (subjects if isinstance(subjects, list) else []):
+        if not isinstance(s, dict):
+            continue
+        contact = s.get('contact')
+        if isinstance(contact, str) and contact.strip():
+            contacts += 1
+        meetings = s.get('meetings')
+        for m in (meetings if isinstance(meetings, list) else []):
+            if isinstance(m, str) and '채팅' in m:
+                chat_invites += 1
+    return SalesRecord(
+        id=row.get('id'),
+        created_at=row.get('created_at'),
+        payload=payload,
+        date=date_dt.date() if date_dt is not None else None,
+        date_key=date_key,
+        staff=row.get('staff_key') or payload.get('staff') or '',
+        manager=row.get('manager_key') or manager_of(payload),
+        region=payload.get('region') or payload.get('office_of_education') or 'Unknown',
+        contacts=contacts,
+        chat_invites=chat_invites,
+    )
+
+
+def aggregate(records, date_from=None, date_to=None, manager=None, region=None, staff=None, require_date=False,
+              group_by=None, metrics=('visits',), keep_rows=False):
+    """One pass over parsed records.
+    Filters: date_from/date_to (inclusive dates; rows without a date pass unless
+    require_date), manager, region, staff. group_by maps a dimension (date, manager,
+    region) to the metrics wanted per key, or is a list of dimensions that get
+    every metric. Returns {'totals': {metric: n}, 'groups': {dim: {metric:
+    {key: n}}}, 'rows': [SalesRecord] or None}; keys with a 0 count are left out.
+    """
+    if group_by is None:
+        group_by = {}
+    elif not isinstance(group_by, dict):
+        group_by = {dim: metrics for dim in group_by}
+    today = datetime.utcnow().date().isoformat()
+    totals = dict.fromkeys(metrics, 0)
+    groups = {dim: {m: {} for m in wanted} for dim, wanted in group_by.items()}
+    plan = [(dim, m, groups[dim][m]) for dim, wanted in group_by.items() for m in wanted]
+    rows = [] if keep_rows else None
+    for r in records:
+        if r.date is None:
+            if require_date:
+                continue
+        elif (date_from and r.date < date_from) or (date_to and r.date > date_to):
+            continue
+        if (manager and r.manager != manager) or (region and r.region != region) or (staff and r.staff != staff):
+            continue
+        for m in metrics:
+            totals[m] += getattr(r, m)
+        for dim, m, bucket in plan:
+            n = getattr(r, m)
+            if n:
+                key = (r.date_key or today) if dim == 'date' else getattr(r, dim)
+                bucket[key] = bucket.get(key, 0) + n
+        if rows is not None:
+            rows.append(r)
+    return {'totals': totals, 'groups': groups, 'rows': rows}
+
+
+def covers(loaded, wanted):
+    """Whether records loaded for query `loaded` include every row query `wanted`
+    needs. A query is None (the whole collection) or a dict of date_from,
+    date_to, manager, staff, fields (None = full documents) and source
+    ('daily_stats' for rollup cells, else sales_logs)."""
+    if loaded is None:
+        return True
+    if wanted is None or loaded.get('source') != wanted.get('source'):
+        return False
+    for k in ('manager', 'staff', 'fields'):
+        if loaded.get(k) is not None and loaded.get(k) != wanted.get(k):
+            return False
+    lo, hi = loaded.get('date_from'), loaded.get('date_to')
+    if lo is not None and (wanted.get('date_from') is None or wanted['date_from'] < lo):
+        return False
+    if hi is not None and (wanted.get('date_to') is None or wanted['date_to'] > hi):
+        return False
+    return True
+
+
+class RecordCache:
+    """Parsed records shared between requests for up to ttl_s seconds, per query.
+    Loading holds the lock, so concurrent requests wait for one scan instead
+    of each starting their own."""
+
+    def __init__(self, ttl_s, max_entries=16):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = []  # (query, loaded_at, records), oldest first
+
+    def get(self, loader, query=None):
+        """(records, hit). A fresh entry whose query covers `query` is reused;
+        the caller still filters, since it may hold more rows than asked for."""
+        with self.lock:
+            now = time.monotonic()
+            self.entries = [e for e in self.entries if now - e[1] < self.ttl_s]
+            for loaded, _, records in self.entries:
+                if covers(loaded, query):
+                    return records, True
+            records = loader()
+            self.entries.append((query, time.monotonic(), records))
+            del self.entries[:-self.max_entries]
+            return records, False
+
+    def invalidate(self):
+        with self.lock:
+            self.entries = []
+
+
+# daily_stats/{YYYY-MM-DD} rollup documents: per (manager, region) cells of
+# every metric, so any stats / kpis / weekly filter and group-by can be answered
+# from one small document per day. Cells are a map keyed by cell_key(), so a
+# save can bump them with Firestore increments without reading the document.
+# Rows without a parseable date are not rolled up.
+
+class RollupCell:
+    """One daily_stats cell; aggregate() takes these in place of SalesRecords."""
+    __slots__ = ('date', 'date_key', 'staff', 'manager', 'region', 'visits', 'contacts', 'chat_invites')
+
+    def __init__(self, date, manager, region, counts):
+        self.date = date
+        self.date_key = date.isoformat()
+        self.staff = None
+        self.manager = manager
+        self.region = region
+        for m in METRICS:
+            setattr(self, m, counts.get(m) or 0)
+
+
+def cell_key(manager, region):
+    """'manager|region', with | and \\ escaped so distinct pairs never share a key."""
+    def esc(s):
+        return str(s).replace('\\', '\\\\').replace('|', '\\|')
+    return esc(manager) + '|' + esc(region)
+
+
+def apply_rollup(doc, record, sign):
+    """daily_stats document dict `doc` (None when missing) with `record` added
+    (sign 1) or taken away (sign -1). Starting from None gives the delta to
+    increment by. Cells that come to zero are dropped."""
+    doc = doc or {}
+    cells = {k: dict(c) for k, c in (doc.get('cells') or {}).items()}
+    key = cell_key(record.manager, record.region)
+    cell = cells.setdefault(key, {'manager': record.manager, 'region': record.region})
+    for m in METRICS:
+        cell[m] = (cell.get(m) or 0) + sign * getattr(record, m)
+    cells = {k: c for k, c in cells.items() if any(c.get(m) for m in METRICS)}
+    out = {'date': record.date.isoformat(), 'cells': cells}
+    for m in METRICS:
+        out[m] = sum(c.get(m) or 0 for c in cells.values())
+    return out
+
+
+def build_rollups(records, sign=1):
+    """{date: daily_stats document} for dated records; with (record, sign)
+    pairs instead, {date: delta} for a write."""
+    docs = {}
+    for item in records:
+        r, sign = item if isinstance(item, tuple) else (item, sign)
+        if r.date is not None:
+            day = r.date.isoformat()
+            docs[day] = apply_rollup(docs.get(day), r, sign)
+    return docs
+
+
+def rollup_cells(doc):
+    """daily_stats document dict -> [RollupCell]; cells counted down to zero are skipped."""
+    try:
+        day = date_parser.isoparse(doc['date']).date()
+    except Exception:
+        return []
+    cells = doc.get('cells') or {}
+    cells = cells.values() if isinstance(cells, dict) else cells  # array: before layout 2
+    return [RollupCell(day, c.get('manager'), c.get('region'), c) for c in cells if any(c.get(m) for m in METRICS)]
@@ -1,12 +1,13 @@
 import os
 import json
 import re
-from datetime import datetime
-from flask import Flask, jsonify, request, render_template, send_file
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import Flask, jsonify, request, render_template, send_file, g
 from flask import Response
 import io
 import csv
-from dateutil import parser as date_parser
 
 # Optional Firebase Admin (Firestore) integration
 USE_FIRESTORE = False
@@ -37,7 +38,71 @@ except Exception as e:
     # If firebase_admin isn't installed or initialization fails, continue with in-memory storage
     print('Firestore integration not available:', str(e))
 
+try:
+    from metrics import Metrics, COUNT_BUCKETS  # backend/ is the working dir in its container
+    from profiling import RequestProfiler, add_timing
+    from store import SalesLogStore
+    from mirror import FirestoreMirror
+    from aggregate import (RecordCache, aggregate, build_rollups, manager_of, parse_query_date, parse_row,
+                           rollup_cells)
+except ImportError:
+    from backend.metrics import Metrics, COUNT_BUCKETS
+    from backend.profiling import RequestProfiler, add_timing
+    from backend.store import SalesLogStore
+    from backend.mirror import FirestoreMirror
+    from backend.aggregate import (RecordCache, aggregate, build_rollups, manager_of, parse_query_date,
+                                   parse_row, rollup_cells)
+
 app = Flask(__name__)
+METRICS = Metrics('backend').init_app(app)
+# Server-Timing on every response; opt-in stack sampling (PROFILE_* env, see profiling.py)
+PROFILER = RequestProfiler('backend').init_app(app)
+METRICS.counter('firestore_documents_read_total', 'Firestore documents read, by route.')
+METRICS.histogram('firestore_reads_per_request', 'Firestore documents read per request.', COUNT_BUCKETS)
+METRICS.counter('stats_record_cache_total', 'Stats endpoint record loads, by result (hit = served from the shared parsed list).')
+
+
+def count_firestore_reads(n=1):
+    try:
+        g.firestore_reads = g.get('firestore_reads', 0) + n
+    except RuntimeError:
+        pass  # outside a request (scripts)
+
+
+def fs_stream(query):
+    # query.stream(), counting each document read for /metrics and timing it as `db`
+    it = iter(query.stream())
+    while True:
+        t0 = time.perf_counter()
+        try:
+            doc = next(it)
+        except StopIteration:
+            add_timing('db', time.perf_counter() - t0)
+            return
+        add_timing('db', time.perf_counter() - t0)
+        count_firestore_reads()
+        yield doc
+
+
+def fs_get(doc_ref):
+    count_firestore_reads()
+    t0 = time.perf_counter()
+    try:
+        return doc_ref.get()
+    finally:
+        add_timing('db', time.perf_counter() - t0)
+
+
+@app.after_request
+def record_firestore_reads(response):
+    if USE_FIRESTORE:
+        reads = g.pop('firestore_reads', 0)
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        if reads:
+            METRICS.inc('firestore_documents_read_total', {'route': route}, reads)
+        METRICS.observe('firestore_reads_per_request', reads, {'route': route})
+    return response
+
 
 # CORS support: restrict allowed origins to a configurable list (comma-separated env var ALLOWED_ORIGINS)
 @app.after_request
@@ -56,8 +121,192 @@ def add_cors_headers(response: Response):
     response.headers['Access-Control-Allow-Methods'] = 'GET,POST,PUT,DELETE,OPTIONS'
     return response
 
-# 임시 데이터 저장소 (메모리 기반)
-sales_logs = []
+# 임시 데이터 저장소 (메모리 기반, see store.py)
+SALES = SalesLogStore()
+
+# Parsed sales_logs shared by the stats endpoints (see aggregate.py). Writes in
+# this process drop it right away; writes from other instances show up within
+# STATS_CACHE_S seconds.
+STATS_CACHE_S = float(os.environ.get('STATS_CACHE_S') or 5)
+RECORDS = RecordCache(STATS_CACHE_S)
+
+# from/to/manager/staff become Firestore where clauses on rep_date, manager_key
+# and staff_key (indexes in firestore.indexes.json). Docs saved before
+# manager_key existed need `python backfill_sales_keys.py` first.
+FIRESTORE_PUSHDOWN = os.environ.get('FIRESTORE_PUSHDOWN', '1') != '0'
+# what parse_row reads for the stats endpoints (export / autotags need whole payloads)
+STATS_FIELDS = ('rep_date', 'created_at', 'staff_key', 'manager_key', 'payload.visitDate', 'payload.staff',
+                'payload.manager', 'payload.user', 'payload.region', 'payload.office_of_education', 'payload.subjects')
+
+
+def sales_query(date_from=None, date_to=None, manager=None, staff=None, fields=None):
+    q = db.collection('sales_logs')
+    if manager:
+        q = q.where('manager_key', '==', manager)
+    if staff:
+        q = q.where('staff_key', '==', staff)
+    if date_from:
+        q = q.where('rep_date', '>=', date_from.isoformat())
+    if date_to:
+        # exclusive next day, so a longer explicit repDate on date_to still matches
+        q = q.where('rep_date', '<', (date_to + timedelta(days=1)).isoformat())
+    if fields:
+        q = q.select(list(fields))
+    return q
+
+
+# FIRESTORE_MIRROR=1: the read endpoints answer from an on_snapshot copy of
+# sales_logs (mirror.py) once it is warm; GET /_ready is 503 until then.
+# Started on the first request rather than at import, so it runs in the
+# serving process even when gunicorn preloads the app.
+MIRROR_ENABLED = os.environ.get('FIRESTORE_MIRROR') == '1'
+MIRROR_RESYNC_S = float(os.environ.get('FIRESTORE_MIRROR_RESYNC_S') or 0)
+MIRROR = None
+_mirror_lock = threading.Lock()
+METRICS.counter('firestore_mirror_changes_total', 'Document changes applied to the sales_logs mirror, by type.')
+METRICS.gauge('firestore_mirror_ready', 'Whether this worker serves reads from the sales_logs mirror.',
+              lambda: {(('pid', str(os.getpid())),): int(mirror_ready())} if MIRROR is not None else {})
+METRICS.gauge('firestore_mirror_age_seconds', 'Seconds since the sales_logs mirror last applied a snapshot.',
+              lambda: {(('pid', str(os.getpid())),): MIRROR.age()} if mirror_ready() else {})
+
+
+@app.before_request
+def ensure_mirror():
+    global MIRROR
+    if MIRROR is None and MIRROR_ENABLED and USE_FIRESTORE and db is not None:
+        with _mirror_lock:
+            if MIRROR is None:
+                MIRROR = FirestoreMirror(db.collection('sales_logs'), resync_s=MIRROR_RESYNC_S, on_change=lambda kind, n:
+                                         METRICS.inc('firestore_mirror_changes_total', {'type': kind}, n)).start()
+
+
+def mirror_ready():
+    return MIRROR is not None and USE_FIRESTORE and MIRROR.ready()
+
+
+def load_records(date_from=None, date_to=None, manager=None, staff=None, fields=None, **_):
+    """Parsed sales_logs for the stats endpoints. With Firestore the filters are
+    applied by the query; the result may still hold more rows than asked for
+    (a cached wider load), so callers filter again through aggregate()."""
+    if not (USE_FIRESTORE and db is not None):
+        return SALES.records(date_from, date_to)  # parsed and date-indexed already
+    if mirror_ready():
+        return MIRROR.store.records(date_from, date_to)
+    query = None
+    if FIRESTORE_PUSHDOWN:
+        query = {'date_from': date_from, 'date_to': date_to, 'manager': manager, 'staff': staff, 'fields': fields}
+
+    def load():
+        q = sales_query(**query) if query else db.collection('sales_logs')
+        return [parse_row(dict(d.to_dict(), id=d.id)) for d in fs_stream(q)]
+    records, hit = RECORDS.get(load, query)
+    METRICS.inc('stats_record_cache_total', {'result': 'hit' if hit else 'miss'})
+    return records
+
+
+# daily_stats/{date} rollups (aggregate.build_rollups) are kept in step with
+# every sales_logs write. Reads switch to them once rebuild_daily_stats.py has
+# run and left its marker in meta/daily_stats.
+DAILY_STATS_READS = os.environ.get('DAILY_STATS_READS', '1') != '0'
+_daily_stats_checked = {'ready': False, 'at': 0.0}
+
+
+def daily_stats_ready():
+    if not (USE_FIRESTORE and db is not None and DAILY_STATS_READS):
+        return False
+    state = _daily_stats_checked
+    if not state['ready'] and time.monotonic() - state['at'] > 60:
+        marker = fs_get(db.collection('meta').document('daily_stats'))
+        # layout 2: cells keyed by cell_key(); older rebuilds stored them as an array
+        state['ready'] = marker.exists and (marker.to_dict() or {}).get('layout') == 2
+        state['at'] = time.monotonic()
+    return state['ready']
+
+
+def load_stats_records(date_from=None, date_to=None, **filters):
+    """Mirrored records, else rollup cells when daily_stats is ready, else parsed
+    sales_logs (STATS_FIELDS)."""
+    if mirror_ready() or not daily_stats_ready():
+        return load_records(date_from=date_from, date_to=date_to, fields=STATS_FIELDS, **filters)
+    query = {'source': 'daily_stats', 'date_from': date_from, 'date_to': date_to}
+
+    def load():
+        q = db.collection('daily_stats')
+        if date_from:
+            q = q.where('date', '>=', date_from.isoformat())
+        if date_to:
+            q = q.where('date', '<=', date_to.isoformat())
+        return [c for d in fs_stream(q) for c in rollup_cells(d.to_dict())]
+    records, hit = RECORDS.get(load, query)
+    METRICS.inc('stats_record_cache_total', {'result': 'hit' if hit else 'miss'})
+    return records
+
+
+def write_sales_doc(doc_ref, obj):
+    """Set or delete a sales_logs document and move its counts between
+    daily_stats documents, in one transaction. obj: the new dict, None to
+    delete, or a function old dict -> new dict (not called, and nothing
+    written, when the document does not exist). Only the log itself is read in
+    the transaction; the rollups are bumped with increments, so concurrent
+    saves for the same day do not conflict on its daily_stats document.
+    Returns (old dict, new dict)."""
+    @firestore.transactional
+    def run(txn):
+        snap = doc_ref.get(transaction=txn)
+        count_firestore_reads()
+        old = snap.to_dict() if snap.exists else None
+        if callable(obj):
+            if old is None:
+                return None, None
+            new = obj(old)
+        else:
+            new = obj
+        changes = [(parse_row(old), -1)] if old else []
+        if new is not None:
+            changes.append((parse_row(new), 1))
+        if new is None:
+            txn.delete(doc_ref)
+        else:
+            txn.set(doc_ref, new)
+        for day, delta in build_rollups(changes).items():
+            increments = rollup_increments(delta)
+            if increments is not None:
+                txn.set(db.collection('daily_stats').document(day), increments, merge=True)
+        return old, new
+
+    t0 = time.perf_counter()
+    try:
+        old, new = run(db.transaction())
+    finally:
+        add_timing('db', time.perf_counter() - t0)
+    if MIRROR is not None and (old is not None or not callable(obj)):
+        MIRROR.apply_local(doc_ref.id, new)
+    return old, new
+
+
+def rollup_increments(delta):
+    """build_rollups() delta document -> merge-set payload of Firestore
+    increments, or None when nothing changes (an identical re-save). `cells`
+    is left out unless some cell moves: merge-setting an empty map would
+    replace the stored cells."""
+    out = {'date': delta['date']}
+    for m in ('visits', 'contacts', 'chat_invites'):
+        if delta[m]:
+            out[m] = firestore.Increment(delta[m])
+    cells = {}
+    for key, cell in delta['cells'].items():
+        bumps = {m: firestore.Increment(cell[m]) for m in ('visits', 'contacts', 'chat_invites') if cell.get(m)}
+        if bumps:
+            cells[key] = dict(bumps, manager=cell['manager'], region=cell['region'])
+    if cells:
+        out['cells'] = cells
+    return out if len(out) > 1 else None
+
+
+def query_filters():
+    """from / to / manager / region query params as aggregate() filters."""
+    return {'date_from': parse_query_date(request.args.get('from')), 'date_to': parse_query_date(request.args.get('to')),
+            'manager': request.args.get('manager'), 'region': request.args.get('region')}
 
 # Helper to normalize timestamps for in-memory storage
 def now_iso():
@@ -67,18 +316,32 @@ def now_iso():
 def home():
     return 'CMASS SalesLog Backend Running!'
 
+
+@app.route('/_ready')
+def ready():
+    # readiness probe: 503 while the sales_logs mirror (FIRESTORE_MIRROR=1) is still loading
+    if MIRROR is not None and not MIRROR.ready():
+        return jsonify({'ready': False, 'mirror': 'loading'}), 503
+    age = MIRROR.age() if MIRROR is not None else None
+    return jsonify({'ready': True, 'mirror_age_s': round(age, 1) if age is not None else None})
+
 # 영업일지 전체 조회
 @app.route('/sales', methods=['GET'])
 def get_sales():
+    if mirror_ready():
+        # same rows and order as the query below (order_by skips docs without created_at)
+        rows = [r for r in MIRROR.store.all() if r.get('created_at') is not None]
+        rows.sort(key=lambda r: r['created_at'], reverse=True)
+        return jsonify(rows)
     if USE_FIRESTORE and db is not None:
-        docs = db.collection('sales_logs').order_by('created_at', direction=firestore.Query.DESCENDING).stream()
+        docs = fs_stream(db.collection('sales_logs').order_by('created_at', direction=firestore.Query.DESCENDING))
         results = []
         for d in docs:
             obj = d.to_dict()
             obj['id'] = d.id
             results.append(obj)
         return jsonify(results)
-    return jsonify(sales_logs)
+    return jsonify(SALES.all())
 
 
 # Compatibility endpoints for older frontend paths (/api/visits)
@@ -142,6 +405,7 @@ def add_sales():
         'payload': data,
         'created_at': now_iso(),
         'staff_key': staff,
+        'manager_key': manager_of(data if isinstance(data, dict) else {}),
         'rep_date': rep_date
     }
 
@@ -157,126 +421,47 @@ def add_sales():
         if is_delete:
             # delete the document if exists
             try:
-                doc_ref = coll.document(doc_id)
-                doc_ref.delete()
+                write_sales_doc(coll.document(doc_id), None)
+                RECORDS.invalidate()
                 return jsonify({'ok': True, 'id': doc_id, 'deleted': True}), 200
             except Exception as e:
                 return jsonify({'ok': False, 'msg': 'delete failed', 'error': str(e)}), 500
         else:
             try:
                 # overwrite (set) the document so only the latest save remains for the staff/date
-                coll.document(doc_id).set(sales_log)
+                write_sales_doc(coll.document(doc_id), sales_log)
+                RECORDS.invalidate()
                 out = sales_log.copy()
                 out['id'] = doc_id
                 return jsonify(out), 200
             except Exception as e:
                 return jsonify({'ok': False, 'msg': 'save failed', 'error': str(e)}), 500
 
-    # In-memory fallback: find existing entry for staff+rep_date and replace/delete as appropriate
-    found_idx = None
-    for i, r in enumerate(sales_logs):
-        try:
-            payload = r.get('payload', {}) if isinstance(r, dict) else {}
-            # check staff and rep_date match
-            r_staff = r.get('staff_key') or (payload.get('staff') if isinstance(payload, dict) else None)
-            r_date = r.get('rep_date') or (r.get('created_at')[:10] if r.get('created_at') else None)
-            if (r_staff == staff) and (r_date == rep_date):
-                found_idx = i
-                break
-        except Exception:
-            continue
-
+    # In-memory fallback: replace/delete the entry for staff+rep_date
     if is_delete:
-        if found_idx is not None:
-            sales_logs.pop(found_idx)
+        if SALES.delete_daily(staff, rep_date) is not None:
             return jsonify({'ok': True, 'deleted': True}), 200
         else:
             return jsonify({'ok': True, 'deleted': False, 'msg': 'no existing doc'}), 200
 
-    # upsert: replace existing or append new
-    if found_idx is not None:
-        sales_log['id'] = sales_logs[found_idx].get('id')
-        sales_logs[found_idx] = sales_log
-        return jsonify(sales_log), 200
-    else:
-        sales_log['id'] = len(sales_logs) + 1
-        sales_logs.append(sales_log)
-        return jsonify(sales_log), 201
+    # upsert: replace existing (keeping its id) or add new
+    sales_log, created = SALES.upsert_daily(sales_log)
+    return jsonify(sales_log), 201 if created else 200
 
 
 @app.route('/api/stats', methods=['GET'])
 def api_stats():
     # produce simple aggregations from in-memory or Firestore
     # Support query filters: from, to (ISO dates), manager, region
-    q_from = request.args.get('from')
-    q_to = request.args.get('to')
-    q_manager = request.args.get('manager')
-    q_region = request.args.get('region')
-
-    def parse_dt(s):
-        try:
-            return date_parser.isoparse(s)
-        except Exception:
-            return None
-
-    dt_from = parse_dt(q_from) if q_from else None
-    dt_to = parse_dt(q_to) if q_to else None
-    # normalize to date for comparisons (handles date-only or timezone-aware datetimes)
-    dt_from_date = dt_from.date() if dt_from else None
-    dt_to_date = dt_to.date() if dt_to else None
-
-    results = {
-        'total': 0,
-        'by_manager': {},
-        'by_region': {},
-        'by_date': {}
-    }
-
-    # load rows
-    if USE_FIRESTORE and db is not None:
-        docs = db.collection('sales_logs').stream()
-        rows = []
-        for d in docs:
-            obj = d.to_dict()
-            obj['id'] = d.id
-            rows.append(obj)
-    else:
-        rows = sales_logs
-
-    for r in rows:
-        payload = r.get('payload', {}) if isinstance(r, dict) else {}
-        created_s = r.get('created_at') or payload.get('visitDate')
-        created_dt = None
-        if created_s:
-            try:
-                created_dt = date_parser.isoparse(created_s)
-            except Exception:
-                # fallback: try first 10 chars as date
-                try:
-                    created_dt = date_parser.isoparse((created_s[:10]))
-                except Exception:
-                    created_dt = None
-
-        # apply filters: compare by date to avoid tz-aware vs naive issues
-        created_date = created_dt.date() if created_dt else None
-        if dt_from_date and created_date and created_date < dt_from_date:
-            continue
-        if dt_to_date and created_date and created_date > dt_to_date:
-            continue
-        manager = (payload.get('manager') or payload.get('user') or 'Unknown')
-        region = payload.get('region') or payload.get('office_of_education') or 'Unknown'
-        if q_manager and manager != q_manager:
-            continue
-        if q_region and region != q_region:
-            continue
-
-        results['total'] += 1
-        date_key = (created_dt.isoformat()[:10] if created_dt else (created_s[:10] if created_s else now_iso()[:10]))
-        results['by_manager'][manager] = results['by_manager'].get(manager, 0) + 1
-        results['by_region'][region] = results['by_region'].get(region, 0) + 1
-        results['by_date'][date_key] = results['by_date'].get(date_key, 0) + 1
-
-    return jsonify(results)
+    filters = query_filters()
+    out = aggregate(load_stats_records(**filters), group_by=('manager', 'region', 'date'), **filters)
+    groups = out['groups']
+    return jsonify({
+        'total': out['totals']['visits'],
+        'by_manager': groups['manager']['visits'],
+        'by_region': groups['region']['visits'],
+        'by_date': groups['date']['visits'],
+    })
 
 
 @app.route('/api/kpis', methods=['GET'])
@@ -293,98 +478,21 @@ def api_kpis():
       - chat_invites_total
       - chat_invites_by_date
     """
-    q_from = request.args.get('from')
-    q_to = request.args.get('to')
-    q_manager = request.args.get('manager')
-    q_region = request.args.get('region')
-
-    def parse_dt(s):
-        try:
-            return date_parser.isoparse(s)
-        except Exception:
-            return None
-
-    dt_from = parse_dt(q_from) if q_from else None
-    dt_to = parse_dt(q_to) if q_to else None
-    dt_from_date = dt_from.date() if dt_from else None
-    dt_to_date = dt_to.date() if dt_to else None
-
-    kpis = {
-        'total_visits': 0,
-        'visits_by_date': {},
-        'visits_by_manager': {},
-        'visits_by_region': {},
-        'contacts_total': 0,
-        'contacts_by_date': {},
-        'chat_invites_total': 0,
-        'chat_invites_by_date': {}
-    }
-
-    # load rows
-    if USE_FIRESTORE and db is not None:
-        docs = db.collection('sales_logs').stream()
-        rows = []
-        for d in docs:
-            obj = d.to_dict()
-            obj['id'] = d.id
-            rows.append(obj)
-    else:
-        rows = sales_logs
-
-    for r in rows:
-        payload = r.get('payload', {}) if isinstance(r, dict) else {}
-        created_s = r.get('created_at') or payload.get('visitDate')
-        created_dt = None
-        if created_s:
-            try:
-                created_dt = date_parser.isoparse(created_s)
-            except Exception:
-                try:
-                    created_dt = date_parser.isoparse(created_s[:10])
-                except Exception:
-                    created_dt = None
-
-        created_date = created_dt.date() if created_dt else None
-        if dt_from_date and created_date and created_date < dt_from_date:
-            continue
-        if dt_to_date and created_date and created_date > dt_to_date:
-            continue
-
-        manager = (payload.get('manager') or payload.get('user') or 'Unknown')
-        region = payload.get('region') or payload.get('office_of_education') or 'Unknown'
-        if q_manager and manager != q_manager:
-            continue
-        if q_region and region != q_region:
-            continue
-
-        # determine date key (YYYY-MM-DD)
-        date_key = (created_dt.isoformat()[:10] if created_dt else (created_s[:10] if created_s else now_iso()[:10]))
-
-        # increment visit counts
-        kpis['total_visits'] += 1
-        kpis['visits_by_date'][date_key] = kpis['visits_by_date'].get(date_key, 0) + 1
-        kpis['visits_by_manager'][manager] = kpis['visits_by_manager'].get(manager, 0) + 1
-        kpis['visits_by_region'][region] = kpis['visits_by_region'].get(region, 0) + 1
-
-        # contacts: count subjects with non-empty contact
-        subjects = payload.get('subjects') if isinstance(payload.get('subjects'), list) else []
-        for s in subjects:
-            contact = (s.get('contact') or '').strip() if isinstance(s, dict) else ''
-            if contact:
-                kpis['contacts_total'] += 1
-                kpis['contacts_by_date'][date_key] = kpis['contacts_by_date'].get(date_key, 0) + 1
-
-            # meetings: look for chat invite indicators (text containing '채팅')
-            meetings = s.get('meetings') if isinstance(s.get('meetings'), list) else []
-            for m in meetings:
-                try:
-                    if isinstance(m, str) and '채팅' in m:
-                        kpis['chat_invites_total'] += 1
-                        kpis['chat_invites_by_date'][date_key] = kpis['chat_invites_by_date'].get(date_key, 0) + 1
-                except Exception:
-                    continue
-
-    return jsonify(kpis)
+    filters = query_filters()
+    out = aggregate(load_stats_records(**filters), metrics=('visits', 'contacts', 'chat_invites'),
+                    group_by={'date': ('visits', 'contacts', 'chat_invites'), 'manager': ('visits',), 'region': ('visits',)},
+                    **filters)
+    totals, groups = out['totals'], out['groups']
+    return jsonify({
+        'total_visits': totals['visits'],
+        'visits_by_date': groups['date']['visits'],
+        'visits_by_manager': groups['manager']['visits'],
+        'visits_by_region': groups['region']['visits'],
+        'contacts_total': totals['contacts'],
+        'contacts_by_date': groups['date']['contacts'],
+        'chat_invites_total': totals['chat_invites'],
+        'chat_invites_by_date': groups['date']['chat_invites'],
+    })
 
 
 @app.route('/api/weekly-report', methods=['GET'])
@@ -398,110 +506,36 @@ def api_weekly_report():
     """
     q_from = request.args.get('from')
     q_to = request.args.get('to')
-
-    def parse_dt(s):
-        try:
-            return date_parser.isoparse(s)
-        except Exception:
-            return None
-
     if q_from and q_to:
-        dt_from = parse_dt(q_from)
-        dt_to = parse_dt(q_to)
+        start_date = parse_query_date(q_from)
+        end_date = parse_query_date(q_to)
     else:
         # default: last 7 days ending today (UTC)
-        today = datetime.utcnow().date()
-        dt_to = datetime.combine(today, datetime.min.time())
-        dt_from = datetime.combine(today, datetime.min.time())
-        from datetime import timedelta
-        dt_from = dt_to - timedelta(days=6)
-
-    # normalize dates
-    start_date = dt_from.date() if dt_from else None
-    end_date = dt_to.date() if dt_to else None
-
-    # reuse KPI logic but scoped to the date window
-    total_visits = 0
-    contacts_total = 0
-    chat_invites_total = 0
-    visits_by_date = {}
-    contacts_by_date = {}
-    chat_by_date = {}
-    by_manager = {}
-    by_region = {}
-
-    if USE_FIRESTORE and db is not None:
-        docs = db.collection('sales_logs').stream()
-        rows = []
-        for d in docs:
-            obj = d.to_dict()
-            obj['id'] = d.id
-            rows.append(obj)
-    else:
-        rows = sales_logs
-
-    for r in rows:
-        payload = r.get('payload', {}) if isinstance(r, dict) else {}
-        created_s = r.get('created_at') or payload.get('visitDate')
-        created_dt = None
-        if created_s:
-            try:
-                created_dt = date_parser.isoparse(created_s)
-            except Exception:
-                try:
-                    created_dt = date_parser.isoparse(created_s[:10])
-                except Exception:
-                    created_dt = None
-
-        if not created_dt:
-            continue
-        created_date = created_dt.date()
-        if start_date and created_date < start_date:
-            continue
-        if end_date and created_date > end_date:
-            continue
-
-        date_key = created_date.isoformat()
-        total_visits += 1
-        visits_by_date[date_key] = visits_by_date.get(date_key, 0) + 1
-
-        manager = (payload.get('manager') or payload.get('user') or 'Unknown')
-        region = payload.get('region') or payload.get('office_of_education') or 'Unknown'
-        by_manager[manager] = by_manager.get(manager, 0) + 1
-        by_region[region] = by_region.get(region, 0) + 1
-
-        subjects = payload.get('subjects') if isinstance(payload.get('subjects'), list) else []
-        for s in subjects:
-            contact = (s.get('contact') or '').strip() if isinstance(s, dict) else ''
-            if contact:
-                contacts_total += 1
-                contacts_by_date[date_key] = contacts_by_date.get(date_key, 0) + 1
-            meetings = s.get('meetings') if isinstance(s.get('meetings'), list) else []
-            for m in meetings:
-                try:
-                    if isinstance(m, str) and '채팅' in m:
-                        chat_invites_total += 1
-                        chat_by_date[date_key] = chat_by_date.get(date_key, 0) + 1
-                except Exception:
-                    continue
-
+        end_date = datetime.utcnow().date()
+        start_date = end_date - timedelta(days=6)
+
+    records = load_stats_records(date_from=start_date, date_to=end_date)
+    out = aggregate(records, date_from=start_date, date_to=end_date, require_date=True,
+                    metrics=('visits', 'contacts', 'chat_invites'),
+                    group_by={'date': ('visits', 'contacts', 'chat_invites'), 'manager': ('visits',), 'region': ('visits',)})
+    totals, groups = out['totals'], out['groups']
     report = {
         'period': {
             'from': start_date.isoformat() if start_date else None,
             'to': end_date.isoformat() if end_date else None
         },
         'totals': {
-            'visits': total_visits,
-            'contacts': contacts_total,
-            'chat_invites': chat_invites_total
+            'visits': totals['visits'],
+            'contacts': totals['contacts'],
+            'chat_invites': totals['chat_invites']
         },
         'by_date': {
-            'visits': visits_by_date,
-            'contacts': contacts_by_date,
-            'chat_invites': chat_by_date
+            'visits': groups['date']['visits'],
+            'contacts': groups['date']['contacts'],
+            'chat_invites': groups['date']['chat_invites']
         },
-        'by_manager': by_manager,
-        'by_region': by_region
+        'by_manager': groups['manager']['visits'],
+        'by_region': groups['region']['visits']
     }
 
     return jsonify(report)
@@ -510,76 +544,20 @@ def api_weekly_report():
 @app.route('/sales/export.csv', methods=['GET'])
 def export_csv():
     # stream CSV of stored logs with optional filters (same as /api/stats)
-    q_from = request.args.get('from')
-    q_to = request.args.get('to')
-    q_manager = request.args.get('manager')
-    q_region = request.args.get('region')
-
-    def parse_dt(s):
-        try:
-            return date_parser.isoparse(s)
-        except Exception:
-            return None
-
-    dt_from = parse_dt(q_from) if q_from else None
-    dt_to = parse_dt(q_to) if q_to else None
-    dt_from_date = dt_from.date() if dt_from else None
-    dt_to_date = dt_to.date() if dt_to else None
+    filters = query_filters()
+    filtered = aggregate(load_records(**filters), keep_rows=True, **filters)['rows']
 
-    # collect rows
-    if USE_FIRESTORE and db is not None:
-        docs = db.collection('sales_logs').stream()
-        rows = []
-        for d in docs:
-            obj = d.to_dict()
-            obj['id'] = d.id
-            rows.append(obj)
-    else:
-        rows = list(sales_logs)
-
-    # determine payload keys across filtered rows
+    # payload keys across filtered rows
     keys = set()
-    filtered = []
-    for r in rows:
-        payload = r.get('payload', {}) if isinstance(r, dict) else {}
-        created_s = r.get('created_at') or payload.get('visitDate')
-        created_dt = None
-        if created_s:
-            try:
-                created_dt = date_parser.isoparse(created_s)
-            except Exception:
-                try:
-                    created_dt = date_parser.isoparse(created_s[:10])
-                except Exception:
-                    created_dt = None
-
-        created_date = created_dt.date() if created_dt else None
-        if dt_from_date and created_date and created_date < dt_from_date:
-            continue
-        if dt_to_date and created_date and created_date > dt_to_date:
-            continue
-        manager = (payload.get('manager') or payload.get('user') or 'Unknown')
-        region = payload.get('region') or payload.get('office_of_education') or 'Unknown'
-        if q_manager and manager != q_manager:
-            continue
-        if q_region and region != q_region:
-            continue
-
-        filtered.append(r)
-        for k in payload.keys():
-            keys.add(k)
-
-    keys = sorted(list(keys))
+    for r in filtered:
+        keys.update(r.payload.keys())
+    keys = sorted(keys)
     output = io.StringIO()
     writer = csv.writer(output)
     header = ['id', 'created_at'] + keys
     writer.writerow(header)
     for r in filtered:
-        p = r.get('payload', {}) if isinstance(r, dict) else {}
-        row = [r.get('id'), r.get('created_at')]
-        for k in keys:
-            row.append(p.get(k, ''))
-        writer.writerow(row)
+        writer.writerow([r.id, r.created_at] + [r.payload.get(k, '') for k in keys])
     output.seek(0)
     return send_file(io.BytesIO(output.getvalue().encode('utf-8')), mimetype='text/csv', as_attachment=True, download_name='sales_export.csv')
 
@@ -592,15 +570,15 @@ def dashboard():
 @app.route('/sales/<int:sales_id>', methods=['GET'])
 def get_sales_log(sales_id):
     if USE_FIRESTORE and db is not None:
-        doc = db.collection('sales_logs').document(str(sales_id)).get()
+        doc = fs_get(db.collection('sales_logs').document(str(sales_id)))
         if doc.exists:
             obj = doc.to_dict()
             obj['id'] = doc.id
             return jsonify(obj)
         return jsonify({'error': 'Not found'}), 404
-    for log in sales_logs:
-        if log['id'] == sales_id:
-            return jsonify(log)
+    log = SALES.get(sales_id)
+    if log is not None:
+        return jsonify(log)
     return jsonify({'error': 'Not found'}), 404
 
 # 영업일지 수정
@@ -609,36 +587,35 @@ def update_sales_log(sales_id):
     data = request.get_json()
     if USE_FIRESTORE and db is not None:
         doc_ref = db.collection('sales_logs').document(str(sales_id))
-        doc = doc_ref.get()
-        if doc.exists:
-            update_fields = {}
-            for k in ['office_of_education','region','manager','student_count']:
-                if k in data:
-                    update_fields[k] = data[k]
-            if update_fields:
-                doc_ref.update(update_fields)
-            obj = doc_ref.get().to_dict()
-            obj['id'] = doc_ref.id
-            return jsonify(obj)
-        return jsonify({'error': 'Not found'}), 404
-    for log in sales_logs:
-        if log['id'] == sales_id:
-            log['office_of_education'] = data.get('office_of_education', log['office_of_education'])
-            log['region'] = data.get('region', log['region'])
-            log['manager'] = data.get('manager', log['manager'])
-            log['student_count'] = data.get('student_count', log['student_count'])
-            return jsonify(log)
+        update_fields = {}
+        for k in ['office_of_education','region','manager','student_count']:
+            if k in data:
+                update_fields[k] = data[k]
+        if update_fields:
+            # merged inside the transaction, against the document as it is then
+            old, obj = write_sales_doc(doc_ref, lambda old: dict(old, **update_fields))
+            RECORDS.invalidate()
+        else:
+            doc = fs_get(doc_ref)
+            obj = doc.to_dict() if doc.exists else None
+        if obj is None:
+            return jsonify({'error': 'Not found'}), 404
+        obj = dict(obj, id=doc_ref.id)
+        return jsonify(obj)
+    log = SALES.update(sales_id, {k: data[k] for k in ['office_of_education', 'region', 'manager', 'student_count']
+                                  if k in data})
+    if log is not None:
+        return jsonify(log)
     return jsonify({'error': 'Not found'}), 404
 
 # 영업일지 삭제
 @app.route('/sales/<int:sales_id>', methods=['DELETE'])
 def delete_sales_log(sales_id):
-    global sales_logs
     if USE_FIRESTORE and db is not None:
-        doc_ref = db.collection('sales_logs').document(str(sales_id))
-        doc_ref.delete()
+        write_sales_doc(db.collection('sales_logs').document(str(sales_id)), None)
+        RECORDS.invalidate()
         return jsonify({'result': 'Deleted'})
-    sales_logs = [log for log in sales_logs if log['id'] != sales_id]
+    SALES.delete(sales_id)
     return jsonify({'result': 'Deleted'})
 
 
@@ -816,62 +793,11 @@ def api_autotags():
         out = build_auto_tags(visits, max_tags=max_tags)
         return jsonify(out)
 
-    # GET: aggregate from stored logs
-    q_staff = request.args.get('staff')
-    q_from = request.args.get('from')
-    q_to = request.args.get('to')
-
-    def parse_dt(s):
-        try:
-            return date_parser.isoparse(s)
-        except Exception:
-            return None
-
-    dt_from = parse_dt(q_from) if q_from else None
-    dt_to = parse_dt(q_to) if q_to else None
-
-    visits = []
-    if USE_FIRESTORE and db is not None:
-        docs = db.collection('sales_logs').stream()
-        for d in docs:
-            obj = d.to_dict()
-            payload = obj.get('payload') or {}
-            created_s = obj.get('created_at') or payload.get('visitDate')
-            created_dt = None
-            if created_s:
-                try:
-                    created_dt = date_parser.isoparse(created_s)
-                except Exception:
-                    try:
-                        created_dt = date_parser.isoparse(created_s[:10])
-                    except Exception:
-                        created_dt = None
-            if dt_from and created_dt and created_dt < dt_from: continue
-            if dt_to and created_dt and created_dt > dt_to: continue
-            manager = (payload.get('manager') or payload.get('user') or 'Unknown')
-            if q_staff and manager != q_staff: continue
-            # normalize payload to visit-like object
-            visits.append(payload)
-    else:
-        for r in sales_logs:
-            payload = r.get('payload', {}) if isinstance(r, dict) else {}
-            created_s = r.get('created_at') or payload.get('visitDate')
-            created_dt = None
-            if created_s:
-                try:
-                    created_dt = date_parser.isoparse(created_s)
-                except Exception:
-                    try:
-                        created_dt = date_parser.isoparse(created_s[:10])
-                    except Exception:
-                        created_dt = None
-            if dt_from and created_dt and created_dt < dt_from: continue
-            if dt_to and created_dt and created_dt > dt_to: continue
-            manager = (payload.get('manager') or payload.get('user') or 'Unknown')
-            if q_staff and manager != q_staff: continue
-            visits.append(payload)
-
-    out = build_auto_tags(visits, max_tags=int(request.args.get('max_tags') or 8))
+    # GET: aggregate from stored logs (staff matches the staff_key logs are saved under)
+    filters = {'date_from': parse_query_date(request.args.get('from')), 'date_to': parse_query_date(request.args.get('to')),
+               'staff': request.args.get('staff')}
+    rows = aggregate(load_records(**filters), keep_rows=True, **filters)['rows']
+    out = build_auto_tags([r.payload for r in rows], max_tags=int(request.args.get('max_tags') or 8))
     return jsonify(out)
 
 if __name__ == '__main__':
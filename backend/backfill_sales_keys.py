@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Add the query keys (rep_date, staff_key, manager_key) to sales_logs documents
+saved before they existed, so Firestore-side filtering (FIRESTORE_PUSHDOWN)
+sees them. Safe to re-run; documents that already have all three are skipped.
+Usage:
+  python backfill_sales_keys.py            # from backend/, with FIREBASE_* set
+  python backfill_sales_keys.py --dry-run
+"""
+import argparse
+import sys
+
+import app as backend_app
+
+BATCH = 400  # Firestore allows 500 writes per batch
+
+
+def keys_for(obj):
+    payload = obj.get('payload') if isinstance(obj.get('payload'), dict) else {}
+    created = obj.get('created_at') or ''
+    visits = payload.get('visits') if isinstance(payload.get('visits'), list) else []
+    first = visits[0] if visits and isinstance(visits[0], dict) else {}
+    return {
+        'rep_date': str(payload.get('repDate') or first.get('visitDate') or payload.get('visitDate') or created)[:10],
+        'staff_key': str(payload.get('staff') or ''),
+        'manager_key': backend_app.manager_of(payload),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Backfill sales_logs query keys')
+    ap.add_argument('--dry-run', action='store_true', help='count only, write nothing')
+    args = ap.parse_args()
+    if not (backend_app.USE_FIRESTORE and backend_app.db is not None):
+        sys.exit('Firestore is not configured (FIREBASE_SERVICE_ACCOUNT / FIREBASE_CREDENTIALS_JSON)')
+
+    db = backend_app.db
+    seen = updated = 0
+    batch, pending = db.batch(), 0
+    for doc in db.collection('sales_logs').stream():
+        seen += 1
+        obj = doc.to_dict()
+        missing = {k: v for k, v in keys_for(obj).items() if k not in obj}
+        if not missing:
+            continue
+        updated += 1
+        if args.dry_run:
+            continue
+        batch.update(doc.reference, missing)
+        pending += 1
+        if pending >= BATCH:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    if pending:
+        batch.commit()
+    print(f'{seen} doc(s) scanned, {updated} {"need" if args.dry_run else "got"} keys')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""In-process Prometheus-style metrics shared by app.py and backend/app.py.
+
+Counters and histograms live in a dict per process and are flushed (at most
+every METRICS_FLUSH_S seconds, after a request) to <METRICS_DIR>/<pid>.json.
+GET /metrics reads every worker's file and sums them, so the numbers are
+correct across gunicorn workers no matter which worker answers the scrape.
+Files from exited workers keep counting towards counters/histograms; gauges
+only count live processes.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+
+from flask import Response, g, request
+
+# seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+def _key(name, labels):
+    return name + '|' + json.dumps(sorted(labels.items()) if labels else [], ensure_ascii=False)
+
+
+def _split_key(key):
+    name, labels = key.split('|', 1)
+    return name, json.loads(labels)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Metrics:
+    def __init__(self, app_name, directory=None, flush_interval=None):
+        self.app_name = app_name
+        # one directory per gunicorn master (workers share the parent pid)
+        self.directory = directory or os.environ.get('METRICS_DIR') or os.path.join(
+            tempfile.gettempdir(), f'cmass-metrics-{os.getppid()}')
+        self.flush_interval = float(flush_interval if flush_interval is not None else os.environ.get('METRICS_FLUSH_S', '1'))
+        self.help = {}
+        self.types = {}
+        self.counters = {}
+        self.hists = {}       # key -> [bucket counts..., sum, count]
+        self.buckets = {}
+        self.gauges = {}
+        self.gauge_callbacks = []
+        self.lock = threading.Lock()
+        self.last_flush = 0.0
+        atexit.register(self.flush)
+
+    # -- definition --------------------------------------------------------
+    def counter(self, name, help_text):
+        self.types[name], self.help[name] = 'counter', help_text
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.types[name], self.help[name] = 'histogram', help_text
+        self.buckets[name] = tuple(buckets)
+
+    def gauge(self, name, help_text, callback=None):
+        """callback() -> {labels_tuple_of_pairs or None: value}, evaluated at flush time."""
+        self.types[name], self.help[name] = 'gauge', help_text
+        if callback is not None:
+            self.gauge_callbacks.append((name, callback))
+
+    # -- recording ---------------------------------------------------------
+    def inc(self, name, labels=None, value=1):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        key = _key(name, labels)
+        buckets = self.buckets[name]
+        with self.lock:
+            h = self.hists.get(key)
+            if h is None:
+                h = self.hists[key] = [0] * (len(buckets) + 2)
+            for i, le in enumerate(buckets):
+                if value <= le:
+                    h[i] += 1
+                    break
+            h[-2] += value
+            h[-1] += 1
+
+    def set(self, name, value, labels=None):
+        with self.lock:
+            self.gauges[_key(name, labels)] = value
+
+    # -- cross-process -----------------------------------------------------
+    def snapshot(self):
+        for name, callback in self.gauge_callbacks:
+            try:
+                for labels, value in (callback() or {}).items():
+                    self.set(name, value, dict(labels) if labels else None)
+            except Exception:
+                pass
+        with self.lock:
+            return {'pid': os.getpid(), 'app': self.app_name, 'counters': dict(self.counters),
+                    'hists': {k: list(v) for k, v in self.hists.items()}, 'gauges': dict(self.gauges)}
+
+    def flush(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{self.app_name}-{os.getpid()}.json')
+            tmp = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f, ensure_ascii=False)
+            os.replace(tmp, path)
+            self.last_flush = time.monotonic()
+        except Exception:
+            pass
+
+    def maybe_flush(self):
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def collect(self):
+        """Sum every worker's snapshot for this app."""
+        self.flush()
+        counters, hists, gauges = {}, {}, {}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        for fn in names:
+            if not (fn.startswith(self.app_name + '-') and fn.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.directory, fn), encoding='utf-8') as f:
+                    snap = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for k, v in snap.get('counters', {}).items():
+                counters[k] = counters.get(k, 0) + v
+            for k, v in snap.get('hists', {}).items():
+                acc = hists.setdefault(k, [0] * len(v))
+                for i, x in enumerate(v):
+                    acc[i] += x
+            if snap.get('pid') == os.getpid() or _pid_alive(snap.get('pid', 0)):
+                for k, v in snap.get('gauges', {}).items():
+                    gauges[k] = gauges.get(k, 0) + v
+        return counters, hists, gauges
+
+    def render(self):
+        counters, hists, gauges = self.collect()
+        by_name = {}
+        for store in (counters, hists, gauges):
+            for k in store:
+                by_name.setdefault(_split_key(k)[0], []).append(k)
+        lines = []
+        for name in sorted(by_name):
+            kind = self.types.get(name, 'untyped')
+            if name in self.help:
+                lines.append(f'# HELP {name} {self.help[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+            for k in sorted(by_name[name]):
+                labels = dict(_split_key(k)[1])
+                labels['app'] = self.app_name
+                if k in hists:
+                    h = hists[k]
+                    cumulative = 0
+                    for le, n in zip(self.buckets.get(name, DEFAULT_BUCKETS), h):
+                        cumulative += n
+                        lines.append(f'{name}_bucket{_fmt_labels(dict(labels, le=_fmt_num(le)))} {cumulative}')
+                    lines.append(f'{name}_bucket{_fmt_labels(dict(labels, le="+Inf"))} {h[-1]}')
+                    lines.append(f'{name}_sum{_fmt_labels(labels)} {_fmt_num(h[-2])}')
+                    lines.append(f'{name}_count{_fmt_labels(labels)} {h[-1]}')
+                else:
+                    value = counters[k] if k in counters else gauges[k]
+                    lines.append(f'{name}{_fmt_labels(labels)} {_fmt_num(value)}')
+        return '\n'.join(lines) + '\n'
+
+    # -- Flask wiring ------------------------------------------------------
+    def init_app(self, app):
+        """Per-route request count/latency and the GET /metrics endpoint."""
+        self.counter('http_requests_total', 'Requests by route, method and status.')
+        self.histogram('http_request_duration_seconds', 'Time to build the response, by route.')
+
+        @app.before_request
+        def _metrics_start():
+            g._metrics_t0 = time.perf_counter()
+
+        @app.after_request
+        def _metrics_record(response):
+            t0 = g.pop('_metrics_t0', None)
+            if t0 is not None:
+                route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+                if route != '/metrics':
+                    self.inc('http_requests_total', {'route': route, 'method': request.method, 'status': str(response.status_code)})
+                    self.observe('http_request_duration_seconds', time.perf_counter() - t0, {'route': route})
+                    self.maybe_flush()
+            return response
+
+        @app.route('/metrics')
+        def metrics():
+            return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+        return self
+
+
+def _fmt_num(v):
+    return str(v) if isinstance(v, int) else repr(float(v))
+
+
+def _fmt_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for k, v in sorted(labels.items()):
+        v = str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return '{' + ','.join(parts) + '}'
@@ -0,0 +1,116 @@
+"""Live in-process copy of the sales_logs collection (FIRESTORE_MIRROR=1).
+
+An on_snapshot listener fills a SalesLogStore (store.py) with the full
+collection once, then applies each change Firestore pushes, so the read
+endpoints answer from memory instead of streaming the collection per request.
+Every listener's first snapshot replaces the store wholesale, which also
+catches up on deletes missed while a listener was down. Until that first
+snapshot arrives ready() is False and app.py reads Firestore directly.
+"""
+import threading
+import time
+
+try:
+    from store import SalesLogStore
+except ImportError:
+    from backend.store import SalesLogStore
+
+
+class FirestoreMirror:
+
+    def __init__(self, collection, store=None, resync_s=0, on_change=None):
+        self.collection = collection
+        self.store = store if store is not None else SalesLogStore()
+        self.resync_s = resync_s  # >0: re-subscribe (full reload) this often
+        self.on_change = on_change  # on_change(kind, n) per snapshot, kind ADDED/MODIFIED/REMOVED
+        self.lock = threading.Lock()
+        self.watch = None
+        self.generation = 0
+        self.first_done = False
+        self.last_snapshot = None  # time.time() of the last snapshot applied
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.subscribe()
+        if self.resync_s > 0:
+            threading.Thread(target=self._resync_loop, name='firestore-mirror-resync', daemon=True).start()
+        return self
+
+    def subscribe(self):
+        """(Re)start the listener; the store keeps serving until its first snapshot."""
+        with self.lock:
+            old = self.watch
+            self.generation += 1
+            generation = self.generation
+            self.first_done = False
+        if old is not None:
+            try:
+                old.unsubscribe()
+            except Exception:
+                pass
+        watch = self.collection.on_snapshot(lambda docs, changes, read_time:
+                                            self._on_snapshot(generation, docs, changes, read_time))
+        with self.lock:
+            if generation == self.generation:
+                self.watch = watch
+
+    def stop(self):
+        self.stopped.set()
+        with self.lock:
+            watch, self.watch = self.watch, None
+            self.generation += 1
+        if watch is not None:
+            watch.unsubscribe()
+
+    def ready(self):
+        return self.last_snapshot is not None
+
+    def age(self):
+        """Seconds since the last snapshot was applied (None before the first).
+        Snapshots only come when something changes, so this also grows while
+        the collection is quiet."""
+        return time.time() - self.last_snapshot if self.last_snapshot is not None else None
+
+    def _on_snapshot(self, generation, docs, changes, read_time):
+        counts = {}
+        with self.lock:
+            if generation != self.generation:
+                return  # a replaced listener still draining
+            first = not self.first_done
+            self.first_done = True
+            with self.store.lock:
+                if first:
+                    self.store.clear()
+                    for doc in docs:
+                        self.store.put(dict(doc.to_dict() or {}, id=doc.id))
+                    counts['ADDED'] = len(docs)
+                else:
+                    for change in changes:
+                        kind = change.type.name
+                        if kind == 'REMOVED':
+                            self.store.delete(change.document.id)
+                        else:
+                            self.store.put(dict(change.document.to_dict() or {}, id=change.document.id))
+                        counts[kind] = counts.get(kind, 0) + 1
+            self.last_snapshot = time.time()
+        if self.on_change is not None:
+            for kind, n in counts.items():
+                self.on_change(kind, n)
+
+    def apply_local(self, doc_id, obj):
+        """Mirror a write this instance just made (obj None = delete), so its
+        own next read sees it; the listener delivers the same change later."""
+        if not self.ready():
+            return
+        if obj is None:
+            self.store.delete(doc_id)
+        else:
+            self.store.put(dict(obj, id=doc_id))
+
+    def _resync_loop(self):
+        while not self.stopped.wait(self.resync_s):
+            try:
+                self.subscribe()
+            except Exception as e:
+                print('firestore mirror resync failed:', e)
+
@@ -0,0 +1,163 @@
+"""Opt-in request profiling and Server-Timing, shared by app.py and backend/app.py.
+
+- Server-Timing: every response gets db / json / serialize / app durations (ms).
+  Code adds to the current request's phases with add_timing() or `with phase(...)`.
+- Sampling profiler: a sample of requests (PROFILE_SAMPLE_RATE, 0..1), or any
+  request carrying PROFILE_HEADER from one of PROFILE_ALLOWED_IPS, is stack-sampled
+  every PROFILE_INTERVAL_MS until its response is closed (so streamed exports are
+  covered). Stacks are written in collapsed format ("a;b;c count", the input of
+  flamegraph.pl / speedscope) to PROFILE_DIR, keeping the newest PROFILE_KEEP files.
+"""
+import itertools
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, request
+from flask.json.provider import DefaultJSONProvider
+
+_current = threading.local()
+
+
+def add_timing(name, seconds):
+    timings = getattr(_current, 'timings', None)
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(name, time.perf_counter() - t0)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that books request parsing as `json` and jsonify as `serialize`."""
+
+    def loads(self, s, **kwargs):
+        with phase('json'):
+            return super().loads(s, **kwargs)
+
+    def dumps(self, obj, **kwargs):
+        with phase('serialize'):
+            return super().dumps(obj, **kwargs)
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack every `interval` seconds."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.halt = threading.Event()
+
+    def run(self):
+        while not self.halt.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            parts = []
+            while frame is not None:
+                code = frame.f_code
+                parts.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if parts:
+                self.stacks[';'.join(reversed(parts))] += 1
+
+    def stop(self):
+        self.halt.set()
+        self.join()
+        return self.stacks
+
+
+class RequestProfiler:
+    def __init__(self, app_name):
+        self.app_name = app_name
+        self.sample_rate = float(os.environ.get('PROFILE_SAMPLE_RATE') or 0)
+        self.header = os.environ.get('PROFILE_HEADER') or 'X-Debug-Profile'
+        self.allowed_ips = {ip.strip() for ip in (os.environ.get('PROFILE_ALLOWED_IPS') or '127.0.0.1,::1').split(',') if ip.strip()}
+        self.interval = float(os.environ.get('PROFILE_INTERVAL_MS') or 5) / 1000.0
+        self.directory = os.environ.get('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'cmass-profiles')
+        self.keep = int(os.environ.get('PROFILE_KEEP') or 200)
+        self.server_timing = (os.environ.get('SERVER_TIMING') or '1') != '0'
+        self.rotate_lock = threading.Lock()
+        self.seq = itertools.count(1)
+
+    def should_profile(self):
+        if request.headers.get(self.header) and request.remote_addr in self.allowed_ips:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def init_app(self, app):
+        app.json = TimedJSONProvider(app)
+
+        @app.before_request
+        def _profile_start():
+            _current.timings = {}
+            g._profile_t0 = time.perf_counter()
+            if self.should_profile():
+                sampler = StackSampler(threading.get_ident(), self.interval)
+                sampler.start()
+                g._profile_sampler = sampler
+
+        @app.after_request
+        def _profile_finish(response):
+            t0 = g.pop('_profile_t0', None)
+            timings = getattr(_current, 'timings', None) or {}
+            if self.server_timing and t0 is not None:
+                parts = [f'{name};dur={timings[name] * 1000:.1f}' for name in ('db', 'json', 'serialize') if name in timings]
+                parts.append(f'app;dur={(time.perf_counter() - t0) * 1000:.1f}')
+                response.headers['Server-Timing'] = ', '.join(parts)
+            sampler = g.pop('_profile_sampler', None)
+            if sampler is not None:
+                name = self.profile_name()
+                response.headers['X-Profile-Id'] = name
+                # stop after the body has been sent, so streamed responses are included
+                response.call_on_close(lambda: self.write(name, sampler.stop()))
+            return response
+
+        @app.teardown_request
+        def _profile_clear(exc):
+            _current.timings = None
+            sampler = g.pop('_profile_sampler', None)
+            if sampler is not None:
+                # the view raised before after_request could hand the sampler off
+                self.write(self.profile_name(), sampler.stop())
+
+        return self
+
+    def profile_name(self):
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        return f'{self.app_name}-{time.strftime("%Y%m%dT%H%M%S")}-{slug}-{os.getpid()}-{next(self.seq)}.collapsed'
+
+    def write(self, name, stacks):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f'{stack} {count}\n')
+            self.rotate()
+        except OSError:
+            pass
+
+    def rotate(self):
+        with self.rotate_lock:
+            files = [os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith('.collapsed')]
+            if len(files) <= self.keep:
+                return
+            files.sort(key=lambda p: os.path.getmtime(p))
+            for path in files[:len(files) - self.keep]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
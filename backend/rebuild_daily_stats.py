@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Rebuild the daily_stats/{YYYY-MM-DD} rollup documents from sales_logs and mark
+them ready, which switches /api/stats, /api/kpis and /api/weekly-report over
+to reading them. Saves keep them current from then on; re-run this after
+editing sales_logs outside the app. Run it while nobody is saving, because a
+save that lands during the scan can be overwritten.
+Usage:
+  python rebuild_daily_stats.py            # from backend/, with FIREBASE_* set
+  python rebuild_daily_stats.py --dry-run
+"""
+import argparse
+import sys
+
+import app as backend_app
+from aggregate import build_rollups, parse_row
+
+BATCH = 400  # Firestore allows 500 writes per batch
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Rebuild daily_stats rollup documents')
+    ap.add_argument('--dry-run', action='store_true', help='compute and print, write nothing')
+    args = ap.parse_args()
+    if not (backend_app.USE_FIRESTORE and backend_app.db is not None):
+        sys.exit('Firestore is not configured (FIREBASE_SERVICE_ACCOUNT / FIREBASE_CREDENTIALS_JSON)')
+
+    db = backend_app.db
+    records = [parse_row(d.to_dict()) for d in db.collection('sales_logs').stream()]
+    docs = build_rollups(records)
+    stale = [d.id for d in db.collection('daily_stats').stream() if d.id not in docs]
+    undated = sum(r.date is None for r in records)
+    print(f'{len(records)} log(s) -> {len(docs)} day(s); {len(stale)} stale day(s); {undated} log(s) without a date')
+    if args.dry_run:
+        return
+
+    batch, pending = db.batch(), 0
+    writes = [(day, doc) for day, doc in sorted(docs.items())] + [(day, None) for day in stale]
+    for day, doc in writes:
+        ref = db.collection('daily_stats').document(day)
+        if doc is None:
+            batch.delete(ref)
+        else:
+            batch.set(ref, doc)
+        pending += 1
+        if pending >= BATCH:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    if pending:
+        batch.commit()
+    db.collection('meta').document('daily_stats').set({
+        'rebuilt_at': backend_app.now_iso(), 'days': len(docs), 'logs': len(records), 'layout': 2})
+    print('daily_stats rebuilt and marked ready')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Indexed in-memory sales_logs for running without Firestore.
+
+Rows are kept by id, by (staff, rep_date) - the one-log-per-staff-per-day key
+add_sales upserts on - and in a bisect-sorted date index, next to their parsed
+SalesRecord, so lookups are dict hits and a date-range report only touches the
+rows in range. Ids come from a counter that never goes back, so a deleted id is
+not handed out again. One RLock guards everything (gunicorn --threads); each
+worker process still has its own store.
+"""
+import threading
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+try:
+    from aggregate import parse_row
+except ImportError:
+    from backend.aggregate import parse_row
+
+
+def daily_key(row):
+    """(staff, rep_date) a stored row is saved under."""
+    payload = row.get('payload') if isinstance(row.get('payload'), dict) else {}
+    created = row.get('created_at')
+    return (row.get('staff_key') or payload.get('staff'), row.get('rep_date') or (created[:10] if created else None))
+
+
+class SalesLogStore:
+
+    def __init__(self, rows=()):
+        self.lock = threading.RLock()
+        self.clear()
+        for row in rows:
+            self.put(dict(row)) if row.get('id') is not None else self.add(dict(row))
+
+    def clear(self):
+        with self.lock:
+            self._rows = {}       # id -> row, insertion order
+            self._records = {}    # id -> SalesRecord
+            self._by_key = {}     # daily_key -> id
+            self._dates = []      # sorted (date iso, seq, id)
+            self._date_of = {}    # id -> (date iso, seq)
+            self._undated = {}    # id -> None, rows parse_row found no date for
+            self._seq = 0
+            self.next_id = 1
+
+    def __len__(self):
+        return len(self._rows)
+
+    def all(self):
+        with self.lock:
+            return list(self._rows.values())
+
+    def get(self, log_id):
+        return self._rows.get(log_id)
+
+    def find(self, staff, rep_date):
+        with self.lock:
+            log_id = self._by_key.get((staff, rep_date))
+            return self._rows.get(log_id) if log_id is not None else None
+
+    def put(self, row):
+        """Insert or replace row by row['id']."""
+        with self.lock:
+            log_id = row['id']
+            self._unindex(log_id)
+            if isinstance(log_id, int) and log_id >= self.next_id:
+                self.next_id = log_id + 1
+            record = parse_row(row)
+            self._rows[log_id] = row
+            self._records[log_id] = record
+            self._by_key[daily_key(row)] = log_id
+            if record.date is None:
+                self._undated[log_id] = None
+            else:
+                self._seq += 1
+                entry = (record.date.isoformat(), self._seq)
+                self._date_of[log_id] = entry
+                insort(self._dates, entry + (log_id,))
+            return row
+
+    def add(self, row):
+        """Store row under the next id (set on row)."""
+        with self.lock:
+            row['id'] = self.next_id
+            return self.put(row)
+
+    def upsert_daily(self, row):
+        """Replace the row saved under row's staff_key + rep_date, keeping its id,
+        or add it. Returns (row, created)."""
+        with self.lock:
+            old = self.find(row.get('staff_key'), row.get('rep_date'))
+            if old is None:
+                return self.add(row), True
+            row['id'] = old['id']
+            return self.put(row), False
+
+    def delete_daily(self, staff, rep_date):
+        """Remove the row saved under (staff, rep_date); the removed row or None."""
+        with self.lock:
+            old = self.find(staff, rep_date)
+            return self.delete(old['id']) if old is not None else None
+
+    def update(self, log_id, fields):
+        with self.lock:
+            row = self._rows.get(log_id)
+            if row is None:
+                return None
+            return self.put(dict(row, **fields))
+
+    def delete(self, log_id):
+        """Removed row, or None if there was none."""
+        with self.lock:
+            row = self._unindex(log_id)
+            self._rows.pop(log_id, None)
+            self._records.pop(log_id, None)
+            return row
+
+    def _unindex(self, log_id):
+        row = self._rows.get(log_id)
+        if row is None:
+            return None
+        key = daily_key(row)
+        if self._by_key.get(key) == log_id:
+            del self._by_key[key]
+        self._undated.pop(log_id, None)
+        entry = self._date_of.pop(log_id, None)
+        if entry is not None:
+            del self._dates[bisect_left(self._dates, entry)]
+        return row
+
+    def records(self, date_from=None, date_to=None):
+        """Parsed records dated within [date_from, date_to] plus the undated
+        ones (aggregate() lets those through date filters)."""
+        with self.lock:
+            if date_from is None and date_to is None:
+                return list(self._records.values())
+            lo = bisect_left(self._dates, (date_from.isoformat(),)) if date_from else 0
+            hi = bisect_left(self._dates, ((date_to + timedelta(days=1)).isoformat(),)) if date_to else len(self._dates)
+            out = [self._records[e[2]] for e in self._dates[lo:hi]]
+            out.extend(self._records[i] for i in self._undated)
+            return out
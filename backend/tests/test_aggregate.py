@@ -0,0 +1,117 @@
+import werkzeug
+
+from backend import app as backend_app
+
+
+def row(i, created_at, manager, region, subjects):
+    return {'id': i, 'created_at': created_at,
+            'payload': {'manager': manager, 'region': region, 'school': f'S{i}', 'subjects': subjects}}
+
+
+ROWS = [
+    row(1, '2025-10-01T09:00:00', 'kim', 'seoul', [{'contact': '010', 'meetings': ['채팅방 초대']}, {'contact': ' '}]),
+    row(2, '2025-10-02T09:00:00+09:00', 'kim', 'busan', [{'contact': '011', 'meetings': ['방문', '채팅']}]),
+    row(3, '2025-10-09', 'lee', 'seoul', []),
+    row(4, 'not a date', 'lee', 'seoul', None),
+]
+
+
+class FakeDoc:
+    def __init__(self, r):
+        self.id = r['id']
+        self.r = {k: v for k, v in r.items() if k != 'id'}
+
+    def to_dict(self):
+        return dict(self.r)
+
+
+class FakeDb:
+    """Chains like a Firestore query, recording the clauses but returning every doc."""
+    streams = 0
+    clauses = []
+
+    def collection(self, name):
+        return self
+
+    def where(self, field, op, value):
+        FakeDb.clauses.append((field, op, value))
+        return self
+
+    def select(self, fields):
+        FakeDb.clauses.append(('select', len(fields)))
+        return self
+
+    def document(self, doc_id):
+        return self  # only meta/daily_stats is fetched: report it missing
+
+    def get(self):
+        return type('Missing', (), {'exists': False})()
+
+    def stream(self):
+        FakeDb.streams += 1
+        return iter([FakeDoc(r) for r in ROWS])
+
+
+def client(monkeypatch):
+    if not getattr(werkzeug, '__version__', None):
+        werkzeug.__version__ = '0.0.0'
+    monkeypatch.setattr(backend_app, 'SALES', backend_app.SalesLogStore(ROWS))
+    # keep these requests out of the shared registry other tests read
+    monkeypatch.setattr(backend_app.METRICS, 'counters', {})
+    monkeypatch.setattr(backend_app.METRICS, 'hists', {})
+    backend_app.RECORDS.invalidate()
+    return backend_app.app.test_client()
+
+
+def test_stats_kpis_weekly_from_one_pass(monkeypatch):
+    c = client(monkeypatch)
+    stats = c.get('/api/stats').get_json()
+    assert stats['total'] == 4
+    assert stats['by_manager'] == {'kim': 2, 'lee': 2}
+    assert stats['by_date'] == {'2025-10-01': 1, '2025-10-02': 1, '2025-10-09': 1, 'not a date': 1}
+    assert c.get('/api/stats?from=2025-10-02&to=2025-10-08').get_json()['total'] == 2  # undated row passes
+
+    kpis = c.get('/api/kpis?region=seoul').get_json()
+    assert kpis['total_visits'] == 3
+    assert kpis['contacts_total'] == 1 and kpis['contacts_by_date'] == {'2025-10-01': 1}
+    assert kpis['chat_invites_total'] == 1 and kpis['chat_invites_by_date'] == {'2025-10-01': 1}
+
+    weekly = c.get('/api/weekly-report?from=2025-10-01&to=2025-10-07').get_json()
+    assert weekly['period'] == {'from': '2025-10-01', 'to': '2025-10-07'}
+    assert weekly['totals'] == {'visits': 2, 'contacts': 2, 'chat_invites': 2}
+    assert weekly['by_region'] == {'seoul': 1, 'busan': 1}
+
+    csv = c.get('/sales/export.csv?manager=lee').get_data(as_text=True).splitlines()
+    assert csv[0] == 'id,created_at,manager,region,school,subjects' and len(csv) == 3
+
+
+def test_dashboard_endpoints_share_one_scan(monkeypatch):
+    c = client(monkeypatch)
+    monkeypatch.setattr(backend_app, 'USE_FIRESTORE', True)
+    monkeypatch.setattr(backend_app, 'db', FakeDb())
+    FakeDb.streams = 0
+    for path in ('/api/stats', '/api/kpis', '/api/weekly-report?from=2025-10-01&to=2025-10-07'):
+        assert c.get(path).status_code == 200
+    assert FakeDb.streams == 1
+
+    backend_app.RECORDS.invalidate()
+    assert c.get('/api/stats').get_json()['total'] == 4
+    assert FakeDb.streams == 2
+
+
+def test_filters_pushed_into_firestore_query(monkeypatch):
+    c = client(monkeypatch)
+    monkeypatch.setattr(backend_app, 'USE_FIRESTORE', True)
+    monkeypatch.setattr(backend_app, 'db', FakeDb())
+    FakeDb.streams, FakeDb.clauses = 0, []
+    # the fake returns every doc; the endpoint still filters what comes back
+    assert c.get('/api/stats?from=2025-10-02&to=2025-10-09&manager=lee').get_json()['total'] == 2  # + the undated row
+    assert FakeDb.clauses == [('manager_key', '==', 'lee'), ('rep_date', '>=', '2025-10-02'),
+                              ('rep_date', '<', '2025-10-10'), ('select', len(backend_app.STATS_FIELDS))]
+    # a narrower query is served from that load
+    assert c.get('/api/kpis?from=2025-10-03&to=2025-10-09&manager=lee').get_json()['total_visits'] == 2
+    assert FakeDb.streams == 1
+
+    FakeDb.clauses = []
+    c.get('/api/autotags?staff=kim&from=2025-10-01')
+    assert FakeDb.clauses == [('staff_key', '==', 'kim'), ('rep_date', '>=', '2025-10-01')]
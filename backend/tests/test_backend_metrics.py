@@ -0,0 +1,26 @@
+import werkzeug
+
+from backend import app as backend_app
+
+
+class FakeQuery:
+    def __init__(self, n):
+        self.n = n
+
+    def stream(self):
+        return iter(range(self.n))
+
+
+def test_metrics_counts_firestore_reads(tmp_path, monkeypatch):
+    if not getattr(werkzeug, '__version__', None):
+        werkzeug.__version__ = '0.0.0'
+    monkeypatch.setattr(backend_app.METRICS, 'directory', str(tmp_path))
+    monkeypatch.setattr(backend_app, 'USE_FIRESTORE', True)
+    app = backend_app.app
+    with app.test_request_context('/api/kpis'):
+        assert len(list(backend_app.fs_stream(FakeQuery(3)))) == 3
+        app.preprocess_request()
+        app.process_response(app.make_response('ok'))
+    text = app.test_client().get('/metrics').data.decode('utf-8')
+    assert 'firestore_reads_per_request_count{app="backend",route="/api/kpis"} 1' in text
+    assert 'firestore_documents_read_total{app="backend",route="/api/kpis"} 3' in text
@@ -0,0 +1,183 @@
+import os
+from datetime import date
+
+import pytest
+import werkzeug
+
+from backend import app as backend_app
+from backend.aggregate import aggregate, apply_rollup, build_rollups, parse_row, rollup_cells
+
+ROWS = [
+    {'rep_date': '2025-10-01', 'payload': {'manager': 'kim', 'region': 'seoul',
+                                           'subjects': [{'contact': '010', 'meetings': ['채팅']}]}},
+    {'rep_date': '2025-10-01', 'payload': {'manager': 'kim', 'region': 'seoul', 'subjects': []}},
+    {'rep_date': '2025-10-01', 'payload': {'manager': 'lee', 'region': 'busan'}},
+    {'rep_date': '2025-10-03', 'payload': {'user': 'lee', 'office_of_education': 'busan',
+                                           'subjects': [{'contact': '011'}, {'contact': '012'}]}},
+]
+GROUPS = {'date': ('visits', 'contacts', 'chat_invites'), 'manager': ('visits',), 'region': ('visits',)}
+METRICS = ('visits', 'contacts', 'chat_invites')
+
+
+def test_rollup_cells_aggregate_like_the_logs():
+    records = [parse_row(r) for r in ROWS]
+    cells = [c for doc in build_rollups(records).values() for c in rollup_cells(doc)]
+    assert len(cells) == 3
+    for filters in ({}, {'manager': 'lee'}, {'region': 'seoul'}, {'date_from': date(2025, 10, 2)}):
+        assert aggregate(cells, metrics=METRICS, group_by=GROUPS, **filters) == \
+            aggregate(records, metrics=METRICS, group_by=GROUPS, **filters)
+
+
+def test_apply_rollup_moves_counts():
+    first, second = parse_row(ROWS[0]), parse_row(ROWS[1])
+    doc = apply_rollup(apply_rollup(None, first, 1), second, 1)
+    assert (doc['date'], doc['visits'], doc['contacts'], doc['chat_invites']) == ('2025-10-01', 2, 1, 1)
+    doc = apply_rollup(doc, first, -1)
+    assert doc['cells'] == {'kim|seoul': {'manager': 'kim', 'region': 'seoul', 'visits': 1, 'contacts': 0,
+                                          'chat_invites': 0}}
+    assert apply_rollup(doc, second, -1) == {'date': '2025-10-01', 'cells': {}, 'visits': 0, 'contacts': 0,
+                                             'chat_invites': 0}
+
+
+class Increment:
+    def __init__(self, n):
+        self.n = n
+
+    def __eq__(self, other):
+        return isinstance(other, Increment) and other.n == self.n
+
+
+class FakeFirestore:
+    """The bits of the firestore module write_sales_doc uses; the transaction runs once."""
+    Increment = Increment
+
+    @staticmethod
+    def transactional(fn):
+        return fn
+
+
+class FakeRef:
+    def __init__(self, db, path):
+        self.db, self.path, self.id = db, path, path.split('/')[-1]
+
+    def get(self, transaction=None):
+        self.db.reads.append((self.path, transaction is not None))
+        data = self.db.docs.get(self.path)
+        return type('Snap', (), {'exists': data is not None, 'to_dict': lambda _: dict(data)})()
+
+
+def merge_into(doc, data):
+    # Firestore merge=True: nested maps merge key by key, any other value
+    # (an empty map included) replaces the field, Increment adds
+    for k, v in data.items():
+        if isinstance(v, dict) and v and isinstance(doc.get(k), dict):
+            merge_into(doc[k], v)
+        elif isinstance(v, Increment):
+            doc[k] = (doc.get(k) or 0) + v.n
+        else:
+            doc[k] = merge_into({}, v) if isinstance(v, dict) else v
+    return doc
+
+
+class FakeTxn:
+    def __init__(self, db):
+        self.db = db
+
+    def set(self, ref, data, merge=False):
+        self.db.writes.append((ref.path, data, merge))
+        self.db.docs[ref.path] = merge_into(dict(self.db.docs.get(ref.path) or {}) if merge else {}, data)
+
+    def delete(self, ref):
+        self.db.writes.append((ref.path, None, False))
+        self.db.docs.pop(ref.path, None)
+
+
+class FakeDb:
+    def __init__(self, docs):
+        self.docs, self.reads, self.writes = docs, [], []
+
+    def collection(self, name):
+        return type('Coll', (), {'document': lambda _, doc_id: FakeRef(self, f'{name}/{doc_id}')})()
+
+    def transaction(self):
+        return FakeTxn(self)
+
+
+def test_update_merges_in_transaction_and_increments_rollups(monkeypatch):
+    if not getattr(werkzeug, '__version__', None):
+        werkzeug.__version__ = '0.0.0'
+    db = FakeDb({'sales_logs/7': dict(ROWS[0], student_count=3)})
+    monkeypatch.setattr(backend_app, 'db', db)
+    monkeypatch.setattr(backend_app, 'USE_FIRESTORE', True)
+    monkeypatch.setattr(backend_app, 'firestore', FakeFirestore, raising=False)
+    body = backend_app.app.test_client().put('/sales/7', json={'region': 'busan'}).get_json()
+    assert body['region'] == 'busan' and body['student_count'] == 3 and body['id'] == '7'
+    # only the log is read, and inside the transaction; the rollup is never read
+    assert db.reads == [('sales_logs/7', True)]
+    # top-level region does not move the log between cells: no rollup write at all
+    [(log_path, log, _)] = db.writes
+    assert (log_path, log['region']) == ('sales_logs/7', 'busan')
+
+    db.writes = []
+    assert backend_app.app.test_client().delete('/sales/7').get_json() == {'result': 'Deleted'}
+    stats_path, stats, merge = db.writes[1]
+    assert (stats_path, merge) == ('daily_stats/2025-10-01', True)
+    assert stats['visits'] == Increment(-1) and stats['cells']['kim|seoul']['chat_invites'] == Increment(-1)
+    assert backend_app.app.test_client().put('/sales/8', json={'region': 'x'}).status_code == 404
+
+
+def test_identical_resave_keeps_the_day_cells(monkeypatch):
+    log = ROWS[0]
+    db = FakeDb({})
+    monkeypatch.setattr(backend_app, 'db', db)
+    monkeypatch.setattr(backend_app, 'firestore', FakeFirestore, raising=False)
+    ref = db.collection('sales_logs').document('7')
+    backend_app.write_sales_doc(ref, dict(log))
+    backend_app.write_sales_doc(db.collection('sales_logs').document('8'), dict(ROWS[2]))
+    before = db.docs['daily_stats/2025-10-01']
+    assert set(before['cells']) == {'kim|seoul', 'lee|busan'}
+
+    db.writes = []
+    backend_app.write_sales_doc(ref, dict(log))  # autosave of the same report
+    assert [w[0] for w in db.writes] == ['sales_logs/7']
+    assert db.docs['daily_stats/2025-10-01'] == before
+    # a change in one cell merges into that cell only
+    backend_app.write_sales_doc(ref, dict(log, payload=dict(log['payload'], subjects=[])))
+    after = db.docs['daily_stats/2025-10-01']
+    assert after['cells']['lee|busan'] == before['cells']['lee|busan']
+    assert (after['cells']['kim|seoul']['contacts'], after['contacts']) == (0, 0)
+
+
+@pytest.mark.skipif(not os.environ.get('FIRESTORE_EMULATOR_HOST'), reason='FIRESTORE_EMULATOR_HOST not set')
+def test_saves_keep_daily_stats_in_step(monkeypatch):
+    gfirestore = pytest.importorskip('google.cloud.firestore')
+    if not getattr(werkzeug, '__version__', None):
+        werkzeug.__version__ = '0.0.0'
+    db = gfirestore.Client(project=os.environ.get('GCLOUD_PROJECT') or 'demo-saleslog')
+    for name in ('sales_logs', 'daily_stats', 'meta'):
+        for doc in db.collection(name).stream():
+            doc.reference.delete()
+    monkeypatch.setattr(backend_app, 'db', db)
+    monkeypatch.setattr(backend_app, 'USE_FIRESTORE', True)
+    monkeypatch.setattr(backend_app, 'firestore', gfirestore, raising=False)
+    monkeypatch.setattr(backend_app, '_daily_stats_checked', {'ready': False, 'at': 0.0})
+    client = backend_app.app.test_client()
+
+    def save(staff, day, visits=1):
+        v = {'visitDate': day, 'visitStart': '09:00', 'visitEnd': '10:00', 'school': 'S'}
+        assert client.post('/sales', json={'staff': staff, 'manager': staff, 'visits': [v] * visits}).status_code == 200
+
+    for day in range(1, 11):
+        save('kim', f'2025-09-{day:02d}')
+        save('lee', f'2025-09-{day:02d}')
+    save('kim', '2025-09-01')  # overwrite: still one log for kim that day
+    client.post('/sales', json={'staff': 'lee', 'visits': []})  # deletes lee's log for today: no-op
+    client.post('/sales', json={'staff': 'lee', 'repDate': '2025-09-02', 'visits': []})
+
+    backend_app.RECORDS.invalidate()
+    from_logs = client.get('/api/kpis?from=2025-09-01&to=2025-09-05').get_json()
+    db.collection('meta').document('daily_stats').set({'rebuilt_at': 'test', 'layout': 2})
+    backend_app.RECORDS.invalidate()
+    from_rollups = client.get('/api/kpis?from=2025-09-01&to=2025-09-05').get_json()
+    assert from_rollups == from_logs
+    assert from_rollups['total_visits'] == 9 and from_rollups['visits_by_manager'] == {'kim': 5, 'lee': 4}
@@ -0,0 +1,55 @@
+"""Runs against the Firestore emulator (firebase emulators:start --only firestore,
+then FIRESTORE_EMULATOR_HOST=localhost:8080); skipped otherwise."""
+import os
+
+import pytest
+import werkzeug
+
+if not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+    pytest.skip('FIRESTORE_EMULATOR_HOST not set', allow_module_level=True)
+gfirestore = pytest.importorskip('google.cloud.firestore')
+
+from backend import app as backend_app
+
+
+@pytest.fixture
+def emulator(monkeypatch):
+    if not getattr(werkzeug, '__version__', None):
+        werkzeug.__version__ = '0.0.0'
+    db = gfirestore.Client(project=os.environ.get('GCLOUD_PROJECT') or 'demo-saleslog')
+    for doc in db.collection('sales_logs').stream():
+        doc.reference.delete()
+    monkeypatch.setattr(backend_app, 'db', db)
+    monkeypatch.setattr(backend_app, 'USE_FIRESTORE', True)
+    monkeypatch.setattr(backend_app, 'firestore', gfirestore, raising=False)
+    reads = []
+    monkeypatch.setattr(backend_app, 'count_firestore_reads', lambda n=1: reads.append(n))
+    backend_app.RECORDS.invalidate()
+    yield backend_app.app.test_client(), reads
+    for doc in db.collection('sales_logs').stream():
+        doc.reference.delete()
+
+
+def test_pushdown_reads_fewer_documents(emulator, monkeypatch):
+    client, reads = emulator
+    for day in range(1, 31):
+        for staff in ('kim', 'lee', 'park'):
+            visit = {'visitDate': f'2025-09-{day:02d}', 'visitStart': '09:00', 'visitEnd': '10:00', 'school': 'S'}
+            assert client.post('/sales', json={'staff': staff, 'manager': staff, 'visits': [visit]}).status_code == 200
+
+    def run(pushdown):
+        monkeypatch.setattr(backend_app, 'FIRESTORE_PUSHDOWN', pushdown)
+        backend_app.RECORDS.invalidate()
+        del reads[:]
+        body = client.get('/api/stats?from=2025-09-01&to=2025-09-07&manager=lee').get_json()
+        return body, len(reads)
+
+    full, full_reads = run(False)
+    pushed, pushed_reads = run(True)
+    assert pushed == full and pushed['total'] == 7
+    assert full_reads == 90 and pushed_reads == 7
+
+    del reads[:]
+    backend_app.RECORDS.invalidate()
+    assert client.get('/api/autotags?staff=park&from=2025-09-30').status_code == 200
+    assert len(reads) == 1
@@ -0,0 +1,129 @@
+import os
+import time
+
+import pytest
+import werkzeug
+
+from backend import app as backend_app
+from backend.mirror import FirestoreMirror
+
+
+class Doc:
+    def __init__(self, doc_id, data):
+        self.id, self.data = doc_id, data
+
+    def to_dict(self):
+        return dict(self.data)
+
+
+class Change:
+    def __init__(self, kind, doc):
+        self.type = type('ChangeType', (), {'name': kind})()
+        self.document = doc
+
+
+class FakeCollection:
+    """on_snapshot only: the test pushes snapshots through .listeners; anything else would be a direct read."""
+
+    def __init__(self):
+        self.listeners = []
+        self.unsubscribed = 0
+
+    def on_snapshot(self, callback):
+        self.listeners.append(callback)
+        fake = self
+        return type('Watch', (), {'unsubscribe': lambda self: setattr(fake, 'unsubscribed', fake.unsubscribed + 1)})()
+
+    def push(self, docs, changes=()):
+        self.listeners[-1](docs, list(changes), None)
+
+    def __getattr__(self, name):
+        raise AssertionError(f'direct Firestore read: {name}')
+
+
+def log(day, staff, **payload):
+    return {'rep_date': day, 'created_at': day + 'T09:00:00Z', 'staff_key': staff,
+            'payload': dict(payload, staff=staff, manager=staff)}
+
+
+def test_reads_served_from_mirror_once_warm(monkeypatch):
+    if not getattr(werkzeug, '__version__', None):
+        werkzeug.__version__ = '0.0.0'
+    coll = FakeCollection()
+    monkeypatch.setattr(backend_app, 'USE_FIRESTORE', True)
+    monkeypatch.setattr(backend_app, 'db', type('Db', (), {'collection': lambda self, name: coll})())
+    monkeypatch.setattr(backend_app, 'MIRROR_ENABLED', True)
+    monkeypatch.setattr(backend_app, 'MIRROR', None)
+    monkeypatch.setattr(backend_app.METRICS, 'counters', {})
+    monkeypatch.setattr(backend_app.METRICS, 'hists', {})
+    client = backend_app.app.test_client()
+
+    assert client.get('/_ready').status_code == 503  # the first request starts the listener
+    assert len(coll.listeners) == 1
+    docs = [Doc(f'daily|kim|2025-10-0{d}', log(f'2025-10-0{d}', 'kim')) for d in range(1, 6)]
+    docs.append(Doc('daily|lee|2025-10-02', log('2025-10-02', 'lee')))
+    coll.push(docs)
+    assert client.get('/_ready').get_json()['ready'] is True
+
+    assert client.get('/api/stats').get_json()['total'] == 6
+    kpis = client.get('/api/kpis?from=2025-10-02&to=2025-10-03').get_json()
+    assert kpis['visits_by_manager'] == {'kim': 2, 'lee': 1}
+    assert [r['id'] for r in client.get('/sales').get_json()][:2] == ['daily|kim|2025-10-05', 'daily|kim|2025-10-04']
+    assert client.get('/sales/export.csv?manager=lee').get_data(as_text=True).count('\n') == 2
+    assert client.get('/api/autotags?staff=kim').status_code == 200
+
+    coll.push([], [Change('REMOVED', docs[0]), Change('MODIFIED', Doc(docs[5].id, log('2025-10-09', 'lee'))),
+                   Change('ADDED', Doc('daily|park|2025-10-02', log('2025-10-02', 'park')))])
+    stats = client.get('/api/stats?from=2025-10-02&to=2025-10-03').get_json()
+    assert stats['by_manager'] == {'kim': 2, 'park': 1}
+
+    # a re-subscribe reloads wholesale, so changes missed in between are not kept
+    backend_app.MIRROR.subscribe()
+    assert coll.unsubscribed == 1
+    assert client.get('/api/stats').get_json()['total'] == 6  # old copy serves until the new listener's first snapshot
+    coll.push(docs[1:3])
+    assert client.get('/api/stats').get_json()['total'] == 2
+
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'firestore_mirror_changes_total{app="backend",type="REMOVED"} 1' in metrics
+    assert f'firestore_mirror_ready{{app="backend",pid="{os.getpid()}"}} 1' in metrics
+    backend_app.MIRROR.stop()
+
+
+def test_replaced_listener_is_ignored():
+    coll = FakeCollection()
+    mirror = FirestoreMirror(coll).start()
+    stale = coll.listeners[0]
+    mirror.subscribe()
+    stale([Doc('a', log('2025-10-01', 'kim'))], [], None)
+    assert not mirror.ready()
+    coll.push([Doc('b', log('2025-10-01', 'kim'))])
+    assert mirror.ready() and [r['id'] for r in mirror.store.all()] == ['b'] and mirror.age() < 5
+
+
+@pytest.mark.skipif(not os.environ.get('FIRESTORE_EMULATOR_HOST'), reason='FIRESTORE_EMULATOR_HOST not set')
+def test_mirror_follows_emulator():
+    gfirestore = pytest.importorskip('google.cloud.firestore')
+    db = gfirestore.Client(project=os.environ.get('GCLOUD_PROJECT') or 'demo-saleslog')
+    coll = db.collection('sales_logs_mirror_test')
+    for doc in coll.stream():
+        doc.reference.delete()
+    coll.document('a').set(log('2025-10-01', 'kim'))
+    mirror = FirestoreMirror(coll).start()
+
+    def wait(cond):
+        deadline = time.time() + 10
+        while time.time() < deadline and not cond():
+            time.sleep(0.05)
+        assert cond()
+    try:
+        wait(mirror.ready)
+        coll.document('b').set(log('2025-10-02', 'lee'))
+        wait(lambda: mirror.store.get('b') is not None)
+        coll.document('a').delete()
+        wait(lambda: mirror.store.get('a') is None)
+        assert [r['id'] for r in mirror.store.all()] == ['b']
+    finally:
+        mirror.stop()
+        for doc in coll.stream():
+            doc.reference.delete()
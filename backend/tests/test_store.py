@@ -0,0 +1,53 @@
+from datetime import date
+
+import werkzeug
+
+from backend import app as backend_app
+from backend.store import SalesLogStore
+
+
+def log(staff, rep_date, **payload):
+    return {'payload': dict(payload, staff=staff), 'created_at': rep_date + 'T09:00:00Z', 'staff_key': staff,
+            'rep_date': rep_date}
+
+
+def test_ids_indexes_and_date_range():
+    store = SalesLogStore()
+    for day in range(1, 11):
+        store.add(log('kim', f'2025-10-{day:02d}'))
+    undated = store.add({'payload': {}, 'staff_key': 'lee'})
+    assert [r['id'] for r in store.all()] == list(range(1, 12))
+
+    store.delete(10)
+    assert store.add(log('lee', '2025-10-10'))['id'] == 12  # deleted ids are not reused
+    assert store.find('kim', '2025-10-03')['id'] == 3 and store.find('kim', '2025-10-10') is None
+
+    in_range = store.records(date(2025, 10, 3), date(2025, 10, 5))
+    assert [r.id for r in in_range] == [3, 4, 5, undated['id']]
+    assert [r.id for r in store.records(date_from=date(2025, 10, 9))] == [9, 12, undated['id']]
+
+    row, created = store.upsert_daily(log('kim', '2025-10-03', memo='v2'))
+    assert (row['id'], created) == (3, False) and store.get(3)['payload']['memo'] == 'v2'
+    store.update(3, {'rep_date': '2025-11-01'})
+    assert store.find('kim', '2025-11-01')['id'] == 3
+    assert [r.id for r in store.records(date(2025, 10, 3), date(2025, 10, 3))] == [undated['id']]
+    assert store.delete_daily('kim', '2025-11-01')['id'] == 3 and store.get(3) is None
+    assert len(store) == 10
+
+
+def test_endpoints_use_the_store(monkeypatch):
+    if not getattr(werkzeug, '__version__', None):
+        werkzeug.__version__ = '0.0.0'
+    monkeypatch.setattr(backend_app, 'SALES', SalesLogStore())
+    client = backend_app.app.test_client()
+    visit = {'visitDate': '2025-10-01', 'visitStart': '09:00', 'visitEnd': '10:00'}
+    first = client.post('/sales', json={'staff': 'kim', 'visits': [visit]})
+    assert first.status_code == 201
+    assert client.post('/sales', json={'staff': 'lee', 'visits': [visit]}).get_json()['id'] == 2
+    assert client.post('/sales', json={'staff': 'kim', 'visits': [visit, visit]}).status_code == 200
+    assert client.delete('/sales/1').get_json() == {'result': 'Deleted'}
+    assert client.get('/sales/1').status_code == 404
+    assert client.post('/sales', json={'staff': 'kim', 'visits': [visit]}).get_json()['id'] == 3
+    assert client.put('/sales/2', json={'region': 'seoul'}).get_json()['region'] == 'seoul'
+    assert client.post('/sales', json={'staff': 'lee', 'repDate': '2025-10-01', 'visits': []}).get_json()['deleted']
+    assert [r['id'] for r in client.get('/sales').get_json()] == [3]
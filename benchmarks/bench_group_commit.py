@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+POST /api/visits under concurrent writers: one transaction per request
+(VISITS_GROUP_COMMIT=0) vs. the group-commit writer thread.
+Usage:
+  python benchmarks/bench_group_commit.py --writers 50 --seconds 10
+
+Runs against a throwaway SQLite DB in a temp dir (never visits.db), with
+payloads from benchmarks/synth_db.py. Prints p50/p95/p99 latency and
+throughput per mode, plus the average batch size the writer committed.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Benchmark group commit for POST /api/visits')
+    ap.add_argument('--writers', type=int, default=50)
+    ap.add_argument('--seconds', type=float, default=10.0)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench_visits_')
+    os.environ['VISITS_DB'] = os.path.join(tmp, 'visits.db')
+    os.environ.setdefault('METRICS_DIR', os.path.join(tmp, 'metrics'))
+    sys.path.insert(0, ROOT)
+    import app as app_module
+    from run_suite import drive
+    from synth_db import load_sources, make_payload
+
+    src = load_sources()
+    days = iter(range(10 ** 9))
+
+    def save(c, rng):
+        # a distinct day per save, so every request is an insert like an end-of-day submit
+        n = next(days)
+        day = f'{2030 + n // 336}-{n // 28 % 12 + 1:02d}-{n % 28 + 1:02d}'
+        return c.post('/api/visits', json=make_payload(rng, src, day))
+
+    def batches():
+        key = 'visits_group_commit_size|[]'
+        h = app_module.METRICS.hists.get(key)
+        return (h[-1], h[-2]) if h else (0, 0)
+
+    result = {'writers': args.writers, 'seconds': args.seconds}
+    for mode, enabled in (('per_request', False), ('group_commit', True)):
+        app_module.GROUP_COMMIT = enabled
+        random.seed(1)
+        n0, s0 = batches()
+        result[mode] = drive(app_module, save, args.writers, args.seconds)
+        n1, s1 = batches()
+        if n1 > n0:
+            result[mode]['avg_batch'] = round((s1 - s0) / (n1 - n0), 1)
+    before, after = result['per_request'], result['group_commit']
+    if before['throughput_rps']:
+        result['throughput_change'] = round(after['throughput_rps'] / before['throughput_rps'], 2)
+    print(json.dumps(result, indent=2))
+    app_module.close_db_connections()
+
+
+if __name__ == '__main__':
+    main()
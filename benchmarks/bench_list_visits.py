@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Requests/sec for a 500-row GET /api/visits page: the old json.loads + jsonify
+path vs. the current path that splices stored payload text into the response.
+Usage:
+  python benchmarks/bench_list_visits.py --rows 5000 --limit 500 --seconds 5
+
+Runs against a throwaway SQLite DB in a temp dir (never visits.db).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_payload(i):
+    return {'staff': f'담당{i % 20}', 'visits': [{
+        'visitDate': f'2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}', 'school': f'테스트{i % 300}고등학교',
+        'visitStart': '09:00', 'visitEnd': '10:00',
+        'subjects': [{'subject': s, 'teacher': f'교사{i}', 'publisher': '출판사',
+                      'conversation': '수업 자료 및 연수 일정 안내 ' * 4, 'followUp': '샘플 발송'} for s in ('국어', '수학', '영어')],
+    } for _ in range(2)]}
+
+
+def seed(app_module, n):
+    with app_module.db_transaction() as conn:
+        cur = conn.cursor()
+        for i in range(n):
+            payload = make_payload(i)
+            cur.execute('INSERT INTO visits (created_at, staff, visit_date, payload) VALUES (?, ?, ?, ?)',
+                        ('2025-01-01T00:00:00', payload['staff'], payload['visits'][0]['visitDate'],
+                         json.dumps(payload, ensure_ascii=False)))
+
+
+def legacy_list(app_module, limit):
+    # the pre-change response path: parse every payload, then jsonify re-serializes it
+    cur = app_module.get_db().cursor()
+    cur.execute('SELECT id, created_at, staff, visit_date, payload FROM visits ORDER BY id DESC LIMIT ?', (limit,))
+    out = []
+    for r in cur.fetchall():
+        try:
+            payload = json.loads(r[4]) if r[4] else None
+        except Exception:
+            payload = None
+        out.append({'id': r[0], 'created_at': r[1], 'staff': r[2], 'visit_date': r[3], 'payload': payload})
+    return app_module.jsonify({'ok': True, 'rows': out, 'next_cursor': None})
+
+
+def measure(fn, seconds):
+    fn()  # warm up
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn()
+        n += 1
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Benchmark GET /api/visits response serialization')
+    ap.add_argument('--rows', type=int, default=5000)
+    ap.add_argument('--limit', type=int, default=500)
+    ap.add_argument('--seconds', type=float, default=5.0)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench_visits_')
+    os.environ['VISITS_DB'] = os.path.join(tmp, 'visits.db')
+    sys.path.insert(0, ROOT)
+    import app as app_module
+    app_module.init_db()
+    seed(app_module, args.rows)
+
+    client = app_module.app.test_client()
+    url = f'/api/visits?limit={args.limit}'
+    with app_module.app.test_request_context(url):
+        before = measure(lambda: legacy_list(app_module, args.limit).get_data(), args.seconds)
+    after = measure(lambda: client.get(url).get_data(), args.seconds)
+    orjson_used = app_module.orjson is not None
+    app_module.orjson = None
+    after_stdlib = measure(lambda: client.get(url).get_data(), args.seconds)
+
+    print(json.dumps({
+        'rows_per_page': args.limit,
+        'before_rps': round(before, 1),
+        'after_rps': round(after, 1),
+        'after_rps_without_orjson': round(after_stdlib, 1),
+        'orjson': orjson_used,
+        'speedup': round(after / before, 2) if before else None,
+    }, indent=2))
+    app_module.close_db_connections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Synthetic-load benchmark suite for the visits API (app.py).
+Usage:
+  python benchmarks/run_suite.py --payloads 100000 --clients 8 --seconds 10 --out bench.json
+  python benchmarks/run_suite.py --db /tmp/bench/visits.db --compare old.json
+
+Builds (or reuses, with --db) a synthetic DB (see synth_db.py), then drives the
+WSGI app in-process against a throwaway copy of it (so saves and renames never
+change --db and every run starts from the same data) with --clients concurrent
+test clients per scenario: save_visits, list_visits with each filter,
+export_visits_csv, patch_school and SSE fan-out (broadcast -> delivery latency across --sse-clients listeners).
+Prints JSON with p50/p95/p99 latency (ms) and throughput per scenario.
+--compare prints the p50/p95 change against an earlier result file.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def summarize(latencies, errors, elapsed):
+    lat = sorted(latencies)
+    return {
+        'requests': len(lat),
+        'errors': errors,
+        'throughput_rps': round(len(lat) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(lat, 50) * 1000, 2) if lat else None,
+        'p95_ms': round(percentile(lat, 95) * 1000, 2) if lat else None,
+        'p99_ms': round(percentile(lat, 99) * 1000, 2) if lat else None,
+    }
+
+
+def drive(app_module, make_request, clients, seconds):
+    """Run make_request(client, rng) from `clients` threads for `seconds`.
+    make_request returns a response; status >= 400 counts as an error."""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(i):
+        client = app_module.app.test_client()
+        rng = random.Random(i)
+        local = []
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            resp = make_request(client, rng)
+            resp.get_data()
+            resp.close()
+            local.append(time.perf_counter() - t0)
+            if resp.status_code >= 400:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, errors[0], time.perf_counter() - start)
+
+
+def sample_values(app_module):
+    cur = app_module.get_db().cursor()
+    one = lambda sql: [r[0] for r in cur.execute(sql).fetchall() if r[0]]
+    return {
+        'staff': one('SELECT DISTINCT staff FROM visits LIMIT 50'),
+        'school': one('SELECT school FROM visits GROUP BY school ORDER BY count(*) DESC LIMIT 50'),
+        'region': one('SELECT DISTINCT region FROM visits LIMIT 50'),
+        'subject': one('SELECT subject FROM visit_subjects GROUP BY subject ORDER BY count(*) DESC LIMIT 20'),
+        'teacher': one('SELECT teacher FROM visit_subjects GROUP BY teacher ORDER BY count(*) DESC LIMIT 20'),
+        'publisher': one('SELECT publisher FROM visit_subjects GROUP BY publisher ORDER BY count(*) DESC LIMIT 20'),
+        'dates': one('SELECT DISTINCT visit_date FROM visits ORDER BY visit_date'),
+    }
+
+
+def list_scenarios(values):
+    from urllib.parse import quote
+
+    def pick(key):
+        return lambda c, rng: c.get(f'/api/visits?limit=50&{key}=' + quote(rng.choice(values[key])))
+
+    def date_range(c, rng):
+        i = rng.randrange(max(len(values['dates']) - 7, 1))
+        return c.get(f"/api/visits?limit=50&from={values['dates'][i]}&to={values['dates'][min(i + 7, len(values['dates']) - 1)]}")
+
+    def second_page(c, rng):
+        first = c.get('/api/visits?limit=50&sort=visit_date').get_json()
+        return c.get('/api/visits?limit=50&sort=visit_date&cursor=' + first['next_cursor'])
+
+    scenarios = {
+        'list_visits': lambda c, rng: c.get('/api/visits?limit=50'),
+        'list_visits_500': lambda c, rng: c.get('/api/visits?limit=500'),
+        'list_visits_date_range': date_range,
+        'list_visits_cursor_page2': second_page,
+        'list_visits_q': lambda c, rng: c.get('/api/visits?limit=50&q=' + quote(rng.choice(['자료', '연수', '교과서', '정보']))),
+    }
+    for key in ('staff', 'school', 'region', 'subject', 'teacher', 'publisher'):
+        if values[key]:
+            scenarios[f'list_visits_{key}'] = pick(key)
+    return scenarios
+
+
+def bench_save(app_module, src, clients, seconds):
+    from synth_db import make_payload
+
+    def save(c, rng):
+        # far-future dates so saves are inserts, like new daily reports
+        day = f'2030-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}'
+        return c.post('/api/visits', json=make_payload(rng, src, day))
+    return drive(app_module, save, clients, seconds)
+
+
+def bench_patch_school(app_module, values, clients, seconds):
+    schools = values['school'][:max(clients, 1)]
+    state, owner, lock = {}, {}, threading.Lock()
+
+    def rename(c, rng):
+        # each client flips its own school name back and forth
+        with lock:
+            school = owner.setdefault(id(c), schools[len(owner) % len(schools)])
+            cur = state.get(school, school)
+            new = school + '_' if cur == school else school
+            state[school] = new
+        return c.post('/api/visits/patch_school', json={'old_school': cur, 'new_school': new})
+    result = drive(app_module, rename, clients, seconds)
+    for school, cur in state.items():
+        if cur != school:
+            app_module.rename_school(cur, school)
+    return result
+
+
+def bench_sse(app_module, listeners, events):
+    """Broadcast `events` events; each listener records broadcast -> receive latency."""
+    latencies, lock = [], threading.Lock()
+    ready = threading.Barrier(listeners + 1)
+
+    def listen():
+        resp = app_module.app.test_client().get('/api/events', buffered=False)
+        it = iter(resp.response)
+        next(it)  # retry/ok preamble
+        ready.wait()
+        seen = 0
+        local = []
+        deadline = time.perf_counter() + 30
+        while seen < events and time.perf_counter() < deadline:
+            chunk = next(it).decode('utf-8')
+            now = time.perf_counter()
+            for line in chunk.splitlines():
+                if line.startswith('data: ') and '"bench_t"' in line:
+                    local.append(now - json.loads(line[6:])['bench_t'])
+                    seen += 1
+        resp.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=listen) for _ in range(listeners)]
+    for t in threads:
+        t.start()
+    ready.wait()
+    start = time.perf_counter()
+    for i in range(events):
+        app_module.sse_broadcast('bench', {'i': i, 'bench_t': time.perf_counter()})
+        time.sleep(0.002)
+    for t in threads:
+        t.join()
+    out = summarize(latencies, listeners * events - len(latencies), time.perf_counter() - start)
+    out['listeners'] = listeners
+    return out
+
+
+def copy_db(src_path, dst_path):
+    """Consistent copy of a (possibly WAL-mode) SQLite DB via the backup API."""
+    src, dst = sqlite3.connect(src_path), sqlite3.connect(dst_path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def git_rev():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(result, old_path):
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    lines = []
+    for name, cur in result['scenarios'].items():
+        prev = old.get('scenarios', {}).get(name)
+        if not prev:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            if prev.get(key) and cur.get(key):
+                change = (cur[key] - prev[key]) / prev[key] * 100
+                lines.append(f'{name:32s} {key}: {prev[key]:9.2f} -> {cur[key]:9.2f} ({change:+.1f}%)')
+    return '\n'.join(lines)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='visits API benchmark suite')
+    ap.add_argument('--db', help='existing synthetic DB to reuse (default: build one in a temp dir)')
+    ap.add_argument('--payloads', type=int, default=100000, help='payloads to generate when building a DB')
+    ap.add_argument('--clients', type=int, default=8)
+    ap.add_argument('--seconds', type=float, default=10.0, help='duration per scenario')
+    ap.add_argument('--sse-clients', type=int, default=50)
+    ap.add_argument('--sse-events', type=int, default=200)
+    ap.add_argument('--only', help='comma-separated scenario name prefixes')
+    ap.add_argument('--out', help='write the JSON result here as well')
+    ap.add_argument('--compare', help='earlier result JSON to diff against')
+    args = ap.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_visits_')
+    run_path = os.path.join(work_dir, 'visits.db')
+    db_path = os.path.abspath(args.db) if args.db else run_path
+    build = not os.path.exists(db_path)
+    if not build:
+        copy_db(db_path, run_path)
+    os.environ['VISITS_DB'] = db_path if build else run_path
+    os.environ.setdefault('METRICS_DIR', os.path.join(work_dir, 'metrics'))
+    sys.path.insert(0, ROOT)
+    import app as app_module
+    from synth_db import generate, load_sources
+
+    t0 = time.perf_counter()
+    src = generate(app_module, args.payloads, log=None) if build else load_sources()
+    build_s = time.perf_counter() - t0
+    if db_path != run_path and build:
+        # keep the freshly built --db for reuse; the scenarios write to a copy
+        app_module.close_db_connections()
+        copy_db(db_path, run_path)
+        app_module.DB_PATH = run_path
+    values = sample_values(app_module)
+    wanted = [p for p in (args.only or '').split(',') if p]
+    run = lambda name: not wanted or any(name.startswith(p) for p in wanted)
+
+    scenarios = {}
+    for name, fn in list_scenarios(values).items():
+        if run(name):
+            scenarios[name] = drive(app_module, fn, args.clients, args.seconds)
+    if run('export_visits_csv'):
+        staff = values['staff'][0] if values['staff'] else ''
+        scenarios['export_visits_csv_staff_month'] = drive(
+            app_module, lambda c, rng: c.get(f'/api/visits/export?staff={staff}&from=2025-10-01&to=2025-10-31'),
+            args.clients, args.seconds)
+        scenarios['export_visits_csv_full'] = drive(app_module, lambda c, rng: c.get('/api/visits/export'), 1, args.seconds)
+    if run('save_visits'):
+        scenarios['save_visits'] = bench_save(app_module, src, args.clients, args.seconds)
+    if run('patch_school'):
+        scenarios['patch_school'] = bench_patch_school(app_module, values, args.clients, args.seconds)
+    if run('sse_fanout'):
+        scenarios['sse_fanout'] = bench_sse(app_module, args.sse_clients, args.sse_events)
+
+    cur = app_module.get_db().cursor()
+    result = {
+        'commit': git_rev(),
+        'db': db_path,
+        'payloads': cur.execute('SELECT count(*) FROM visits').fetchone()[0],
+        'build_seconds': round(build_s, 1) if build else None,
+        'clients': args.clients,
+        'seconds_per_scenario': args.seconds,
+        'scenarios': scenarios,
+    }
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    print(text)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    if args.compare:
+        print(compare(result, args.compare), file=sys.stderr)
+    app_module.close_db_connections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Generate a realistic synthetic visits.db for benchmarks.
+Usage:
+  python benchmarks/synth_db.py --out /tmp/bench/visits.db --payloads 100000
+
+Schools, regions and the staff owning each school come from sales_staff.csv;
+subject / publisher / teacher / memo text and visit lengths are drawn from the
+distributions in kakao_entries.normalized.jsonl. Payloads go through the same
+upsert_visit() as POST /api/visits, so every index, FTS table and rollup is
+populated exactly as in production.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_sources(root=ROOT, staff_multiplier=1):
+    schools_by_staff = defaultdict(list)
+    with open(os.path.join(root, 'sales_staff.csv'), encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            if row.get('학교명') and row.get('담당자'):
+                schools_by_staff[row['담당자'].strip()].append((row['학교명'].strip(), (row.get('지역') or '').strip()))
+    entries = []
+    with open(os.path.join(root, 'kakao_entries.normalized.jsonl'), encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entries.append(json.loads(line))
+    staff_weights = Counter(e.get('staff') for e in entries)
+    # --staff-multiplier: split each real staff member's schools across N synthetic staff
+    if staff_multiplier > 1:
+        split = {}
+        for staff, schools in schools_by_staff.items():
+            for i in range(staff_multiplier):
+                split[f'{staff}{i + 1}'] = schools[i::staff_multiplier]
+                staff_weights[f'{staff}{i + 1}'] = staff_weights.get(staff, 1)
+        schools_by_staff = {k: v for k, v in split.items() if v}
+    subjects = [e for e in entries if e.get('subject')]
+    return {
+        'schools_by_staff': dict(schools_by_staff),
+        'staff': list(schools_by_staff),
+        'staff_weights': [staff_weights.get(s, 1) or 1 for s in schools_by_staff],
+        'subject_rows': subjects,
+        'durations': [int(e['visitDurationMinutes']) for e in entries if str(e.get('visitDurationMinutes') or '').isdigit()] or [60],
+    }
+
+
+def make_payload(rng, src, day):
+    staff = rng.choices(src['staff'], weights=src['staff_weights'])[0]
+    schools = src['schools_by_staff'][staff]
+    visits = []
+    minute = 9 * 60
+    for school, region in rng.sample(schools, min(len(schools), rng.choice((1, 1, 2, 2, 3, 4)))):
+        length = rng.choice(src['durations'])
+        subs = []
+        for e in rng.sample(src['subject_rows'], rng.choice((1, 1, 1, 2))):
+            subs.append({'subject': e['subject'], 'teacher': e.get('teacher') or '', 'publisher': e.get('publisher') or '',
+                         'conversation': (e.get('conversation') or '')[:400], 'followUp': e.get('followUp') or ''})
+        visits.append({'visitDate': day, 'school': school, 'region': region,
+                       'visitStart': f'{minute // 60:02d}:{minute % 60:02d}',
+                       'visitEnd': f'{(minute + length) // 60 % 24:02d}:{(minute + length) % 60:02d}',
+                       'subjects': subs})
+        minute += length + rng.choice((10, 20, 30, 40))
+    return {'staff': staff, 'visitDate': day, 'visits': visits}
+
+
+def generate(app_module, payloads, seed=7, days=365, chunk=2000, staff_multiplier=1, log=print):
+    rng = random.Random(seed)
+    src = load_sources(staff_multiplier=staff_multiplier)
+    start = date(2025, 3, 1)
+    t0 = time.perf_counter()
+    done = 0
+    while done < payloads:
+        n = min(chunk, payloads - done)
+        with app_module.db_transaction() as conn:
+            cur = conn.cursor()
+            for _ in range(n):
+                day = (start + timedelta(days=rng.randrange(days))).isoformat()
+                app_module.upsert_visit(cur, make_payload(rng, src, day))
+        done += n
+        if log:
+            log(f'{done}/{payloads} payloads ({done / (time.perf_counter() - t0):.0f}/s)')
+    return src
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Generate a synthetic visits.db')
+    ap.add_argument('--out', required=True, help='DB path to create (must not exist)')
+    ap.add_argument('--payloads', type=int, default=100000)
+    ap.add_argument('--seed', type=int, default=7)
+    ap.add_argument('--staff-multiplier', type=int, default=1, help='split each real staff into N synthetic staff')
+    args = ap.parse_args()
+    if os.path.exists(args.out):
+        sys.exit(f'{args.out} already exists')
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    os.environ['VISITS_DB'] = os.path.abspath(args.out)
+    sys.path.insert(0, ROOT)
+    import app as app_module
+    generate(app_module, args.payloads, seed=args.seed, staff_multiplier=args.staff_multiplier)
+    app_module.close_db_connections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+# gunicorn picks this file up automatically from the working directory.
+# Settings passed on the command line (see Dockerfile) still take precedence.
+import os
+
+# Only sync or gthread workers: app.py keeps one SQLite connection per thread
+# and runs its writer, event tail and backfill as real threads, none of which
+# is safe under gevent/eventlet (per-greenlet connections that are never
+# closed, blocking sqlite calls stalling the hub). /api/events holds a
+# connection open per client, and each idle SSE client pins a gthread thread,
+# so size --threads (Dockerfile) for the SSE clients a worker should carry.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class not in ('sync', 'gthread'):
+    raise RuntimeError(f'GUNICORN_WORKER_CLASS={worker_class!r}: use sync or gthread (see gunicorn.conf.py)')
+# keep-alive comments go out every SSE_KEEPALIVE_S (25s), well inside this
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+
+
+def worker_exit(server, worker):
+    # close the per-thread SQLite connections opened by app.get_db()
+    try:
+        from app import close_db_connections
+        close_db_connections()
+    except Exception as e:
+        server.log.warning('closing SQLite connections failed: %s', e)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Precompute content hashes and gzip/brotli variants for the frontend files
+served by app.py, so the first request after a deploy doesn't pay for it.
+Usage:
+  python scripts/build_assets.py            # FRONTEND_DIR top level
+  python scripts/build_assets.py --recursive public
+
+Notes:
+- Variants land in ASSET_CACHE_DIR (default ./.asset_cache), named by content hash.
+- brotli variants are built only when the `brotli` package is installed.
+- HTML files are rewritten to hashed asset URLs first, exactly as served.
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SKIP_DIRS = {'.git', '.asset_cache', 'node_modules', '__pycache__', 'backups', 'archive', 'android-wrapper'}
+
+
+def iter_files(base, subdirs, recursive):
+    for sub in subdirs or ['']:
+        top = os.path.join(base, sub)
+        for dirpath, dirnames, filenames in os.walk(top):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS] if recursive else []
+            for name in filenames:
+                yield os.path.relpath(os.path.join(dirpath, name), base).replace(os.sep, '/')
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Build hashed/precompressed static asset variants')
+    ap.add_argument('dirs', nargs='*', help='subdirectories of FRONTEND_DIR (default: top level only)')
+    ap.add_argument('--recursive', action='store_true', help='descend into subdirectories')
+    args = ap.parse_args()
+
+    sys.path.insert(0, ROOT)
+    import app as visits_app
+
+    encodings = ['gz'] + (['br'] if visits_app.brotli is not None else [])
+    built = 0
+    for rel in iter_files(visits_app.FRONTEND_DIR, args.dirs, args.recursive):
+        path = os.path.join(visits_app.FRONTEND_DIR, rel)
+        if not rel.lower().endswith(visits_app.ASSET_COMPRESSIBLE):
+            continue
+        if rel.lower().endswith('.html'):
+            with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+                source = visits_app.rewrite_asset_refs(f.read(), rel).encode('utf-8', errors='surrogateescape')
+            digest = visits_app.hashlib.sha256(source).hexdigest()
+        else:
+            source = path
+            digest = visits_app.asset_hash(path)
+        size = len(source) if isinstance(source, bytes) else os.path.getsize(path)
+        if size < visits_app.ASSET_MIN_COMPRESS_BYTES:
+            continue
+        for enc in encodings:
+            visits_app.compressed_variant(digest, source, enc)
+        built += 1
+        print(f'{rel} -> {visits_app.hashed_asset_name(rel) or rel}')
+    print(f'{built} file(s) precompressed into {visits_app.ASSET_CACHE_DIR} ({", ".join(encodings)})')
+    visits_app.close_db_connections()
+
+
+if __name__ == '__main__':
+    main()
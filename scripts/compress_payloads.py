@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Compress stored visits.db payloads with a zstd dictionary trained on them
+(needs `pip install zstandard`; see pack_payload in app.py).
+Usage:
+  python scripts/compress_payloads.py stats      --db ./visits.db
+  python scripts/compress_payloads.py train      --db ./visits.db [--samples 5000] [--dict-kb 64]
+  python scripts/compress_payloads.py compress   --db ./visits.db [--vacuum]
+  python scripts/compress_payloads.py decompress --db ./visits.db [--vacuum]
+
+train       trains a dictionary on the newest payloads; new writes use it when
+            the app runs with VISITS_PAYLOAD_COMPRESSION=zstd
+compress    rewrites every text payload (and payloads packed with an older
+            dictionary) with the newest dictionary, in short transactions;
+            retrain + compress to move everything onto a fresh dictionary
+decompress  turns every payload back into plain JSON text
+stats       payload sizes by format, DB file size and full-scan throughput
+--vacuum    rebuilds the file afterwards so freed pages are returned to the OS
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def stats(visits_app):
+    conn = visits_app.get_db()
+    for kind, n, size in conn.execute('SELECT typeof(payload), count(*), coalesce(sum(length(payload)), 0) '
+                                      'FROM visits GROUP BY 1 ORDER BY 1'):
+        print(f'{kind:5s} payloads: {n} row(s), {size / 1e6:.1f} MB stored')
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    pages = conn.execute('PRAGMA page_count').fetchone()[0]
+    free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    print(f'file: {pages * page_size / 1e6:.1f} MB ({free * page_size / 1e6:.1f} MB free pages)')
+
+    # Python scan: what export / backfills do per row
+    t0 = time.perf_counter()
+    rows = json_bytes = 0
+    for (stored,) in conn.execute('SELECT payload FROM visits'):
+        text = visits_app.unpack_payload(stored)
+        if text:
+            json.loads(text)
+            json_bytes += len(text)
+        rows += 1
+    elapsed = time.perf_counter() - t0
+    print(f'python scan: {rows / elapsed:.0f} rows/s, {json_bytes / 1e6 / elapsed:.1f} MB/s of JSON ({elapsed:.2f}s)')
+    # SQL JSON1 scan: what rollup rebuilds do per row
+    t0 = time.perf_counter()
+    conn.execute("SELECT sum(json_array_length(" + visits_app.payload_sql() + ", '$.visits')) FROM visits").fetchone()
+    elapsed = time.perf_counter() - t0
+    print(f'sql scan: {rows / elapsed:.0f} rows/s ({elapsed:.2f}s)')
+
+
+def main():
+    ap = argparse.ArgumentParser(description='zstd dictionary compression for visits.db payloads')
+    ap.add_argument('command', choices=('stats', 'train', 'compress', 'decompress'))
+    ap.add_argument('--db', help='SQLite DB path (default: VISITS_DB or ./visits.db)')
+    ap.add_argument('--samples', type=int, default=5000, help='newest payloads to train on')
+    ap.add_argument('--dict-kb', type=int, default=64, help='dictionary size')
+    ap.add_argument('--chunk-rows', type=int, help='rows per write transaction')
+    ap.add_argument('--pause', type=float, help='seconds to sleep between chunks')
+    ap.add_argument('--vacuum', action='store_true', help='VACUUM afterwards')
+    args = ap.parse_args()
+
+    if args.db:
+        os.environ['VISITS_DB'] = os.path.abspath(args.db)
+    os.environ['VISITS_BACKFILL'] = '0'
+    sys.path.insert(0, ROOT)
+    import app as visits_app
+
+    try:
+        if args.command == 'train':
+            dict_id = visits_app.train_payload_dict(args.samples, args.dict_kb * 1024)
+            print(f'trained dictionary {dict_id}')
+        elif args.command in ('compress', 'decompress'):
+            n = visits_app.repack_payloads(compress=args.command == 'compress', chunk_rows=args.chunk_rows,
+                                           pause_s=args.pause, log=print)
+            print(f'{n} payload(s) rewritten')
+            if args.vacuum:
+                t0 = time.perf_counter()
+                visits_app.get_db().execute('VACUUM')
+                print(f'vacuumed in {time.perf_counter() - t0:.1f}s')
+        stats(visits_app)
+    finally:
+        visits_app.close_db_connections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Inspect and run visits.db schema migrations (app.MIGRATIONS) and backfills.
+Usage:
+  python scripts/migrate.py status  --db ./visits.db
+  python scripts/migrate.py run     --db ./visits.db [--chunk-rows 500] [--pause 0.05]
+  python scripts/migrate.py dry-run --db ./visits.db
+
+status   schema version, pending migrations and backfill progress
+run      apply pending migrations, then run the backfills in the foreground
+         (the app does this itself at startup / in a background thread)
+dry-run  copy the DB (sqlite backup API, safe while the app is running) to a
+         temp dir and run the migrations and backfills against the copy,
+         reporting how long each step took; the real DB is not touched
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def status(visits_app):
+    cur = visits_app.get_db().cursor()
+    print(f'db: {visits_app.DB_PATH}')
+    print(f'schema version: {visits_app.schema_version(cur)} (latest {visits_app.MIGRATIONS[-1][0]})')
+    for version, description, _ in visits_app.pending_migrations(cur):
+        print(f'  pending v{version}: {description}')
+    try:
+        rows = cur.execute('SELECT name, position, done, updated_at FROM schema_backfills ORDER BY name').fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    for name, position, done, updated_at in rows:
+        state = 'done' if done else ('not started' if position is None else f'at id {position}')
+        print(f'  backfill {name}: {state} (updated {updated_at or "-"})')
+
+
+def main():
+    ap = argparse.ArgumentParser(description='visits.db schema migrations')
+    ap.add_argument('command', choices=('status', 'run', 'dry-run'))
+    ap.add_argument('--db', help='SQLite DB path (default: VISITS_DB or ./visits.db)')
+    ap.add_argument('--chunk-rows', type=int, help='rows per backfill transaction')
+    ap.add_argument('--pause', type=float, help='seconds to sleep between backfill chunks')
+    args = ap.parse_args()
+
+    db = os.path.abspath(args.db) if args.db else os.environ.get('VISITS_DB') or os.path.join(ROOT, 'visits.db')
+    tmpdir = None
+    if args.command == 'dry-run':
+        tmpdir = tempfile.mkdtemp(prefix='visits-migrate-')
+        copy = os.path.join(tmpdir, 'visits.db')
+        t0 = time.perf_counter()
+        src, dst = sqlite3.connect(db), sqlite3.connect(copy)
+        with dst:
+            src.backup(dst)
+        src.close()
+        dst.close()
+        print(f'copied {db} -> {copy} in {time.perf_counter() - t0:.2f}s')
+        db = copy
+    os.environ['VISITS_DB'] = db
+    # migrate explicitly below (timed, or not at all for status) instead of at import
+    os.environ['VISITS_MIGRATE'] = '0'
+    os.environ['VISITS_BACKFILL'] = '0'
+    sys.path.insert(0, ROOT)
+    import app as visits_app
+
+    try:
+        if args.command != 'status':
+            if not visits_app.migrate(log=print):
+                print('schema up to date')
+            t0 = time.perf_counter()
+            chunks = visits_app.run_backfills(chunk_rows=args.chunk_rows, pause_s=args.pause, log=print)
+            print(f'backfills: {chunks} chunk(s) in {time.perf_counter() - t0:.2f}s')
+        status(visits_app)
+    finally:
+        visits_app.close_db_connections()
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
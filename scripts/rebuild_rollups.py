@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Rebuild the visits.db rollup tables (rollup_visits, rollup_subjects) from the
+stored payloads. Normally they are kept current by every write; run this after
+editing payloads by hand or restoring an old backup.
+Usage:
+  python scripts/rebuild_rollups.py --db ./visits.db
+  python scripts/rebuild_rollups.py --db ./visits.db --check
+
+--check recomputes the rollups from the newest snapshot (scripts/snapshot.py)
+into temp tables and lists the rows that differ from the snapshot's stored
+rollups, without reading or locking the live DB.
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def check(visits_app):
+    path, age = visits_app.latest_snapshot()
+    if not path:
+        return 'no snapshot yet (python scripts/snapshot.py take)'
+    conn = visits_app.open_snapshot(path)
+    cur = conn.cursor()
+    # temp tables of the same name shadow the snapshot's, so apply_rollups fills them
+    for name in ('rollup_visits', 'rollup_subjects'):
+        ddl = cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()[0]
+        cur.execute(ddl.replace('CREATE TABLE', 'CREATE TEMP TABLE', 1))
+    visits_app.apply_rollups(cur, '1', [], 1, respect_backfill=False)
+    bad = 0
+    for name in ('rollup_visits', 'rollup_subjects'):
+        for label, a, b in (('missing', 'temp', 'main'), ('unexpected', 'main', 'temp')):
+            rows = cur.execute(f'SELECT * FROM {a}.{name} WHERE visits != 0 EXCEPT SELECT * FROM {b}.{name} WHERE visits != 0').fetchall()
+            for row in rows[:20]:
+                print(f'{name} {label}: {row}')
+            bad += len(rows)
+    conn.close()
+    print(f'{os.path.basename(path)} ({age / 60:.1f} min old): {bad} mismatched row(s)')
+    return 1 if bad else 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Rebuild visits.db rollup tables')
+    ap.add_argument('--db', help='SQLite DB path (default: VISITS_DB or ./visits.db)')
+    ap.add_argument('--check', action='store_true', help='verify against the newest snapshot instead of rebuilding')
+    args = ap.parse_args()
+
+    if args.db:
+        os.environ['VISITS_DB'] = os.path.abspath(args.db)
+    if args.check:
+        # leave the live DB alone entirely
+        os.environ['VISITS_MIGRATE'] = '0'
+        os.environ['VISITS_BACKFILL'] = '0'
+    sys.path.insert(0, ROOT)
+    import app as visits_app
+
+    if args.check:
+        sys.exit(check(visits_app))
+    visits_app.init_db()
+    with visits_app.db_transaction() as conn:
+        cur = conn.cursor()
+        visits_app.rebuild_rollups(cur)
+        days = cur.execute('SELECT count(*), coalesce(sum(visits), 0) FROM rollup_visits').fetchone()
+        subjects = cur.execute('SELECT count(*) FROM rollup_subjects').fetchone()[0]
+    print(f'rollup_visits: {days[0]} row(s), {days[1]} visit(s); rollup_subjects: {subjects} row(s)')
+    visits_app.close_db_connections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Bulk-rename school names inside stored visit payloads (visits.db).
+Usage:
+  python scripts/rename_schools.py --mapping renames.json --dry-run
+  python scripts/rename_schools.py --mapping renames.json --db ./visits.db --chunk-size 1000
+
+Mapping file (UTF-8, BOM ok) may be:
+- {"old name": "new name", ...}
+- {"mapping": {"old name": "new name", ...}}
+- [{"old_school": "...", "new_school": "...", "staff": "...", "visit_date": "YYYY-MM-DD"}, ...]
+
+Notes:
+- Same code path as POST /api/visits/patch_school: set-based JSON1 updates,
+  one short write transaction per --chunk-size candidate records.
+- --dry-run only reports how many records would change.
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Rename schools inside visits.db payloads')
+    ap.add_argument('--mapping', required=True, help='JSON file with the renames')
+    ap.add_argument('--db', help='SQLite DB path (default: VISITS_DB or ./visits.db)')
+    ap.add_argument('--dry-run', action='store_true', help='count matches without writing')
+    ap.add_argument('--chunk-size', type=int, default=0, help='records per write transaction')
+    args = ap.parse_args()
+
+    if args.db:
+        os.environ['VISITS_DB'] = os.path.abspath(args.db)
+    sys.path.insert(0, ROOT)
+    import app as visits_app
+
+    with open(args.mapping, encoding='utf-8-sig') as f:
+        renames = visits_app.parse_rename_mapping(json.load(f))
+
+    visits_app.init_db()
+    total = set()
+    for r in renames:
+        ids = visits_app.rename_school(r['old_school'], r['new_school'], r['staff'], r['visit_date'],
+                                       dry_run=args.dry_run, chunk_rows=args.chunk_size or None)
+        total.update(ids)
+        print(f"{r['old_school']!r} -> {r['new_school']!r}: {len(ids)} record(s)")
+    verb = 'would update' if args.dry_run else 'updated'
+    print(f'{verb} {len(total)} record(s)')
+    visits_app.close_db_connections()
+
+
+if __name__ == '__main__':
+    main()
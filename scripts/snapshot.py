@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Consistent read-only snapshots of visits.db (see take_snapshot in app.py).
+Usage:
+  python scripts/snapshot.py take --db ./visits.db [--pages 1024]
+  python scripts/snapshot.py list --db ./visits.db
+  python scripts/snapshot.py path --db ./visits.db
+
+take  copies the live DB into VISITS_SNAPSHOT_DIR (default: snapshots/ next
+      to the DB) without blocking saves; safe while the app is running
+list  snapshots, newest first, with their age
+path  prints the newest snapshot's path, for reporting queries, e.g.
+      sqlite3 "file:$(python scripts/snapshot.py path)?immutable=1" ...
+Exports read the newest snapshot with GET /api/visits/export?snapshot=1.
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    ap = argparse.ArgumentParser(description='visits.db snapshots')
+    ap.add_argument('command', choices=('take', 'list', 'path'))
+    ap.add_argument('--db', help='SQLite DB path (default: VISITS_DB or ./visits.db)')
+    ap.add_argument('--pages', type=int, help='pages copied per backup step')
+    args = ap.parse_args()
+
+    if args.db:
+        os.environ['VISITS_DB'] = os.path.abspath(args.db)
+    os.environ['VISITS_MIGRATE'] = '0'
+    os.environ['VISITS_BACKFILL'] = '0'
+    os.environ['VISITS_SNAPSHOT_INTERVAL_S'] = '0'
+    sys.path.insert(0, ROOT)
+    import app as visits_app
+
+    if args.command == 'take':
+        visits_app.take_snapshot(pages=args.pages, log=print)
+    elif args.command == 'list':
+        for path in visits_app.list_snapshots():
+            age = visits_app.time.time() - os.path.getmtime(path)
+            print(f'{path}  {os.path.getsize(path) / 1e6:.1f} MB  {age / 60:.1f} min old')
+    else:
+        path, _ = visits_app.latest_snapshot()
+        if not path:
+            sys.exit('no snapshot yet (python scripts/snapshot.py take)')
+        print(path)
+    visits_app.close_db_connections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# app.py runs init_db() at import time; keep it away from the checked-in visits.db
+os.environ.setdefault('VISITS_DB', os.path.join(tempfile.mkdtemp(prefix='visits-test-'), 'visits.db'))
+
+
+@pytest.fixture
+def visits_app(tmp_path, monkeypatch):
+    """Root Flask app (app.py) bound to a fresh visits.db under tmp_path."""
+    # Some werkzeug builds used by this environment don't expose __version__
+    try:
+        import werkzeug
+        if not getattr(werkzeug, '__version__', None):
+            werkzeug.__version__ = '0.0.0'
+    except Exception:
+        pass
+    import app as app_module
+    monkeypatch.setattr(app_module, 'DB_PATH', str(tmp_path / 'visits.db'))
+    app_module.init_db()
+    return app_module
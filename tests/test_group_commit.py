@@ -0,0 +1,71 @@
+import sqlite3
+import threading
+
+import pytest
+
+
+def payload(i):
+    return {'staff': f'S{i % 7}', 'visits': [{'visitDate': '2025-10-01', 'school': f'학교{i}', 'visitStart': '09:00',
+                                              'visitEnd': '10:00', 'subjects': [{'subject': '국어'}]}]}
+
+
+def test_each_caller_gets_its_own_result_or_error(visits_app):
+    writer = visits_app.GroupCommitWriter()
+    gate = threading.Event()
+    # hold the writer so the next submissions queue up into one batch
+    first = writer.submit(lambda cur: gate.wait(5))
+    saves = [writer.submit(visits_app.save_visit, payload(i)) for i in range(5)]
+    bad = writer.submit(lambda cur: cur.execute('INSERT INTO no_such_table VALUES (1)'))
+    again = writer.submit(visits_app.save_visit, payload(0))
+    gate.set()
+
+    assert first.result(5) is True
+    ids = [f.result(5) for f in saves]
+    assert [updated for _, updated in ids] == [False] * 5
+    with pytest.raises(sqlite3.OperationalError):
+        bad.result(5)
+    assert again.result(5) == (ids[0][0], True)
+    cur = visits_app.get_db().cursor()
+    assert cur.execute('SELECT count(*) FROM visits').fetchone()[0] == 5
+    assert cur.execute("SELECT count(*) FROM events WHERE name IN ('new_visit', 'updated_visit')").fetchone()[0] == 6
+
+
+def test_concurrent_posts(visits_app):
+    results = []
+
+    def post(i):
+        resp = visits_app.app.test_client().post('/api/visits', json=payload(i))
+        results.append((resp.status_code, resp.get_json()['id']))
+
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(30)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(code for code, _ in results) == [201] * 30
+    assert len({rid for _, rid in results}) == 30
+
+
+def test_writer_errors_outside_the_batch_still_resolve_futures(visits_app, monkeypatch):
+    writer = visits_app.GroupCommitWriter()
+
+    def boom(*args):
+        raise RuntimeError('metrics down')
+
+    observe = visits_app.METRICS.observe
+
+    def observe_batch(name, *args):
+        if name == 'visits_group_commit_size':
+            boom()
+        return observe(name, *args)
+
+    # after the commit: results are already delivered
+    monkeypatch.setattr(visits_app.METRICS, 'observe', observe_batch)
+    assert writer.submit(visits_app.save_visit, payload(1)).result(5) == (1, False)
+    # before any result: the caller gets the error instead of hanging
+    monkeypatch.setattr(writer, 'commit', boom)
+    with pytest.raises(RuntimeError):
+        writer.submit(visits_app.save_visit, payload(2)).result(5)
+    monkeypatch.delattr(writer, 'commit')
+    assert writer.submit(visits_app.save_visit, payload(2)).result(5) == (2, False)
+    assert writer.thread.is_alive()
@@ -0,0 +1,37 @@
+import subprocess
+import sys
+
+
+def metric(text, line_prefix):
+    for line in text.splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+def test_metrics_endpoint_and_worker_aggregation(visits_app, tmp_path, monkeypatch):
+    monkeypatch.setattr(visits_app.METRICS, 'directory', str(tmp_path / 'm'))
+    client = visits_app.app.test_client()
+    payload = {'staff': 'A', 'visits': [{'visitDate': '2025-10-01', 'school': 'X', 'visitStart': '09:00', 'visitEnd': '10:00'}]}
+    client.post('/api/visits', json=payload)
+    client.get('/api/visits')
+    client.get('/api/visits/export').get_data()
+
+    text = client.get('/metrics').data.decode('utf-8')
+    assert '# TYPE http_requests_total counter' in text
+    before = metric(text, 'http_requests_total{app="visits",method="GET",route="/api/visits",status="200"}')
+    assert before >= 1
+    assert metric(text, 'http_request_duration_seconds_count{app="visits",route="/api/visits"}') >= 1
+    assert metric(text, 'sqlite_query_seconds_count{app="visits",op="SELECT"}') > 0
+    assert metric(text, 'sqlite_lock_wait_seconds_count{app="visits"}') > 0
+    assert metric(text, 'export_bytes_total{app="visits",encoding="identity"}') > 0
+    assert metric(text, 'sse_clients{app="visits"}') == 0
+
+    # another (now exited) worker's counters are added; its gauges are not
+    code = ("from backend.metrics import Metrics; m = Metrics('visits', directory=%r); "
+            "m.inc('http_requests_total', {'route': '/api/visits', 'method': 'GET', 'status': '200'}, 5); "
+            "m.set('sse_clients', 3); m.flush()") % str(tmp_path / 'm')
+    subprocess.run([sys.executable, '-c', code], cwd=visits_app.BASE_DIR or '.', check=True)
+    text = client.get('/metrics').data.decode('utf-8')
+    assert metric(text, 'http_requests_total{app="visits",method="GET",route="/api/visits",status="200"}') == before + 5
+    assert metric(text, 'sse_clients{app="visits"}') == 0
@@ -0,0 +1,80 @@
+import json
+import sqlite3
+
+
+def visit(date, school, teacher='김교사'):
+    return {'visitDate': date, 'school': school, 'visitStart': '09:00', 'visitEnd': '10:00', 'region': '과천',
+            'subjects': [{'subject': '국어', 'teacher': teacher}]}
+
+
+def legacy_db(path, payloads):
+    # visits.db as the very first app.py created it: no filter columns, no indexes, user_version 0
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE visits (id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT, staff TEXT, visit_date TEXT, payload TEXT)')
+    conn.executemany('INSERT INTO visits (staff, visit_date, payload) VALUES (?, ?, ?)',
+                     [(p['staff'], p['visits'][0]['visitDate'], json.dumps(p, ensure_ascii=False)) for p in payloads])
+    conn.commit()
+    conn.close()
+
+
+def test_legacy_db_migrates_and_backfills_in_chunks(visits_app, tmp_path, monkeypatch):
+    path = str(tmp_path / 'legacy.db')
+    payloads = [{'staff': 'A', 'visits': [visit(f'2025-10-{d:02d}', '과천고' if d % 2 else '안양중')]} for d in range(1, 8)]
+    # an older duplicate of day 1: the newest record must own the upsert key
+    payloads.insert(0, {'staff': 'A', 'visits': [visit('2025-10-01', '과천고', '이교사')]})
+    legacy_db(path, payloads)
+    monkeypatch.setattr(visits_app, 'DB_PATH', path)
+    visits_app.close_db_connections()
+
+    assert visits_app.migrate() == [m[0] for m in visits_app.MIGRATIONS]
+    assert visits_app.migrate() == []
+    cur = visits_app.get_db().cursor()
+    assert visits_app.schema_version(cur) == visits_app.MIGRATIONS[-1][0]
+    assert sorted(r[0] for r in visits_app.pending_backfills(cur)) == ['rollups', 'visit_index']
+
+    client = visits_app.app.test_client()
+    # a save while the rollup backfill hasn't reached it yet is counted exactly once
+    client.post('/api/visits', json={'staff': 'B', 'visits': [visit('2025-10-09', '서울고')]})
+    assert visits_app.run_backfills(chunk_rows=3, pause_s=0) > 2
+    assert visits_app.pending_backfills(cur) == []
+
+    rows = cur.execute('SELECT visit_date, staff, school, visits FROM rollup_visits WHERE visits != 0 ORDER BY 1').fetchall()
+    assert rows[0] == ('2025-10-01', 'A', '과천고', 2)
+    assert sum(r[3] for r in rows) == 9
+    assert cur.execute("SELECT max(record_id) FROM visit_schools WHERE visit_date = '2025-10-01'").fetchone()[0] == 2
+    body = client.get('/api/visits?school=' + '안양중').get_json()
+    assert len(body['rows']) == 3
+    body = client.get('/api/visits?q=' + '이교사').get_json()
+    assert [r['id'] for r in body['rows']] == [1]
+    visits_app.close_db_connections()
+
+
+def test_fresh_db_has_nothing_to_backfill(visits_app):
+    cur = visits_app.get_db().cursor()
+    assert visits_app.schema_version(cur) == visits_app.MIGRATIONS[-1][0]
+    assert visits_app.pending_backfills(cur) == []
+    assert visits_app.pending_migrations(cur) == []
+
+
+def test_v3_refills_school_keys_in_chunks(visits_app):
+    client = visits_app.app.test_client()
+    for d in range(1, 6):
+        client.post('/api/visits', json={'staff': 'A', 'visits': [visit(f'2025-10-{d:02d}', '과천고')]})
+    # a v2 DB: visit_schools still has the UNIQUE key v3 removes
+    conn = visits_app.get_db()
+    conn.execute('DROP TABLE visit_schools')
+    conn.execute('CREATE TABLE visit_schools (record_id INTEGER NOT NULL, staff TEXT NOT NULL, visit_date TEXT NOT NULL, '
+                 'school TEXT NOT NULL, UNIQUE (staff, visit_date, school))')
+    conn.execute('PRAGMA user_version = 2')
+    visits_app.close_db_connections()
+
+    assert visits_app.migrate() == [3]
+    cur = visits_app.get_db().cursor()
+    assert visits_app.pending_backfills(cur) == [('school_keys', None)]
+    assert cur.execute('SELECT count(*) FROM visit_schools').fetchone()[0] == 0
+    assert visits_app.run_backfills(chunk_rows=2, pause_s=0) == 3
+    assert cur.execute('SELECT count(*) FROM visit_schools').fetchone()[0] == 5
+    assert 'UNIQUE' not in cur.execute("SELECT sql FROM sqlite_master WHERE name = 'visit_schools'").fetchone()[0]
+    with visits_app.db_transaction() as conn:
+        assert visits_app.save_visit(conn.cursor(), {'staff': 'A', 'visits': [visit('2025-10-01', '과천고')]}) == (1, True)
+    visits_app.close_db_connections()
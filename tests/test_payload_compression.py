@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip('zstandard')
+
+
+def visit(date, school, memo):
+    return {'visitDate': date, 'school': school, 'visitStart': '09:00', 'visitEnd': '09:40', 'region': '과천',
+            'subjects': [{'subject': '국어', 'teacher': '김교사', 'conversation': memo}]}
+
+
+def stored_types(visits_app):
+    cur = visits_app.get_db().cursor()
+    return [r[0] for r in cur.execute('SELECT typeof(payload) FROM visits ORDER BY id').fetchall()]
+
+
+def test_compressed_payloads_read_like_text(visits_app, monkeypatch):
+    client = visits_app.app.test_client()
+    for day in range(1, 41):
+        client.post('/api/visits', json={'staff': 'A', 'visits': [
+            visit(f'2025-10-{day % 28 + 1:02d}', '과천고' if day % 3 else '안양중', f'교과서 채택 협의 {day}회차, 샘플 전달')]})
+    before = client.get('/api/visits?limit=100').get_json()['rows']
+    rollups = client.get('/api/visits/rollups?group_by=school').get_json()['rows']
+
+    dict_id = visits_app.train_payload_dict(sample_rows=40, dict_bytes=2048)
+    assert visits_app.repack_payloads(chunk_rows=7, pause_s=0) == len(before)
+    assert set(stored_types(visits_app)) == {'blob'}
+    assert visits_app.repack_payloads(pause_s=0) == 0
+
+    assert client.get('/api/visits?limit=100').get_json()['rows'] == before
+    assert client.get('/api/visits?school=안양중&q=채택').get_json()['rows'] == [r for r in before if r['payload']['visits'][0]['school'] == '안양중']
+    export = client.get('/api/visits/export').get_data(as_text=True)
+    assert export.count('샘플 전달') == len(before)
+    with visits_app.db_transaction() as conn:
+        visits_app.rebuild_rollups(conn.cursor())
+    assert client.get('/api/visits/rollups?group_by=school').get_json()['rows'] == rollups
+
+    # new writes are packed with the active dictionary; renames keep the format
+    monkeypatch.setattr(visits_app, 'PAYLOAD_COMPRESSION', 'zstd')
+    rid = client.post('/api/visits', json={'staff': 'B', 'visits': [visit('2025-11-01', '과천고', '신규')]}).get_json()['id']
+    stored = visits_app.get_db().execute('SELECT payload FROM visits WHERE id = ?', (rid,)).fetchone()[0]
+    assert stored.startswith(visits_app.PAYLOAD_MAGIC + dict_id.to_bytes(4, 'little'))
+    renamed = sum(r['payload']['visits'][0]['school'] == '과천고' for r in before) + 1
+    body = client.post('/api/visits/patch_school', json={'old_school': '과천고', 'new_school': '과천고등학교'}).get_json()
+    assert body['count'] == renamed
+    assert set(stored_types(visits_app)) == {'blob'}
+    rows = client.get('/api/visits?school=과천고등학교&limit=100').get_json()['rows']
+    assert len(rows) == renamed and all(r['payload']['visits'][0]['school'] == '과천고등학교' for r in rows)
+
+    assert visits_app.repack_payloads(compress=False, pause_s=0) == len(before) + 1
+    assert set(stored_types(visits_app)) == {'text'}
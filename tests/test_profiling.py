@@ -0,0 +1,32 @@
+import os
+
+
+def test_server_timing_and_opt_in_profiles(visits_app, tmp_path, monkeypatch):
+    prof = visits_app.PROFILER
+    monkeypatch.setattr(prof, 'directory', str(tmp_path / 'prof'))
+    monkeypatch.setattr(prof, 'interval', 0.0005)
+    monkeypatch.setattr(prof, 'keep', 2)
+    client = visits_app.app.test_client()
+    payload = {'staff': 'A', 'visits': [{'visitDate': '2025-10-01', 'school': 'X', 'visitStart': '09:00', 'visitEnd': '10:00'}]}
+
+    resp = client.post('/api/visits', json=payload)
+    timing = resp.headers['Server-Timing']
+    assert timing.startswith('db;dur=') and 'json;dur=' in timing and 'app;dur=' in timing
+    assert 'X-Profile-Id' not in resp.headers
+
+    # debug header only counts from an allowed address
+    resp = client.get('/api/visits', headers={'X-Debug-Profile': '1'}, environ_base={'REMOTE_ADDR': '10.0.0.9'})
+    assert 'X-Profile-Id' not in resp.headers
+
+    names = []
+    for _ in range(3):
+        resp = client.get('/api/visits/export', headers={'X-Debug-Profile': '1'}, environ_base={'REMOTE_ADDR': '127.0.0.1'})
+        resp.get_data()
+        resp.close()
+        names.append(resp.headers['X-Profile-Id'])
+    files = sorted(os.listdir(tmp_path / 'prof'))
+    assert len(files) == 2 and set(files) <= set(names)     # rotated to PROFILE_KEEP
+    for name in files:
+        for line in (tmp_path / 'prof' / name).read_text(encoding='utf-8').splitlines():
+            stack, count = line.rsplit(' ', 1)
+            assert int(count) > 0 and stack
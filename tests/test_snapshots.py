@@ -0,0 +1,57 @@
+import sqlite3
+import threading
+
+
+def payload(i):
+    return {'staff': 'A', 'visits': [{'visitDate': f'2025-10-{i % 28 + 1:02d}', 'school': f'학교{i}', 'visitStart': '09:00',
+                                      'visitEnd': '10:00', 'subjects': [{'subject': '국어', 'conversation': '자료 ' * 200}]}]}
+
+
+def test_snapshot_is_consistent_while_saves_continue(visits_app, tmp_path, monkeypatch):
+    monkeypatch.setattr(visits_app, 'SNAPSHOT_DIR', str(tmp_path / 'snaps'))
+    monkeypatch.setattr(visits_app, 'SNAPSHOT_KEEP', 2)
+    client = visits_app.app.test_client()
+    for i in range(60):
+        client.post('/api/visits', json=payload(i))
+    assert client.get('/_health').get_json()['snapshot'] is None
+
+    stop = threading.Event()
+
+    def writer():
+        c = visits_app.app.test_client()
+        i = 1000
+        while not stop.is_set():
+            c.post('/api/visits', json=payload(i))
+            i += 1
+
+    t = threading.Thread(target=writer)
+    t.start()
+    try:
+        # one page per step while saves keep committing; a write restarts the stepped copy
+        path = visits_app.take_snapshot(pages=1, pause_s=0.001)
+    finally:
+        stop.set()
+        t.join()
+
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    assert conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    snap_count = conn.execute('SELECT count(*) FROM visits').fetchone()[0]
+    assert snap_count == conn.execute('SELECT coalesce(sum(visits), 0) FROM rollup_visits').fetchone()[0]
+    conn.close()
+    assert snap_count >= 60
+
+    client.post('/api/visits', json=payload(5000))
+    resp = client.get('/api/visits/export?snapshot=1')
+    assert 'X-Snapshot-Age' in resp.headers
+    ids = {line.split(',')[0] for line in resp.get_data(as_text=True).splitlines()[1:]}
+    assert len(ids) == snap_count
+    live = {line.split(',')[0] for line in client.get('/api/visits/export').get_data(as_text=True).splitlines()[1:]}
+    assert len(live) > snap_count
+
+    health = client.get('/_health').get_json()['snapshot']
+    assert health['file'] == path.rsplit('/', 1)[-1] and health['age_s'] >= 0
+
+    visits_app.take_snapshot()
+    visits_app.take_snapshot()
+    assert len(visits_app.list_snapshots()) == 2
+    assert path not in visits_app.list_snapshots()
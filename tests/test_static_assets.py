@@ -0,0 +1,60 @@
+import gzip
+
+
+def make_frontend(visits_app, tmp_path, monkeypatch):
+    front = tmp_path / 'front'
+    front.mkdir()
+    (front / 'input.html').write_text('<script src="/neis_grid.js"></script><link href="manifest.json">', encoding='utf-8')
+    (front / 'neis_grid.js').write_text('console.log(1);\n' * 200, encoding='utf-8')
+    (front / 'manifest.json').write_text('{}', encoding='utf-8')
+    monkeypatch.setattr(visits_app, 'FRONTEND_DIR', str(front))
+    monkeypatch.setattr(visits_app, 'ASSET_CACHE_DIR', str(tmp_path / 'cache'))
+    return front
+
+
+def test_html_shell_points_at_hashed_assets(visits_app, tmp_path, monkeypatch):
+    front = make_frontend(visits_app, tmp_path, monkeypatch)
+    client = visits_app.app.test_client()
+    resp = client.get('/')
+    html = resp.data.decode('utf-8')
+    assert resp.headers['Cache-Control'] == 'no-cache' and resp.headers['ETag']
+    hashed = visits_app.hashed_asset_name('neis_grid.js')
+    assert f'src="/{hashed}"' in html and 'href="manifest.json"' in html   # manifest keeps its URL
+    assert client.get('/', headers={'If-None-Match': resp.headers['ETag']}).status_code == 304
+
+    resp = client.get('/' + hashed, headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in resp.headers['Cache-Control']
+    assert gzip.decompress(resp.data) == (front / 'neis_grid.js').read_bytes()
+    again = client.get('/' + hashed, headers={'Accept-Encoding': 'gzip', 'If-None-Match': resp.headers['ETag']})
+    assert again.status_code == 304 and again.data == b''
+
+    # plain name: revalidated, identity encoding has its own ETag
+    plain = client.get('/neis_grid.js')
+    assert plain.headers['Cache-Control'] == 'no-cache' and 'Content-Encoding' not in plain.headers
+    assert plain.headers['ETag'] != resp.headers['ETag']
+
+    # content changes -> new hash; the old hashed URL still works but is not cached long
+    (front / 'neis_grid.js').write_text('console.log(2);\n', encoding='utf-8')
+    assert visits_app.hashed_asset_name('neis_grid.js') != hashed
+    stale = client.get('/' + hashed)
+    assert stale.status_code == 200 and stale.headers['Cache-Control'] == 'no-cache'
+    assert client.get('/missing.js').status_code == 404
+
+
+def test_relative_refs_resolve_from_the_page_directory(visits_app, tmp_path, monkeypatch):
+    front = make_frontend(visits_app, tmp_path, monkeypatch)
+    (front / 'admin').mkdir()
+    (front / 'admin' / 'page.html').write_text(
+        '<script src="neis_grid.js"></script><script src="./tools/run.js"></script><link href="../app.css">',
+        encoding='utf-8')
+    (front / 'admin' / 'neis_grid.js').write_text('console.log("admin");\n', encoding='utf-8')
+    (front / 'admin' / 'tools').mkdir()
+    (front / 'admin' / 'tools' / 'run.js').write_text('run();\n', encoding='utf-8')
+    (front / 'app.css').write_text('body{}\n', encoding='utf-8')
+    html = visits_app.app.test_client().get('/admin/page.html').data.decode('utf-8')
+    local = visits_app.hashed_asset_name('admin/neis_grid.js').split('/')[-1]
+    assert local != visits_app.hashed_asset_name('neis_grid.js')
+    assert f'src="{local}"' in html
+    assert 'src="./tools/%s"' % visits_app.hashed_asset_name('admin/tools/run.js').split('/')[-1] in html
+    assert 'href="../%s"' % visits_app.hashed_asset_name('app.css') in html
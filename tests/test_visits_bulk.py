@@ -0,0 +1,70 @@
+import json
+
+
+def day(staff, date, school, start='09:00'):
+    return {'staff': staff, 'visits': [{'visitDate': date, 'school': school, 'visitStart': start, 'visitEnd': '10:00'}]}
+
+
+def test_bulk_json_array_with_per_item_results(visits_app):
+    client = visits_app.app.test_client()
+    items = [day('A', '2025-10-01', '과천고'), day('A', '2025-10-01', '과천고'), day('A', '2025-10-02', '안양고', start=''), day('B', '2025-10-01', '과천고')]
+    body = client.post('/api/visits/bulk', json=items).get_json()
+    assert (body['inserted'], body['updated'], body['failed']) == (2, 1, 1)
+    assert [r['index'] for r in body['results']] == [0, 1, 2, 3]
+    by_index = {r['index']: r for r in body['results']}
+    assert by_index[1]['updated'] and by_index[1]['id'] == by_index[0]['id']
+    assert by_index[2]['error'] == 'missing_visit_times'
+    rows = client.get('/api/visits').get_json()['rows']
+    assert len(rows) == 2
+
+
+def test_bulk_ndjson_stream_and_split_by_date(visits_app, monkeypatch):
+    client = visits_app.app.test_client()
+    monkeypatch.setattr(visits_app, 'BULK_CHUNK_ITEMS', 3)
+    lines = [json.dumps(day('A', '2025-10-%02d' % (i + 1), '학교%d' % i), ensure_ascii=False) for i in range(10)]
+    lines.insert(4, '{not json')
+    aggregated = {'staff': 'C', 'visits': [
+        {'visitDate': '2025-10-01', 'school': 'X', 'visitStart': '09:00', 'visitEnd': '10:00'},
+        {'visitDate': '2025-10-02', 'school': 'Y', 'visitStart': '09:00', 'visitEnd': '10:00'},
+    ]}
+    lines.append(json.dumps(aggregated))
+    resp = client.post('/api/visits/bulk?split_by_date=1', data='\n'.join(lines).encode('utf-8'),
+                       content_type='application/x-ndjson')
+    body = resp.get_json()
+    assert (body['inserted'], body['failed']) == (12, 1)
+    assert [r['index'] for r in body['results'] if not r['ok']] == [4]
+    staff_c = client.get('/api/visits?staff=C').get_json()['rows']
+    assert sorted(r['visit_date'] for r in staff_c) == ['2025-10-01', '2025-10-02']
+
+
+def test_bulk_rejects_garbage(visits_app):
+    client = visits_app.app.test_client()
+    resp = client.post('/api/visits/bulk', data='nope', content_type='application/json')
+    assert resp.status_code == 400
+
+
+def test_bulk_commit_failure_reports_the_chunk_failed(visits_app, monkeypatch):
+    import sqlite3
+    from contextlib import contextmanager
+    client = visits_app.app.test_client()
+    monkeypatch.setattr(visits_app, 'BULK_CHUNK_ITEMS', 2)
+    real = visits_app.db_transaction
+    calls = []
+
+    @contextmanager
+    def failing_second_commit(*args, **kwargs):
+        calls.append(1)
+        with real(*args, **kwargs) as conn:
+            yield conn
+            if len(calls) == 2:
+                raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(visits_app, 'db_transaction', failing_second_commit)
+    items = [day('A', '2025-10-%02d' % (i + 1), '과천고') for i in range(4)]
+    resp = client.post('/api/visits/bulk', json=items)
+    body = resp.get_json()
+    assert resp.status_code == 500
+    assert (body['inserted'], body['failed']) == (2, 2)
+    assert [r['ok'] for r in body['results']] == [True, True, False, False]
+    monkeypatch.setattr(visits_app, 'db_transaction', real)
+    assert len(client.get('/api/visits').get_json()['rows']) == 2
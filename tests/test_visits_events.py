@@ -0,0 +1,56 @@
+def read_frames(resp, n):
+    it = iter(resp.response)
+    out = b''
+    for _ in range(n):
+        out += next(it)
+    resp.close()
+    return out.decode('utf-8')
+
+
+def test_ring_buffer_bounds_and_replay(visits_app):
+    ring = visits_app.EventRing(3)
+    for i in range(1, 6):
+        ring.publish(i, 'new_visit', '{"id": %d}' % i)
+    frames, last = ring.read_after(3)
+    assert last == 5 and len(frames) == 2 and frames[0].startswith(b'id: 4\n')
+    assert ring.read_after(1) == (None, 5)          # evicted: caller must reset
+    assert ring.read_after(5, timeout=0.01) == ([], 5)
+
+
+def test_events_last_event_id_replay(visits_app, monkeypatch):
+    monkeypatch.setattr(visits_app, 'SSE_KEEPALIVE_S', 0.01)
+    client = visits_app.app.test_client()
+    start = visits_app._sse_ring.seq
+    payload = {'staff': 'A', 'visits': [{'visitDate': '2025-10-01', 'school': 'X', 'visitStart': '09:00', 'visitEnd': '10:00'}]}
+    client.post('/api/visits', json=payload)
+    client.post('/api/visits', json=payload)
+    visits_app._event_tail.poll()
+
+    resp = client.get('/api/events', headers={'Last-Event-ID': str(start)}, buffered=False)
+    text = read_frames(resp, 2)
+    assert 'id: %d\nevent: new_visit' % (start + 1) in text
+    assert 'id: %d\nevent: updated_visit' % (start + 2) in text
+
+    # no id: live events only
+    text = read_frames(client.get('/api/events', buffered=False), 2)
+    assert 'keep-alive' in text and 'event: new_visit' not in text
+
+    # an id the server cannot replay gets a reset
+    text = read_frames(client.get('/api/events?last_event_id=999999999', buffered=False), 2)
+    assert 'event: reset' in text
+
+
+def test_events_cross_process(visits_app, tmp_path):
+    # a write from another process is picked up by this process's tail
+    import subprocess, sys, os
+    # a tail of its own: the global one's thread may be polling concurrently
+    ring = visits_app.EventRing(16)
+    tail = visits_app.EventTail(ring)
+    tail.poll()
+    start = ring.seq
+    env = dict(os.environ, VISITS_DB=visits_app.DB_PATH)
+    code = "import app; app.sse_broadcast('new_visit', {'id': 42})"
+    subprocess.run([sys.executable, '-c', code], cwd=visits_app.BASE_DIR or '.', env=env, check=True)
+    tail.poll()
+    frames, last = ring.read_after(start)
+    assert last == start + 1 and b'"id": 42' in frames[0]
@@ -0,0 +1,79 @@
+import sqlite3
+
+
+def make_payload(staff, date, school, region='', subjects=None):
+    return {
+        'staff': staff,
+        'visits': [{
+            'visitDate': date, 'school': school, 'region': region,
+            'visitStart': '09:00', 'visitEnd': '09:30',
+            'subjects': subjects or [],
+        }],
+    }
+
+
+def test_filters_return_full_pages(visits_app):
+    client = visits_app.app.test_client()
+    # one matching row buried under many non-matching newer rows
+    assert client.post('/api/visits', json=make_payload('A', '2025-10-01', '과천고등학교', '과천', [{'subject': '정보', 'teacher': '김'}])).status_code == 201
+    for i in range(30):
+        client.post('/api/visits', json=make_payload('B', '2025-10-%02d' % (i % 28 + 1), '학교%d' % i, '안양', [{'subject': '수학'}]))
+
+    rows = client.get('/api/visits?limit=5&school=과천고등학교').get_json()['rows']
+    assert [r['payload']['visits'][0]['school'] for r in rows] == ['과천고등학교']
+    # substring matching still works for partial values
+    assert len(client.get('/api/visits?limit=5&school=과천').get_json()['rows']) == 1
+    assert len(client.get('/api/visits?limit=5&subject=정보').get_json()['rows']) == 1
+    assert len(client.get('/api/visits?limit=5&teacher=김').get_json()['rows']) == 1
+    assert len(client.get('/api/visits?limit=50&region=안양').get_json()['rows']) == 30
+    assert len(client.get('/api/visits?limit=5&subject=수학').get_json()['rows']) == 5
+    rows = client.get('/api/visits?limit=50&staff=B&from=2025-10-02&to=2025-10-03').get_json()['rows']
+    assert set(r['visit_date'] for r in rows) == {'2025-10-02', '2025-10-03'}
+
+    # a value that exists verbatim must not narrow the substring match
+    client.post('/api/visits', json=make_payload('C', '2025-10-02', '과천', '과천', [{'subject': '정'}]))
+    assert len(client.get('/api/visits?limit=5&school=과천').get_json()['rows']) == 2
+    assert len(client.get('/api/visits?limit=5&subject=정').get_json()['rows']) == 2
+    assert len(client.get('/api/visits?limit=5&school=과천&exact=1').get_json()['rows']) == 1
+    assert len(client.get('/api/visits?limit=5&subject=정보&exact=1').get_json()['rows']) == 1
+
+    csv_text = client.get('/api/visits/export?subject=정보').data.decode('utf-8')
+    assert '과천고등학교' in csv_text and '학교1' not in csv_text
+
+
+def test_update_refreshes_index(visits_app):
+    client = visits_app.app.test_client()
+    rid = client.post('/api/visits', json=make_payload('A', '2025-10-01', '과천고등학교', subjects=[{'subject': '정보'}])).get_json()['id']
+    resp = client.post('/api/visits', json=make_payload('A', '2025-10-01', '과천고등학교', subjects=[{'subject': '진로'}]))
+    assert resp.get_json() == {'ok': True, 'id': rid, 'updated': True}
+    conn = sqlite3.connect(visits_app.DB_PATH)
+    assert conn.execute('SELECT subject FROM visit_subjects WHERE record_id = ?', (rid,)).fetchall() == [('진로',)]
+    conn.close()
+
+
+def test_connection_is_reused_and_tuned(visits_app):
+    conn = visits_app.get_db()
+    assert visits_app.get_db() is conn
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    visits_app.close_db_connections()
+    assert visits_app.get_db() is not conn
+
+
+def test_export_streams_in_chunks_and_gzips(visits_app, monkeypatch):
+    import gzip
+    client = visits_app.app.test_client()
+    for i in range(40):
+        client.post('/api/visits', json=make_payload('A', '2025-10-01', '학교%d' % i, subjects=[{'subject': '정보', 'conversation': '메모 ' * 50}]))
+    monkeypatch.setattr(visits_app, 'EXPORT_BATCH_ROWS', 7)
+    monkeypatch.setattr(visits_app, 'EXPORT_CHUNK_BYTES', 4096)
+
+    resp = client.get('/api/visits/export', buffered=False)
+    chunks = list(resp.response)
+    assert len(chunks) > 1 and all(len(c) >= 4096 for c in chunks[:-1])
+    plain = b''.join(chunks).decode('utf-8')
+    assert plain.count('\n') == 41
+
+    resp = client.get('/api/visits/export', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(resp.data).decode('utf-8') == plain
@@ -0,0 +1,68 @@
+def save(client, staff, date, school):
+    payload = {'staff': staff, 'visits': [{'visitDate': date, 'school': school, 'visitStart': '09:00', 'visitEnd': '10:00'}]}
+    assert client.post('/api/visits', json=payload).status_code == 201
+
+
+def walk(client, query):
+    seen = []
+    url = '/api/visits?' + query
+    while True:
+        body = client.get(url).get_json()
+        assert body['ok']
+        seen.extend(body['rows'])
+        if not body['next_cursor']:
+            return seen
+        url = '/api/visits?' + query + '&cursor=' + body['next_cursor']
+
+
+def test_cursor_walks_every_row_once(visits_app):
+    client = visits_app.app.test_client()
+    for i in range(23):
+        save(client, 'A' if i % 2 else 'B', '2025-10-%02d' % (i % 5 + 1), '학교%d' % i)
+
+    rows = walk(client, 'limit=5')
+    ids = [r['id'] for r in rows]
+    assert ids == sorted(ids, reverse=True) and len(ids) == 23
+
+    rows = walk(client, 'limit=4&sort=visit_date')
+    keys = [(r['visit_date'], r['id']) for r in rows]
+    assert keys == sorted(keys, reverse=True) and len(keys) == 23
+
+    rows = walk(client, 'limit=3&sort=visit_date&staff=A')
+    assert len(rows) == 11 and all(r['staff'] == 'A' for r in rows)
+
+
+def test_cursor_is_stable_under_inserts(visits_app):
+    client = visits_app.app.test_client()
+    for i in range(6):
+        save(client, 'A', '2025-10-01', '학교%d' % i)
+    first = client.get('/api/visits?limit=3').get_json()
+    save(client, 'A', '2025-10-02', '새학교')
+    second = client.get('/api/visits?limit=3&cursor=' + first['next_cursor']).get_json()
+    assert [r['id'] for r in second['rows']] == [3, 2, 1]
+
+
+def test_bad_cursor_rejected(visits_app):
+    client = visits_app.app.test_client()
+    assert client.get('/api/visits?cursor=%%%').status_code == 400
+    save(client, 'A', '2025-10-01', '학교')
+    cur = client.get('/api/visits?limit=1').get_json()['next_cursor']
+    assert client.get('/api/visits?sort=visit_date&cursor=' + cur).status_code == 400
+
+
+def test_rows_embed_stored_payload_unchanged(visits_app, monkeypatch):
+    client = visits_app.app.test_client()
+    save(client, 'A', '2025-10-01', '과천고')
+    conn = visits_app.get_db()
+    conn.execute("INSERT INTO visits (created_at, staff, visit_date, payload) VALUES ('x', 'B', '2025-10-02', '{broken')")
+    conn.execute("INSERT INTO visits (created_at, staff, visit_date, payload) VALUES ('x', 'C', '2025-10-03', '')")
+    for orjson in (visits_app.orjson, None):
+        monkeypatch.setattr(visits_app, 'orjson', orjson)
+        resp = client.get('/api/visits')
+        assert resp.mimetype == 'application/json' and '과천고'.encode('utf-8') in resp.data
+        body = resp.get_json()
+        assert body['ok'] and body['next_cursor'] is None
+        rows = {r['staff']: r for r in body['rows']}
+        assert rows['A']['payload']['visits'][0]['school'] == '과천고'
+        assert rows['B']['payload'] is None and rows['C']['payload'] is None
+        assert set(rows['A']) == {'id', 'created_at', 'staff', 'visit_date', 'payload'}
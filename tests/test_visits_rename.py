@@ -0,0 +1,75 @@
+def save(client, staff, visits):
+    resp = client.post('/api/visits', json={'staff': staff, 'visits': visits})
+    assert resp.status_code in (200, 201)
+    return resp.get_json()['id']
+
+
+def visit(date, school):
+    return {'visitDate': date, 'school': school, 'visitStart': '09:00', 'visitEnd': '10:00'}
+
+
+def payload(visits_app, rid):
+    import json
+    cur = visits_app.get_db().cursor()
+    cur.execute('SELECT payload, school FROM visits WHERE id = ?', (rid,))
+    text, school = cur.fetchone()
+    return json.loads(text), school
+
+
+def test_rename_mapping_dry_run_and_filters(visits_app):
+    client = visits_app.app.test_client()
+    a = save(client, 'A', [visit('2025-10-01', '과천고'), visit('2025-10-01', '안양중학교')])
+    b = save(client, 'B', [visit('2025-10-02', '안양중학교')])
+    c = save(client, 'A', [visit('2025-10-03', '과천고')])
+
+    resp = client.post('/api/visits/patch_school', json={'mapping': {'과천고': '과천고등학교', '안양중': '안양중앙중'}, 'dry_run': True})
+    body = resp.get_json()
+    assert body['dry_run'] and body['updated_ids'] == [a, b, c]
+    assert payload(visits_app, a)[0]['visits'][0]['school'] == '과천고'
+
+    body = client.post('/api/visits/patch_school', json={'old_school': '과천고', 'new_school': '과천고등학교',
+                                                          'staff': 'A', 'visit_date': '2025-10-03'}).get_json()
+    assert body['updated_ids'] == [c]
+
+    body = client.post('/api/visits/patch_school', json={'renames': [
+        {'old_school': '안양중학교', 'new_school': '안양중앙중학교'},
+        {'old_school': '과천고', 'new_school': '관악고', 'staff': 'A'},
+    ]}).get_json()
+    assert body['updated_ids'] == [a, b, c]
+    assert [r['count'] for r in body['renames']] == [2, 2]
+
+    data, school = payload(visits_app, a)
+    assert [v['school'] for v in data['visits']] == ['관악고', '안양중앙중학교']
+    assert school == '관악고'
+    assert payload(visits_app, c)[0]['visits'][0]['school'] == '관악고등학교'
+
+    # index rows follow the rename: upsert key, filter and search
+    assert save(client, 'B', [visit('2025-10-02', '안양중앙중학교')]) == b
+    rows = client.get('/api/visits?school=관악고&exact=1').get_json()['rows']
+    assert [r['id'] for r in rows] == [a]
+    assert {r['id'] for r in client.get('/api/visits?q=안양중앙').get_json()['rows']} == {a, b}
+
+
+def test_rename_chunks_and_bad_input(visits_app, monkeypatch):
+    client = visits_app.app.test_client()
+    monkeypatch.setattr(visits_app, 'RENAME_CHUNK_ROWS', 2)
+    ids = [save(client, 'S%d' % i, [visit('2025-10-01', '서울고')]) for i in range(5)]
+    body = client.post('/api/visits/patch_school', json={'old_school': '서울고', 'new_school': '서울고등학교'}).get_json()
+    assert body['updated_ids'] == ids
+    assert client.post('/api/visits/patch_school', json={'old_school': '서울고'}).status_code == 400
+    assert client.post('/api/visits/patch_school', json=['x']).status_code == 400
+
+
+def test_dry_run_does_not_wait_for_the_write_lock(visits_app):
+    import sqlite3
+    client = visits_app.app.test_client()
+    a = save(client, 'A', [visit('2025-10-01', '과천고')])
+    visits_app.get_db().execute('PRAGMA busy_timeout = 100')
+    writer = sqlite3.connect(visits_app.DB_PATH, isolation_level=None)
+    writer.execute('BEGIN IMMEDIATE')
+    try:
+        assert visits_app.rename_school('과천고', '과천고등학교', dry_run=True) == [a]
+    finally:
+        writer.rollback()
+        writer.close()
+        visits_app.get_db().execute('PRAGMA busy_timeout = %d' % visits_app.DB_BUSY_TIMEOUT_MS)
@@ -0,0 +1,42 @@
+def save(client, staff, visits):
+    resp = client.post('/api/visits', json={'staff': staff, 'visits': visits})
+    assert resp.status_code in (200, 201)
+    return resp.get_json()['id']
+
+
+def visit(date, school, start='09:00', end='10:00', subjects=('국어',), region='과천'):
+    return {'visitDate': date, 'school': school, 'visitStart': start, 'visitEnd': end, 'region': region,
+            'subjects': [{'subject': s} for s in subjects]}
+
+
+def snapshot(visits_app):
+    cur = visits_app.get_db().cursor()
+    a = cur.execute('SELECT * FROM rollup_visits WHERE visits != 0 ORDER BY 1, 2, 3, 4').fetchall()
+    b = cur.execute('SELECT * FROM rollup_subjects WHERE visits != 0 ORDER BY 1, 2, 3, 4').fetchall()
+    return a, b
+
+
+def test_rollups_follow_every_write_path(visits_app):
+    client = visits_app.app.test_client()
+    save(client, 'A', [visit('2025-10-01', '과천고', subjects=('국어', '수학')), visit('2025-10-01', '안양중', '10:30', '11:15')])
+    save(client, 'B', [visit('2025-10-02', '과천고', start='13:00', end='1pm')])
+    # same staff/date/school -> update replaces the old contribution
+    save(client, 'A', [visit('2025-10-01', '과천고', '09:00', '09:20', subjects=('영어',))])
+    client.post('/api/visits/bulk', json=[{'staff': 'C', 'visits': [visit('2025-10-03', '서울고')]}])
+    client.post('/api/visits/patch_school', json={'old_school': '과천고', 'new_school': '과천고등학교'})
+
+    live = snapshot(visits_app)
+    with visits_app.db_transaction() as conn:
+        visits_app.rebuild_rollups(conn.cursor())
+    assert snapshot(visits_app) == live
+    assert live[0] == [
+        ('2025-10-01', 'A', '과천고등학교', '과천', 1, 20),
+        ('2025-10-02', 'B', '과천고등학교', '과천', 1, 0),
+        ('2025-10-03', 'C', '서울고', '과천', 1, 60),
+    ]
+
+    body = client.get('/api/visits/rollups?group_by=school&from=2025-10-01&to=2025-10-02').get_json()
+    assert body['rows'] == [{'school': '과천고등학교', 'visits': 2, 'minutes': 20}]
+    body = client.get('/api/visits/rollups?group_by=subject&staff=A').get_json()
+    assert body['rows'] == [{'subject': '영어', 'visits': 1}]
+    assert client.get('/api/visits/rollups?group_by=payload').status_code == 400
@@ -0,0 +1,61 @@
+def save(client, staff, school, conversation, teacher='', publisher='', follow=''):
+    payload = {'staff': staff, 'visits': [{
+        'visitDate': '2025-10-01', 'school': school, 'visitStart': '09:00', 'visitEnd': '10:00',
+        'subjects': [{'subject': '정보', 'teacher': teacher, 'publisher': publisher,
+                      'conversation': conversation, 'followUp': follow}],
+    }]}
+    resp = client.post('/api/visits', json=payload)
+    assert resp.status_code in (200, 201)
+    return resp.get_json()['id']
+
+
+def ids(client, query):
+    body = client.get('/api/visits?' + query).get_json()
+    assert body['ok'], body
+    return [r['id'] for r in body['rows']]
+
+
+def test_memo_and_school_search(visits_app):
+    client = visits_app.app.test_client()
+    a = save(client, 'A', '과천고등학교', '연수 안내 요청함', teacher='김철수')
+    b = save(client, 'A', '안양중학교', '다음주 재방문 예정', publisher='비상')
+    c = save(client, 'B', '과천중학교', '관심 없음', follow='연수자료 발송')
+
+    assert set(ids(client, 'q=연수')) == {a, c}          # prefix match inside 연수자료
+    assert ids(client, 'q=재방문') == [b]
+    assert ids(client, 'q=김철수') == [a]
+    assert ids(client, 'q=비상') == [b]
+    assert set(ids(client, 'q=과천')) == {a, c}          # trigram school match
+    assert ids(client, 'q=천고등') == [a]
+    assert ids(client, 'q=연수&staff=B') == [c]
+    assert ids(client, 'q=없는말') == []
+
+    # school hits rank ahead of memo-only hits
+    d = save(client, 'C', '연수고등학교', '기타')
+    assert ids(client, 'q=연수')[0] == d
+
+
+def test_search_index_follows_updates(visits_app):
+    client = visits_app.app.test_client()
+    rid = save(client, 'A', '과천고등학교', '연수 안내')
+    assert save(client, 'A', '과천고등학교', '샘플북 전달') == rid
+    assert ids(client, 'q=연수') == []
+    assert ids(client, 'q=샘플북') == [rid]
+    resp = client.post('/api/visits/patch_school', json={'old_school': '과천고등학교', 'new_school': '관악고등학교'})
+    assert resp.get_json()['count'] == 1
+    assert ids(client, 'q=관악고') == [rid]
+    assert ids(client, 'q=과천고') == []
+
+
+def test_search_pages_and_export(visits_app):
+    client = visits_app.app.test_client()
+    for i in range(7):
+        save(client, 'A', '학교%d' % i, '연수 문의 %d' % i)
+    body = client.get('/api/visits?q=연수&limit=3').get_json()
+    seen = [r['id'] for r in body['rows']]
+    while body['next_cursor']:
+        body = client.get('/api/visits?q=연수&limit=3&cursor=' + body['next_cursor']).get_json()
+        seen += [r['id'] for r in body['rows']]
+    assert sorted(seen) == list(range(1, 8))
+    csv_text = client.get('/api/visits/export?q=학교3').data.decode('utf-8')
+    assert '학교3' in csv_text and '학교4' not in csv_text
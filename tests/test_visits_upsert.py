@@ -0,0 +1,62 @@
+import sqlite3
+import threading
+
+
+def day(staff, date, *schools):
+    return {'staff': staff, 'visits': [
+        {'visitDate': date, 'school': sc, 'visitStart': '09:00', 'visitEnd': '10:00'} for sc in schools
+    ]}
+
+
+def test_upsert_matches_any_school_of_the_day(visits_app):
+    client = visits_app.app.test_client()
+    rid = client.post('/api/visits', json=day('A', '2025-10-01', '과천고등학교', '과천중학교')).get_json()['id']
+    # same staff/day, overlapping school -> update in place
+    resp = client.post('/api/visits', json=day('A', '2025-10-01', ' 과천중학교 '))
+    assert resp.status_code == 200 and resp.get_json()['id'] == rid
+    # different day or staff -> new record
+    assert client.post('/api/visits', json=day('A', '2025-10-02', '과천중학교')).status_code == 201
+    assert client.post('/api/visits', json=day('B', '2025-10-01', '과천중학교')).status_code == 201
+    # 과천고등학교 was dropped by the update, so it no longer matches record rid
+    assert client.post('/api/visits', json=day('A', '2025-10-01', '과천고등학교')).status_code == 201
+
+    conn = sqlite3.connect(visits_app.DB_PATH)
+    keys = conn.execute('SELECT school FROM visit_schools WHERE record_id = ?', (rid,)).fetchall()
+    conn.close()
+    assert keys == [('과천중학교',)]
+
+
+def test_dropped_school_falls_back_to_older_owner(visits_app):
+    client = visits_app.app.test_client()
+    x = client.post('/api/visits', json=day('A', '2025-10-01', 'X')).get_json()['id']
+    y = client.post('/api/visits', json=day('A', '2025-10-01', 'Y')).get_json()['id']
+    assert x != y
+    # y takes X on as well, then drops it again: x still lists X and owns it again
+    assert client.post('/api/visits', json=day('A', '2025-10-01', 'X', 'Y')).get_json()['id'] == y
+    assert client.post('/api/visits', json=day('A', '2025-10-01', 'Y')).get_json()['id'] == y
+    resp = client.post('/api/visits', json=day('A', '2025-10-01', 'X'))
+    assert resp.status_code == 200 and resp.get_json()['id'] == x
+    conn = sqlite3.connect(visits_app.DB_PATH)
+    assert conn.execute('SELECT count(*) FROM visits').fetchone()[0] == 2
+    conn.close()
+
+
+def test_concurrent_autosaves_do_not_duplicate(visits_app):
+    app = visits_app.app
+    statuses = []
+    barrier = threading.Barrier(8)
+
+    def worker():
+        client = app.test_client()
+        barrier.wait()
+        statuses.append(client.post('/api/visits', json=day('A', '2025-10-01', '과천고등학교')).status_code)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(statuses) == [200] * 7 + [201]
+    conn = sqlite3.connect(visits_app.DB_PATH)
+    assert conn.execute('SELECT count(*) FROM visits').fetchone()[0] == 1
+    conn.close()